@@ -1,4 +1,3 @@
-import requests
 import os
 import json
 import base64
@@ -11,13 +10,29 @@ from matplotlib import pyplot as plt
 
 from dotenv import load_dotenv
 
+from encompass_http_client import request
+from encompass_pipeline_reader import read_pipeline_loans
+from encompass_token_manager import token_manager
+
 load_dotenv()
 
+# Loan limits above this are paged through a cursor instead of one request
+PIPELINE_PAGE_SIZE = int(os.getenv("ENCOMPASS_PIPELINE_PAGE_SIZE", "1000"))
+
 async def make_pipeline_api_call(encompass_access_token: str, api_url: str, filter_criteria_json: any, loan_limit: int) -> str:
     try:
         # Define the API endpoint
         url = f"{api_url}{loan_limit}"
 
+        # Large requests are read a page at a time through a pipeline cursor on the same endpoint
+        if loan_limit > PIPELINE_PAGE_SIZE:
+            return await read_pipeline_loans(filter_criteria_json, loan_limit, access_token=encompass_access_token,
+                                             url=api_url.split("?")[0])
+
+        # Fall back to the managed token when the caller has none
+        managed_token = not encompass_access_token
+        encompass_access_token = encompass_access_token or await token_manager.get_token()
+
         # Set your headers (replace 'YOUR_ACCESS_TOKEN' with your actual access token)
         headers = {
             "Authorization": f"Bearer {encompass_access_token}",
@@ -29,7 +44,14 @@ async def make_pipeline_api_call(encompass_access_token: str, api_url: str, filt
         # print(f"make_pipeline_api_call - payload: {filter_criteria_json}")
 
         # Make the POST request
-        response = requests.post(url, headers=headers, json=filter_criteria_json)
+        response = await request("POST", url, headers=headers, json=filter_criteria_json)
+
+        # An expired or stale managed token gets one retry with a fresh one; a 401 on the
+        # caller's own token goes back to the caller rather than running under the managed identity
+        if response.status_code == 401 and managed_token:
+            token_manager.invalidate(encompass_access_token)
+            headers["Authorization"] = f"Bearer {await token_manager.get_token()}"
+            response = await request("POST", url, headers=headers, json=filter_criteria_json)
 
         # Check the response
         if response.status_code == 200:
@@ -47,6 +69,7 @@ async def make_fieldnames_api_call(encompass_access_token: str) -> str:
         # Define the API endpoint
         url = "https://api.elliemae.com/encompass/v1/loanPipeline/fieldDefinitions"
         # encompass_access_token = os.getenv("ENCOMPASS_BEARER_TOKEN")
+        encompass_access_token = encompass_access_token or await token_manager.get_token()
 
         # Set your headers (replace 'YOUR_ACCESS_TOKEN' with your actual access token)
         headers = {
@@ -56,7 +79,7 @@ async def make_fieldnames_api_call(encompass_access_token: str) -> str:
         }
         print(headers)
         # Make the GET request
-        response = requests.get(url, headers=headers)
+        response = await request("GET", url, headers=headers)
 
         # Check the response
         if response.status_code == 200:
@@ -69,60 +92,16 @@ async def make_fieldnames_api_call(encompass_access_token: str) -> str:
         print(f"Error making encompass api call: {e}")
         return ""
     
-# @functools.lru_cache(maxsize=1)
-async def make_access_token_api_call() -> str:
-    try:
-        # return "0004RewpLsVXTxcpdQka6aCOXwYO"
-        # Define the API endpoint
-        # url = authurl
-        
-        # instance_id=os.getenv("ENCOMPASS_INSTANCE_ID")
-        # user_id=os.getenv("ENCOMPASS_USER_ID")
-        # user_pwd=os.getenv("ENCOMPASS_USER_PWD")
-        # api_cleint_id=os.getenv("ENCOMPASS_API_CLIENT_ID")
-        # api_cleint_secret=os.getenv("ENCOMPASS_API_CLIENT_SECRET")
-
-        url = "https://api.elliemae.com/oauth2/v1/token"
-        instance_id = os.getenv("ENCOMPASS_INSTANCE_ID")
-        client_id = os.getenv("ENCOMPASS_API_CLIENT_ID")
-        client_secret = os.getenv("ENCOMPASS_API_CLIENT_SECRET")
-        username = f"{os.getenv("ENCOMPASS_USER_ID")}@encompass:{instance_id}" #user_name@encompass:{{encompass_instance_id}}.
-        password = os.getenv("ENCOMPASS_USER_PWD")
-
-        # # Prepare basic authentication credentials
-        # auth_string = f"{username}:{password}"
-        # encoded_auth_string = base64.b64encode(auth_string).encode()
-
-        payload = {
-            "grant_type": "password",
-            "username": username,
-            "password": password,
-            "client_id": client_id,
-            "client_secret": client_secret,
-            "instance_id": instance_id
-        }
-
-        #print(payload)
+async def make_access_token_api_call(force_refresh: bool = False) -> str:
+    """
+    Encompass access token from the shared token manager.
 
-        # The 'auth' parameter in requests handles basic authentication
-        response = requests.post(url, data=payload)
-                
-        # Print the status code
-        print(response.status_code)
+    The token is cached until shortly before it expires, so most calls make no
+    request; concurrent callers share one token request.
+    """
+    try:
+        return await token_manager.get_token(force_refresh=force_refresh)
 
-        # Print the response content
-        # print(response.json().get('access_token'))
-        # Or, if you prefer to see the raw text response:
-        # print(response.text)
-        
-        # Check the response
-        if response.status_code == 200:
-            access_token = response.json().get('access_token')
-            print(f"Successfully retrieved access_token:: {access_token}")
-            return access_token
-        else:
-            print("Error:", response.status_code, response.text) 
-        
     except Exception as e:
         print(f"Error making encompass auth api call: {e}")
         return ""
@@ -0,0 +1,104 @@
+import re
+import hashlib
+
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+WORD_RE = re.compile(r"\w+")
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """64-bit hashes of every run of `size` consecutive normalized words."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(len(words) - size + 1)
+    }
+
+# Bit counts for all 64 positions are summed at once in one big integer, with each
+# bit position in its own 24-bit lane; _SPREAD maps a byte onto 8 such lanes
+LANE_BITS = 24
+_SPREAD = [sum((byte >> i & 1) << (i * LANE_BITS) for i in range(8)) for byte in range(256)]
+
+def simhash(features: Set[int]) -> int:
+    """64-bit SimHash of a set of hashed features."""
+    counts = 0
+    for feature in features:
+        for i, byte in enumerate(feature.to_bytes(8, "little")):
+            counts += _SPREAD[byte] << (8 * i * LANE_BITS)
+    lane = (1 << LANE_BITS) - 1
+    return sum(1 << bit for bit in range(64) if 2 * (counts >> (bit * LANE_BITS) & lane) > len(features))
+
+class NearDuplicateIndex:
+    """
+    Find near-duplicate chunks across a crawl with shingling and SimHash.
+
+    Each representative chunk is indexed by its 64-bit SimHash split into four
+    16-bit bands, so any fingerprint within max_distance (<= 3) bits shares at
+    least one band and is found as a candidate. Candidates are confirmed by the
+    Jaccard similarity of their word shingles. Chunks with fewer than min_words
+    words are never treated as duplicates.
+
+    Keys must be orderable, e.g. (url, chunk_number). A chunk is only ever marked
+    a duplicate of a lower key, the lowest matching one, so the representative
+    doesn't depend on which crawl worker got there first: a lower-keyed chunk
+    arriving later becomes a representative itself.
+    """
+
+    BANDS = 4
+
+    def __init__(self, max_distance: int = 3, min_jaccard: float = 0.85, min_words: int = 20):
+        self.max_distance = max_distance
+        self.min_jaccard = min_jaccard
+        self.min_words = min_words
+        self.clear()
+
+    def clear(self):
+        self._bands: Dict[Tuple[int, int], List[Hashable]] = {}
+        self._fingerprints: Dict[Hashable, int] = {}
+        self._shingles: Dict[Hashable, Set[int]] = {}
+        self.duplicates = 0
+
+    def _band_keys(self, fingerprint: int) -> List[Tuple[int, int]]:
+        width = 64 // self.BANDS
+        return [(band, fingerprint >> (band * width) & ((1 << width) - 1)) for band in range(self.BANDS)]
+
+    def find(self, text: str) -> Optional[Hashable]:
+        """Lowest key of the indexed chunks that text nearly duplicates, if any."""
+        if len(WORD_RE.findall(text)) < self.min_words:
+            return None
+        features = shingles(text)
+        fingerprint = simhash(features)
+        found = None
+        for band_key in self._band_keys(fingerprint):
+            for key in self._bands.get(band_key, ()):
+                if found is not None and key >= found:
+                    continue
+                if bin(fingerprint ^ self._fingerprints[key]).count("1") > self.max_distance:
+                    continue
+                other = self._shingles[key]
+                if len(features & other) / len(features | other) >= self.min_jaccard:
+                    found = key
+        return found
+
+    def add(self, key: Hashable, text: str):
+        """Index a chunk as a representative."""
+        if len(WORD_RE.findall(text)) < self.min_words or key in self._fingerprints:
+            return
+        features = shingles(text)
+        fingerprint = simhash(features)
+        self._fingerprints[key] = fingerprint
+        self._shingles[key] = features
+        for band_key in self._band_keys(fingerprint):
+            self._bands.setdefault(band_key, []).append(key)
+
+    def find_or_add(self, key: Hashable, text: str) -> Optional[Hashable]:
+        """Return the lower-keyed representative text duplicates, or index it as a new representative."""
+        if key in self._fingerprints:
+            return None  # Already a representative (e.g. a chunk retried after a failed embedding)
+        representative = self.find(text)
+        if representative is not None and representative < key:
+            self.duplicates += 1
+            return representative
+        self.add(key, text)
+        return None
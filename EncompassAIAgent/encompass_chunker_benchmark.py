@@ -0,0 +1,98 @@
+import time
+import random
+import argparse
+
+from typing import Callable, List
+
+from encompass_embeddings import estimate_tokens
+from encompass_markdown_chunker import chunk_markdown, chunk_text
+
+# Run: python encompass_chunker_benchmark.py --sizes 100000 1000000 --repeat 3
+
+WORDS = (
+    "loan pipeline cursor filter canonical field borrower amount request response "
+    "token header encompass api returns value match type greater than exact paginated "
+    "contract attribute instance client secret grant password status occupancy"
+).split()
+
+def make_sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))).capitalize() + "."
+
+def make_code_block(rng: random.Random) -> str:
+    lines = ["```json", "{"]
+    for i in range(rng.randint(5, 60)):
+        lines.append(f'    "Fields.{rng.randint(1, 5000)}": "{rng.choice(WORDS)}",')
+        if rng.random() < 0.1:
+            lines.append("")  # Blank lines inside a fence must not end the block
+    lines += ["}", "```"]
+    return "\n".join(lines)
+
+def make_table(rng: random.Random) -> str:
+    lines = ["| Field | Type | Description |", "| --- | --- | --- |"]
+    for _ in range(rng.randint(3, 40)):
+        lines.append(f"| Fields.{rng.randint(1, 5000)} | string | {make_sentence(rng)} |")
+    return "\n".join(lines)
+
+def make_document(size: int, seed: int = 0) -> str:
+    """Generate DevConnect-like markdown of roughly size characters."""
+    rng = random.Random(seed)
+    parts = ["# Encompass Developer Connect"]
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.08:
+            part = f"{'#' * rng.randint(2, 4)} {make_sentence(rng)[:-1]}"
+        elif roll < 0.25:
+            part = make_code_block(rng)
+        elif roll < 0.35:
+            part = make_table(rng)
+        else:
+            part = " ".join(make_sentence(rng) for _ in range(rng.randint(2, 10)))
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+def broken_blocks(chunks: List[str]) -> int:
+    """Count chunks that open or close a code fence without the other half, or cut a table."""
+    broken = 0
+    for chunk in chunks:
+        lines = chunk.splitlines()
+        fences = sum(1 for line in lines if line.strip().startswith("```"))
+        cut_table = bool(lines) and (lines[0].startswith("| ") and not lines[0].startswith("| Field"))
+        if fences % 2 or cut_table:
+            broken += 1
+    return broken
+
+def run(name: str, chunker: Callable[[str], List[str]], document: str, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = chunker(document)
+        timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    print(
+        f"  {name:<15} {len(document) / best / 1e6:7.2f} MB/s  chunks={len(chunks):5d}  "
+        f"avg_tokens={sum(tokens) / len(tokens):6.0f}  max_tokens={max(tokens):6d}  "
+        f"broken_blocks={broken_blocks(chunks)}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunk_text and chunk_markdown on synthetic docs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=500)
+    parser.add_argument("--overlap-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        document = make_document(size)
+        print(f"Document of {len(document):,} characters")
+        run("chunk_text", chunk_text, document, args.repeat)
+        run("chunk_markdown", lambda text: [
+            chunk.content for chunk in chunk_markdown(text, args.max_tokens, args.overlap_tokens)
+        ], document, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+from typing import Dict, List, Optional
+
+# Per-URL states, in the order a page moves through the ingest pipeline
+CRAWL_STATES = ("discovered", "crawled", "chunked", "embedded", "stored")
+
+class CrawlJournal:
+    """
+    Durable per-URL crawl state, stored in SQLite.
+
+    Every URL is recorded as it moves through discovered -> crawled -> chunked ->
+    embedded -> stored (or failed, with the error), so a restarted job can skip
+    finished pages and pick up the rest. A job can be split across worker
+    processes by URL hash: each process owns the URLs where
+    url_hash % shard_count == shard_index, and they can share one journal file.
+    """
+
+    def __init__(self, path: Optional[str] = None, shard_index: int = 0, shard_count: int = 1):
+        self.path = path or os.getenv("CRAWL_JOURNAL_PATH", "crawl_journal.sqlite3")
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            create table if not exists crawl_journal (
+                url text primary key,
+                url_hash integer not null,
+                state text not null,
+                chunk_count integer,
+                error text,
+                updated_at real not null
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def url_hash(url: str) -> int:
+        """Stable non-negative 63-bit hash of a URL, used for sharding."""
+        return int.from_bytes(hashlib.sha256(url.encode("utf-8")).digest()[:8], "big") >> 1
+
+    def in_shard(self, url: str) -> bool:
+        """True if this process owns the URL."""
+        return self.url_hash(url) % self.shard_count == self.shard_index
+
+    def reset(self):
+        """Forget this shard's URLs, so the next run starts from scratch."""
+        self._conn.execute(
+            "delete from crawl_journal where url_hash % ? = ?", (self.shard_count, self.shard_index)
+        )
+        self._conn.commit()
+
+    def mark(self, url: str, state: str, chunk_count: Optional[int] = None, error: Optional[str] = None):
+        """Record that a URL reached a state (or failed, when error is given)."""
+        self._conn.execute(
+            """
+            insert into crawl_journal (url, url_hash, state, chunk_count, error, updated_at)
+            values (?, ?, ?, ?, ?, ?)
+            on conflict (url) do update set
+                state = excluded.state,
+                chunk_count = coalesce(excluded.chunk_count, crawl_journal.chunk_count),
+                error = excluded.error,
+                updated_at = excluded.updated_at
+            """,
+            (url, self.url_hash(url), "failed" if error else state, chunk_count, error, time.time())
+        )
+        self._conn.commit()
+
+    def state(self, url: str) -> Optional[str]:
+        row = self._conn.execute("select state from crawl_journal where url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def is_done(self, url: str) -> bool:
+        return self.state(url) == "stored"
+
+    def unfinished_urls(self) -> List[str]:
+        """This shard's URLs that were recorded but never stored."""
+        rows = self._conn.execute(
+            "select url from crawl_journal where url_hash % ? = ? and state != 'stored' order by updated_at",
+            (self.shard_count, self.shard_index)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of this shard's URLs in each state."""
+        rows = self._conn.execute(
+            "select state, count(*) from crawl_journal where url_hash % ? = ? group by state",
+            (self.shard_count, self.shard_index)
+        ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,66 @@
+import asyncio
+
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+@dataclass
+class BrowserSession:
+    slot: int
+    generation: int = 0
+    navigations: int = 0
+
+    @property
+    def session_id(self) -> str:
+        return f"crawl-{self.slot}-{self.generation}"
+
+class BrowserSessionPool:
+    """
+    Pool of crawl4ai browser sessions, one page each, sized to the crawl concurrency.
+
+    crawl4ai keeps a page per session_id, so concurrent crawls that share a session
+    share a tab and serialize. Each crawl borrows its own session here, pages are
+    reused across URLs, and a session is killed and replaced with a fresh page after
+    max_navigations URLs (or after an error) to bound browser memory.
+    """
+
+    def __init__(self, crawler, size: int, max_navigations: int = 50):
+        self.crawler = crawler
+        self.max_navigations = max_navigations
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for slot in range(size):
+            self._idle.put_nowait(BrowserSession(slot))
+        self.recycled = 0
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[str]:
+        """Borrow a session id for one navigation."""
+        session = await self._idle.get()
+        failed = False
+        try:
+            yield session.session_id
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            session.navigations += 1
+            if failed or session.navigations >= self.max_navigations:
+                await self._recycle(session)
+            self._idle.put_nowait(session)
+
+    async def _recycle(self, session: BrowserSession):
+        """Close the session's page so the next crawl in this slot opens a fresh one."""
+        try:
+            await self.crawler.crawler_strategy.kill_session(session.session_id)
+        except Exception as e:
+            print(f"Error closing browser session {session.session_id}: {e}")
+        session.generation += 1
+        session.navigations = 0
+        self.recycled += 1
+
+    async def aclose(self):
+        """Close every idle session's page."""
+        while not self._idle.empty():
+            session = self._idle.get_nowait()
+            if session.navigations:
+                await self._recycle(session)
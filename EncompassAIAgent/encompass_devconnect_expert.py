@@ -11,6 +11,15 @@ import re
 from matplotlib import pyplot as plt
 
 from encompass_api_calls import make_pipeline_api_call, make_access_token_api_call
+from encompass_embedding_cache import EmbeddingCache
+from encompass_vector_index import LocalVectorIndex
+from encompass_bm25_index import reciprocal_rank_fusion
+from encompass_result_packer import pack_chunks
+from encompass_supabase_async import execute, run_blocking
+from encompass_page_catalog import PageCatalog
+from encompass_page_cache import PageContentCache, select_page_content
+from encompass_pipeline_cache import PipelineQueryCache
+from encompass_loan_replica import LoanReplica
 
 #from crewai import Agent, Task, Crew
 
@@ -18,19 +27,40 @@ from pydantic_ai import Agent, ModelRetry, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from openai import AsyncOpenAI
 from supabase import Client
-from typing import List
+from typing import Any, Dict, List, Optional
 
 load_dotenv()
 
 llm = os.getenv('OPENAI_LLM_MODEL')
 model = OpenAIModel(llm)
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Must match the dimensions the crawler stored (OPENAI_EMBEDDING_DIMENSIONS, default full size)
+EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "0")) or None
+
+# On-disk cache shared with the crawler, so repeated questions skip the embeddings call
+embedding_cache = EmbeddingCache()
+
+# Listings of the documentation page catalog, shared by every agent run in this process
+page_catalog = PageCatalog()
+
+# Assembled documentation pages, keyed by URL and content version
+page_content_cache = PageContentCache()
+
+# Loan pipeline responses, keyed by the normalized filter, fields and limit
+pipeline_cache = PipelineQueryCache()
+
+# Local mirror of the loan pipeline (ENCOMPASS_LOAN_REPLICA_PATH), kept current by encompass_loan_replica.py
+loan_replica = LoanReplica.from_env()
+
 # logfire.configure(send_to_logfire='if-token-present')
 
 @dataclass
 class PydanticAIDeps:
     supabase: Client
     openai_client: AsyncOpenAI
+    vector_index: Optional[LocalVectorIndex] = None  # Searched instead of match_site_pages when set
 
 # system_prompt = """
 # You are an expert at Encompass Developer Connect API Catalog - a REST API documentation that you have access to all the documentation to,
@@ -75,7 +105,7 @@ class PydanticAIDeps:
 system_prompt = """
 You are an expert at Encompass Developer Connect API Catalog, and expert in retrieving loan data by making API calls to get loan pipeline.
 
-If user requests for loans based on match criteria, first identify appropriate api url based on documentation, second retrieve bearer access_token, third build the filter json payload based on documentation, then finally make API call and respond with JSON data.
+If user requests for loans based on match criteria, first identify appropriate api url based on documentation, second build the filter json payload based on documentation, then finally make API call and respond with JSON data. The bearer access_token is added to the API call automatically, so don't retrieve one first.
 
 Get user_friendly_name for each canonical_name field and replace the canonical_name with user_friendly_name in the API call json response.
 
@@ -151,42 +181,46 @@ encompass_devconnect_expert = Agent(
     retries=2
 )
 
-async def get_embedding(text: str, openai_client: AsyncOpenAI) -> List[float]:
-    """Get embedding vector from OpenAI."""
+async def get_embeddings(texts: List[str], openai_client: AsyncOpenAI) -> List[List[float]]:
+    """Get embedding vectors for several texts in one OpenAI request, using the on-disk cache when possible."""
     try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
+        vectors = await embedding_cache.aget_many(EMBEDDING_MODEL, texts, EMBEDDING_DIMENSIONS)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            response = await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=missing,
+                **({"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {})
+            )
+            fetched = {missing[item.index]: item.embedding for item in response.data}
+            await embedding_cache.aput_many(EMBEDDING_MODEL, list(fetched.items()), EMBEDDING_DIMENSIONS)
+            vectors = [vector if vector is not None else fetched[text] for text, vector in zip(texts, vectors)]
+        return vectors
     except Exception as e:
         print(f"Error getting embedding: {e}")
-        return [0] * 1536  # Return zero vector on error
+        raise  # A zero vector would rank chunks meaninglessly, so let the tool report the error
 
-@encompass_devconnect_expert.tool
-async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_query: str) -> str:
-    """
-    Retrieve relevant documentation chunks based on the query with RAG.
-    
-    Args:
-        ctx: The context including the Supabase client and OpenAI client
-        user_query: The user's question or query
-        
-    Returns:
-        A formatted string containing the top 5 most relevant documentation chunks
-    """
-    try:
-        # Get the embedding for the query
-        query_embedding = await get_embedding(user_query, ctx.deps.openai_client)
-        
+async def get_embedding(text: str, openai_client: AsyncOpenAI) -> List[float]:
+    """Get embedding vector from OpenAI, using the on-disk cache when possible."""
+    return (await get_embeddings([text], openai_client))[0]
+
+async def match_documentation(deps: PydanticAIDeps, user_queries: List[str], query_embeddings: List[List[float]], match_count: int = 5) -> List[List[Dict[str, Any]]]:
+    """Top documentation chunks for each query, from the local index when enabled, otherwise match_site_pages."""
+    if deps.vector_index is not None:
+        # Search the in-process copy of site_pages, by vector and keyword, instead of calling the RPC
+        await run_blocking(deps.vector_index.refresh_if_stale, deps.supabase)
+        if len(deps.vector_index):
+            return deps.vector_index.hybrid_search_many(user_queries, query_embeddings, match_count, filter={'source': 'encompass_devconnect_docs'})
+
+    async def match_site_pages(query_embedding: List[float]) -> List[Dict[str, Any]]:
         # Query Supabase for relevant documents
-        result = ctx.deps.supabase.rpc(
+        result = await execute(deps.supabase.rpc(
             # This is a custom RPC function to match documents
             # Ensure this function is defined in your Supabase database
             'match_site_pages', 
             {
                 'query_embedding': query_embedding,
-                'match_count': 5,
+                'match_count': match_count,
                 # Filter by source 
                 # This assumes you have a metadata field in your site_pages table
                 # that contains the source information 
@@ -195,107 +229,168 @@ async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_
                 'filter': {'source': 'encompass_devconnect_docs'} 
                 
             }
-        ).execute()
-        
-        if not result.data:
-            return "No relevant documentation found."
-            
-        # Format the results
-        formatted_chunks = []
-        for doc in result.data:
-            chunk_text = f"""
+        ))
+        return result.data
+
+    # One RPC per query, all in flight at once
+    return await asyncio.gather(*[match_site_pages(embedding) for embedding in query_embeddings])
+
+def format_documentation_chunks(matches: List[Dict[str, Any]]) -> str:
+    """Format retrieved chunks for the model."""
+    formatted_chunks = []
+    for doc in matches:
+        chunk_text = f"""
 # {doc['title']}
 
 {doc['content']}
 """
-            formatted_chunks.append(chunk_text)
+        formatted_chunks.append(chunk_text)
+        
+    # Join all chunks with a separator
+    return "\n\n---\n\n".join(formatted_chunks)
+
+@encompass_devconnect_expert.tool
+async def retrieve_relevant_documentation(ctx: RunContext[PydanticAIDeps], user_query: str) -> str:
+    """
+    Retrieve relevant documentation chunks based on the query with RAG.
+    
+    Args:
+        ctx: The context including the Supabase client and OpenAI client
+        user_query: The user's question or query
+        
+    Returns:
+        A formatted string containing the most relevant parts of the top 5 documentation chunks, within RETRIEVAL_TOKEN_BUDGET tokens
+    """
+    try:
+        # Get the embedding for the query
+        query_embedding = await get_embedding(user_query, ctx.deps.openai_client)
+        
+        matches = (await match_documentation(ctx.deps, [user_query], [query_embedding]))[0]
+        
+        if not matches:
+            return "No relevant documentation found."
             
-        # Join all chunks with a separator
-        return "\n\n---\n\n".join(formatted_chunks)
+        return format_documentation_chunks(pack_chunks([user_query], matches))
         
     except Exception as e:
         print(f"Error retrieving documentation: {e}")
         return f"Error retrieving documentation: {str(e)}"
 
 @encompass_devconnect_expert.tool
-async def list_documentation_pages(ctx: RunContext[PydanticAIDeps]) -> List[str]:
+async def retrieve_relevant_documentation_batch(ctx: RunContext[PydanticAIDeps], user_queries: List[str]) -> str:
     """
-    Retrieve a list of all available Pydantic AI documentation pages.
+    Retrieve documentation for several related queries at once, e.g. an endpoint URL, its filter syntax and field names.
+    Prefer this over calling retrieve_relevant_documentation several times in a row.
     
+    Args:
+        ctx: The context including the Supabase client and OpenAI client
+        user_queries: The questions or queries to look up (at most 8)
+        
     Returns:
-        List[str]: List of unique URLs for all documentation pages
+        A formatted string containing the top 5 chunks for every query, merged, de-duplicated and trimmed to RETRIEVAL_TOKEN_BUDGET tokens
     """
     try:
-        # Query Supabase for unique URLs where source is pydantic_ai_docs
-        result = ctx.deps.supabase.from_('site_pages') \
-            .select('url') \
-            .eq('metadata->>source', 'encompass_devconnect_docs') \
-            .execute()
+        user_queries = user_queries[:8]
+        
+        # Embed every query in a single request
+        query_embeddings = await get_embeddings(user_queries, ctx.deps.openai_client)
+        
+        # Merge the per-query rankings, keeping each chunk once
+        rankings = await match_documentation(ctx.deps, user_queries, query_embeddings)
+        chunks = {(doc['url'], doc['chunk_number']): doc for matches in rankings for doc in matches}
+        fused = reciprocal_rank_fusion([[(doc['url'], doc['chunk_number']) for doc in matches] for matches in rankings])
+        matches = [chunks[key] for key, _ in fused]
         
-        if not result.data:
-            return []
+        if not matches:
+            return "No relevant documentation found."
             
-        # Extract unique URLs
-        urls = sorted(set(doc['url'] for doc in result.data))
-        return urls
+        return format_documentation_chunks(pack_chunks(user_queries, matches))
+        
+    except Exception as e:
+        print(f"Error retrieving documentation: {e}")
+        return f"Error retrieving documentation: {str(e)}"
+
+@encompass_devconnect_expert.tool
+async def list_documentation_pages(ctx: RunContext[PydanticAIDeps], path_prefix: str = "", offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """
+    Retrieve a page of the available Encompass Developer Connect documentation pages.
+    
+    Args:
+        path_prefix: Only list pages whose URL path starts with this, e.g. /developer-connect/reference/
+        offset: Number of pages to skip, to page through the list
+        limit: Maximum number of pages to return (at most 500)
+        
+    Returns:
+        Dict[str, Any]: Total number of matching pages, and the url, title and chunk count of each page
+    """
+    try:
+        # Read the page catalog maintained by the crawler, cached until the next re-crawl
+        return await run_blocking(page_catalog.list_pages, ctx.deps.supabase, path_prefix, offset, min(limit, 500))
         
     except Exception as e:
         print(f"Error retrieving documentation pages: {e}")
-        return []
+        return {"total": 0, "offset": offset, "pages": []}
 
 @encompass_devconnect_expert.tool
-async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str) -> str:
+async def get_page_content(ctx: RunContext[PydanticAIDeps], url: str, section: str = "", offset: int = 0, limit: Optional[int] = None) -> str:
     """
-    Retrieve the full content of a specific documentation page by combining all its chunks.
+    Retrieve the content of a specific documentation page by combining all its chunks.
     
     Args:
         ctx: The context including the Supabase client
         url: The URL of the page to retrieve
+        section: Only return the section under the first heading containing this text
+        offset: Character offset to start from, to continue a truncated result
+        limit: Maximum number of characters to return (the whole page or section when omitted)
         
     Returns:
-        str: The complete page content with all chunks combined in order
+        str: The page content with all chunks combined in order, or the requested part of it
     """
     try:
-        # Query Supabase for all chunks of this URL, ordered by chunk_number
-        result = ctx.deps.supabase.from_('site_pages') \
-            .select('title, content, chunk_number') \
-            .eq('url', url) \
-            .eq('metadata->>source', 'encompass_devconnect_docs') \
-            .order('chunk_number') \
-            .execute()
+        # Assembled pages are cached until the page is re-crawled
+        page = await run_blocking(page_content_cache.get_page, ctx.deps.supabase, url)
         
-        if not result.data:
+        if page is None:
             return f"No content found for URL: {url}"
             
-        # Format the page with its title and all chunks
-        page_title = result.data[0]['title'].split(' - ')[0]  # Get the main title
-        formatted_content = [f"# {page_title}\n"]
-        
-        # Add each chunk's content
-        for chunk in result.data:
-            formatted_content.append(chunk['content'])
-            
-        # Join everything together
-        return "\n\n".join(formatted_content)
+        return select_page_content(page, section, offset, limit)
         
     except Exception as e:
         print(f"Error retrieving page content: {e}")
         return f"Error retrieving page content: {str(e)}"
     
 @encompass_devconnect_expert.tool
-async def get_encompass_loans(ctx: RunContext[PydanticAIDeps], pipeline_api_url: str, access_token: str, filter_criteria_json: str, loan_limit: int) -> str:
+async def get_encompass_loans(ctx: RunContext[PydanticAIDeps], pipeline_api_url: str, filter_criteria_json: str, loan_limit: int, access_token: str = "") -> str:
     """
     Determine the appropriate http request and return json response
     
     Args:
         ctx: The context including the Supabase client
+        access_token: Optional; a cached access token is used when empty
         
     Returns:
         str: http request response in JSON format
     """
     try:
         # access_token = await get_encompass_access_token(ctx)
-        responsejson = await make_pipeline_api_call(access_token, pipeline_api_url, json.loads(filter_criteria_json), loan_limit)
+        filter_criteria = json.loads(filter_criteria_json)
+
+        # Answered locally when the loan replica is enabled, fresh and holds every field the query uses
+        # (the replica and the cache only hold what the managed token can see)
+        if loan_replica is not None and not access_token:
+            # SQLite is blocking, so it runs off the event loop like the Supabase calls
+            loans = await asyncio.to_thread(loan_replica.query, filter_criteria, loan_limit)
+            if loans is not None:
+                return loans
+
+        # Repeated queries are answered from the cache until it expires or loans change
+        responsejson = await pipeline_cache.get_or_fetch(
+            filter_criteria,
+            loan_limit,
+            lambda: make_pipeline_api_call(access_token, pipeline_api_url, filter_criteria, loan_limit),
+            api_url=pipeline_api_url,
+            access_token=access_token
+        )
         return responsejson
     
     except Exception as e:
@@ -1,14 +1,17 @@
 import os
 import sys
 import json
+import zlib
 import asyncio
+import argparse
+import httpx
 import requests
 import supabase
 import crawl4ai
 import anthropic
 
 from xml.etree import ElementTree
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterable, AsyncIterable, AsyncIterator, Set, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import urlparse
@@ -18,6 +21,15 @@ from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig, CacheMode
 from openai import AsyncOpenAI
 from supabase import create_client, Client
 
+from encompass_embeddings import EmbeddingBatcher, EmbeddingError
+from encompass_embedding_cache import EmbeddingCache
+from encompass_sitepages_store import SitePagesWriter, content_hash, duplicate_dependents, fetch_chunk_hashes, fetch_stored_urls, is_page_unchanged
+from encompass_ingest_pipeline import StagedPipeline
+from encompass_markdown_chunker import MarkdownChunk, chunk_markdown
+from encompass_crawl_sessions import BrowserSessionPool
+from encompass_crawl_journal import CrawlJournal
+from encompass_chunk_dedup import NearDuplicateIndex
+
 #from anthropic import AsyncAnthropic, AsyncOpenAI, AsyncOpenAIEmbeddings, AsyncOpenAIChatCompletions
 
 load_dotenv()
@@ -32,6 +44,28 @@ supabase: Client = create_client(
     os.getenv("SUPABASE_SERVICE_KEY")
 )
 
+DOCS_SOURCE = "encompass_devconnect_docs"
+
+# On-disk cache shared with the agent, so unchanged chunks are never re-embedded
+embedding_cache = EmbeddingCache()
+
+# Shortened embeddings; site_pages.embedding must be declared with the same size
+EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "0")) or None
+
+# Shared across all documents so chunks are embedded in batched requests
+embedding_batcher = EmbeddingBatcher(
+    openai_client,
+    model=os.getenv("OPENAI_TEXT_EMBEDDING_MODEL"),
+    cache=embedding_cache,
+    dimensions=EMBEDDING_DIMENSIONS
+)
+
+# Buffers processed chunks and upserts them into site_pages in batches
+site_pages_writer = SitePagesWriter(supabase)
+
+# Chunks seen so far in this crawl, so boilerplate repeated across pages is embedded once
+chunk_dedup_index = NearDuplicateIndex()
+
 @dataclass
 class ProcessedChunk:
     url: str
@@ -40,52 +74,8 @@ class ProcessedChunk:
     summary: str
     content: str
     metadata: Dict[str, Any]
-    embedding: List[float]
-
-def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
-    """Split text into chunks, respecting code blocks and paragraphs."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        # Calculate end position
-        end = start + chunk_size
-
-        # If we're at the end of the text, just take what's left
-        if end >= text_length:
-            chunks.append(text[start:].strip())
-            break
-
-        # Try to find a code block boundary first (```)
-        chunk = text[start:end]
-        code_block = chunk.rfind('```')
-        if code_block != -1 and code_block > chunk_size * 0.3:
-            end = start + code_block
-
-        # If no code block, try to break at a paragraph
-        elif '\n\n' in chunk:
-            # Find the last paragraph break
-            last_break = chunk.rfind('\n\n')
-            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_break
-
-        # If no paragraph break, try to break at a sentence
-        elif '. ' in chunk:
-            # Find the last sentence break
-            last_period = chunk.rfind('. ')
-            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
-                end = start + last_period + 1
-
-        # Extract chunk and clean it up
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-
-        # Move start position for next chunk
-        start = max(start + 1, end)
-
-    return chunks
+    embedding: Optional[List[float]]  # None keeps the embedding already stored for this chunk
+    needs_embedding: bool = True
 
 # async def get_title_and_summary(chunk: str, url: str) -> Dict[str, str]:
 #     """Extract title and summary using GPT-4."""
@@ -112,21 +102,13 @@ def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
 #         return {"title": "Error processing title", "summary": "Error processing summary"}
 
 async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
-    try:
-        response = await openai_client.embeddings.create(
-            #await openai_client.embeddings.create(
-            #await anthropic_openai_client.embeddings.create(
-            model=os.getenv("OPENAI_TEXT_EMBEDDING_MODEL"),
-            input=text
-        )
-        return response.data[0].embedding
-    except Exception as e:
-        print(f"Error getting embedding: {e}")
-        return [0] * 1536  # Return zero vector on error
+    """Get embedding vector from OpenAI, batched with other pending chunks."""
+    return await embedding_batcher.embed(text)
+
+def process_chunk(markdown_chunk: MarkdownChunk, chunk_number: int, url: str, page_hash: str, stored_hash: Optional[str] = None) -> ProcessedChunk:
+    """Process a single chunk of text; it only needs a new embedding if its content changed."""
+    chunk = markdown_chunk.content
 
-async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChunk:
-    """Process a single chunk of text."""
     # Get title and summary
     #extracted = await get_title_and_summary(chunk, url)
     extracted = {
@@ -134,15 +116,20 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
         "summary": f"This is a processed chunk {chunk_number} from the document at {url}."
     }
     
-    # Get embedding
-    embedding = await get_embedding(chunk)
+    # The stored embedding is kept when the stored chunk already has this exact content
+    chunk_hash = content_hash(chunk)
     
     # Create metadata
     metadata = {
-        "source": "encompass_devconnect_docs",
+        "source": DOCS_SOURCE,
         "chunk_size": len(chunk),
+        "token_count": markdown_chunk.token_count,
+        "overlap_chars": markdown_chunk.overlap_chars,
+        "heading_path": markdown_chunk.heading_path,
         "crawled_at": datetime.now(timezone.utc).isoformat(),
-        "url_path": urlparse(url).path
+        "url_path": urlparse(url).path,
+        "content_hash": chunk_hash,
+        "page_hash": page_hash
     }
     
     return ProcessedChunk(
@@ -152,11 +139,37 @@ async def process_chunk(chunk: str, chunk_number: int, url: str) -> ProcessedChu
         summary=extracted['summary'],
         content=chunk,  # Store the original chunk content
         metadata=metadata,
-        embedding=embedding
+        embedding=None,
+        needs_embedding=chunk_hash != stored_hash
     )
 
+def dedupe_chunk(chunk: ProcessedChunk):
+    """
+    Mark a changed chunk that nearly duplicates a lower-numbered chunk of this crawl.
+
+    The duplicate is stored without an embedding and with metadata.duplicate_of
+    pointing at the representative chunk (the lowest matching url and chunk number), so it costs no embedding call and never
+    shows up twice in similarity search. Unchanged chunks keep their stored
+    embedding and are only indexed as representatives.
+    """
+    key = (chunk.url, chunk.chunk_number)
+    if not chunk.needs_embedding:
+        chunk_dedup_index.add(key, chunk.content)
+        return
+    representative = chunk_dedup_index.find_or_add(key, chunk.content)
+    if representative is not None:
+        chunk.needs_embedding = False
+        chunk.metadata["duplicate_of"] = {"url": representative[0], "chunk_number": representative[1]}
+
+async def embed_chunk(chunk: ProcessedChunk) -> ProcessedChunk:
+    """Get the embedding for a chunk whose content changed, unless it is a near-duplicate."""
+    dedupe_chunk(chunk)
+    if chunk.needs_embedding:
+        chunk.embedding = await get_embedding(chunk.content)
+    return chunk
+
 async def insert_chunk(chunk: ProcessedChunk):
-    """Insert a processed chunk into Supabase."""
+    """Queue a processed chunk for a batched upsert into Supabase."""
     try:
         data = {
             "url": chunk.url,
@@ -164,13 +177,14 @@ async def insert_chunk(chunk: ProcessedChunk):
             "title": chunk.title,
             "summary": chunk.summary,
             "content": chunk.content,
-            "metadata": chunk.metadata,
-            "embedding": chunk.embedding
+            "metadata": chunk.metadata
         }
+        if chunk.embedding is not None:
+            data["embedding"] = chunk.embedding
+        elif "duplicate_of" in chunk.metadata:
+            data["embedding"] = None  # Clear any embedding stored before it became a duplicate
         
-        result = supabase.table("site_pages").insert(data).execute()
-        print(f"Inserted chunk {chunk.chunk_number} for {chunk.url}")
-        return result
+        await site_pages_writer.add(data)
 
         # print(f"Inserted chunk {data} for {chunk.url}")
         # return None
@@ -178,27 +192,126 @@ async def insert_chunk(chunk: ProcessedChunk):
         print(f"Error inserting chunk: {e}")
         return None
 
-async def process_and_store_document(url: str, markdown: str):
-    """Process a document and store its chunks in parallel."""
-    # Split into chunks
-    chunks = chunk_text(markdown)
+async def chunk_document(url: str, markdown: str, stored_chunks: Optional[Dict[int, Dict[str, str]]] = None, force: bool = False) -> List[ProcessedChunk]:
+    """
+    Split a document into processed chunks.
+
+    stored_chunks holds the hashes already stored for this url (incremental mode);
+    an unchanged page yields no chunks, and only changed chunks need re-embedding.
+    A page with a chunk missing from a previous run (see is_page_unchanged) is
+    processed again; force processes an unchanged page, so its stored duplicates
+    are re-checked.
+    """
+    page_hash = content_hash(markdown)
+
+    # Split into token-bounded chunks along the markdown structure
+    chunks = chunk_markdown(markdown)
+
+    if stored_chunks and not force and is_page_unchanged(stored_chunks, page_hash, len(chunks)):
+        print(f"Unchanged, skipping: {url}")
+        return []
+
+    stored_chunks = stored_chunks or {}
+
+    # Remove chunks left over from a longer previous version of the page
+    if not stored_chunks or max(stored_chunks) >= len(chunks):
+        await site_pages_writer.delete_orphans(url, len(chunks))
+
+    # Keep the page catalog in step, so listing pages never scans site_pages
+    headings = chunks[0].heading_path if chunks else []
+    await site_pages_writer.add_page({
+        "url": url,
+        "url_path": urlparse(url).path,
+        "source": DOCS_SOURCE,
+        "title": headings[0] if headings else urlparse(url).path,
+        "chunk_count": len(chunks),
+        "last_crawled": datetime.now(timezone.utc).isoformat(),
+        "content_hash": page_hash
+    })
+
+    processed = []
+    for i, chunk in enumerate(chunks):
+        stored = stored_chunks.get(i, {})
+        # A stored duplicate has no embedding, so it is re-checked as if it changed
+        stored_hash = None if stored.get("duplicate_of") else stored.get("content_hash")
+        processed.append(process_chunk(chunk, i, url, page_hash, stored_hash))
+    return processed
+
+async def process_and_store_document(url: str, markdown: str, stored_chunks: Optional[Dict[int, Dict[str, str]]] = None) -> int:
+    """Process a single document and store its chunks, outside the crawl pipeline; returns the number of chunks queued."""
+    chunks = await chunk_document(url, markdown, stored_chunks)
     
-    # Process chunks in parallel
-    tasks = [
-        process_chunk(chunk, i, url) 
-        for i, chunk in enumerate(chunks)
-    ]
-    processed_chunks = await asyncio.gather(*tasks)
+    # Embed chunks in parallel
+    processed_chunks = await asyncio.gather(*[embed_chunk(chunk) for chunk in chunks], return_exceptions=True)
     
-    # Store chunks in parallel
-    insert_tasks = [
-        insert_chunk(chunk) 
-        for chunk in processed_chunks
-    ]
-    await asyncio.gather(*insert_tasks)
-
-async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
-    """Crawl multiple URLs in parallel with a concurrency limit."""
+    # Queue chunks for the bulk writer, never storing a chunk without a real embedding
+    queued = 0
+    for chunk, processed in zip(chunks, processed_chunks):
+        if isinstance(processed, Exception):
+            print(f"Error embedding chunk {chunk.chunk_number} for {url}, not stored: {processed}")
+            continue
+        await insert_chunk(processed)
+        queued += 1
+    return queued
+
+async def iterate_urls(urls: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    """Iterate a plain list of URLs or an async stream of discovered URLs."""
+    if hasattr(urls, "__aiter__"):
+        async for url in urls:
+            yield url
+    else:
+        for url in urls:
+            yield url
+
+async def crawl_parallel(
+    urls: Union[Iterable[str], AsyncIterable[str]],
+    max_concurrent: int = 5,
+    incremental: bool = False,
+    chunk_workers: int = 2,
+    embed_workers: int = 64,
+    store_workers: int = 2,
+    queue_size: int = 100,
+    max_navigations_per_session: int = 50,
+    journal: Optional[CrawlJournal] = None,
+    resume: bool = False
+) -> Set[str]:
+    """
+    Crawl multiple URLs and ingest them through a staged pipeline.
+
+    Pages flow crawl -> chunk -> embed -> store through bounded queues, each
+    stage with its own worker count (max_concurrent is the number of crawl
+    workers, each rendering in its own pooled browser page). A slow stage fills
+    its queue and throttles the stages before it.
+    Embed workers share the embedding batcher, so their count also caps the
+    size of each embeddings request.
+
+    With incremental=True, stored content hashes are loaded first so unchanged
+    pages and chunks are not re-embedded or re-written. Unchanged pages with
+    near-duplicate chunks pointing at a page that changed are processed again at
+    the end, so those chunks never keep pointing at content that is gone.
+
+    With a journal, only URLs in the journal's shard are crawled and each URL's
+    progress is recorded. resume=True re-queues unfinished URLs from the journal
+    and skips stored ones; otherwise the shard's journal is reset first.
+
+    Returns every URL seen in this run (including ones skipped as stored or
+    outside the shard), for prune_missing_pages.
+    """
+    if journal is not None and not resume:
+        journal.reset()
+
+    chunk_dedup_index.clear()
+
+    stored_hashes = {}
+    if incremental:
+        stored_hashes = await asyncio.to_thread(fetch_chunk_hashes, supabase, DOCS_SOURCE)
+        print(f"Loaded stored hashes for {len(stored_hashes)} pages")
+
+    # Pages with stored duplicates of each page's chunks, and the pages changed in this run
+    dependent_pages = duplicate_dependents(stored_hashes)
+    changed_pages = set()
+    recheck_pages = set()
+
     browser_config = BrowserConfig(
         headless=True,
         verbose=False,
@@ -230,54 +343,303 @@ async def crawl_parallel(urls: List[str], max_concurrent: int = 5):
     crawler = AsyncWebCrawler(config=browser_config)
     await crawler.start()
 
-    try:
-        # Create a semaphore to limit concurrency
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        async def process_url(url: str):
-            async with semaphore:
+    # One browser page per crawl worker, recycled every few navigations
+    session_pool = BrowserSessionPool(crawler, size=max_concurrent, max_navigations=max_navigations_per_session)
+
+    # Chunks of each page still waiting to be embedded / written, for the journal
+    pending_embeds: Dict[str, int] = {}
+    pending_stores: Dict[str, int] = {}
+
+    # Chunks whose embedding failed after all retries, tried once more at the end
+    retry_chunks: List[ProcessedChunk] = []
+
+    def record(url: str, state: str, **kwargs):
+        if journal is not None:
+            journal.mark(url, state, **kwargs)
+
+    def record_written(rows: List[Dict[str, Any]]):
+        for row in rows:
+            url = row["url"]
+            if url in pending_stores:
+                pending_stores[url] -= 1
+                if pending_stores[url] == 0:
+                    del pending_stores[url]
+                    record(url, "stored")
+
+    site_pages_writer.on_written = record_written
+
+    # Every URL of this run, whether or not this worker crawls it
+    seen = set()
+
+    async def journal_urls() -> AsyncIterator[str]:
+        """URLs to crawl: unfinished ones from a previous run first, then new ones in this shard."""
+        if journal is not None and resume:
+            for url in journal.unfinished_urls():
+                seen.add(url)
+                yield url
+        async for url in iterate_urls(urls):
+            if url in seen:
+                continue
+            seen.add(url)
+            if journal is not None:
+                if not journal.in_shard(url) or (resume and journal.is_done(url)):
+                    continue
+                journal.mark(url, "discovered")
+            yield url
+
+    async def crawl_url(url: str):
+        try:
+            async with session_pool.session() as session_id:
                 result = await crawler.arun(
                     url=url,
-                    config=crawl_config,
-                    session_id="session1"
+                    config=crawl_config.clone(session_id=session_id)
                 )
-                if result.success:
-                    print(f"Successfully crawled: {url}")
-                    await process_and_store_document(url, result.markdown.raw_markdown)
-                else:
-                    print(f"Failed: {url} - Error: {result.error_message}")
-        
-        # Process all URLs in parallel with limited concurrency
-        await asyncio.gather(*[process_url(url) for url in urls])
+        except Exception as e:
+            record(url, "crawled", error=str(e))
+            raise
+        if result.success:
+            print(f"Successfully crawled: {url}")
+            record(url, "crawled")
+            return [(url, result.markdown.raw_markdown)]
+        print(f"Failed: {url} - Error: {result.error_message}")
+        record(url, "crawled", error=result.error_message or "crawl failed")
+        return []
+
+    async def chunk_page(page):
+        url, markdown = page
+        chunks = await chunk_document(url, markdown, stored_hashes.get(url), force=url in recheck_pages)
+        if chunks:
+            changed_pages.add(url)
+            pending_embeds[url] = len(chunks)
+            pending_stores[url] = len(chunks)
+            record(url, "chunked", chunk_count=len(chunks))
+        else:
+            record(url, "stored", chunk_count=0)  # Unchanged page, nothing to write
+        return chunks
+
+    def record_embedded(chunk: ProcessedChunk):
+        pending_embeds[chunk.url] -= 1
+        if pending_embeds[chunk.url] == 0:
+            del pending_embeds[chunk.url]
+            record(chunk.url, "embedded")
+
+    async def embed_page_chunk(chunk: ProcessedChunk):
+        try:
+            chunk = await embed_chunk(chunk)
+        except EmbeddingError as e:
+            print(f"Parking chunk {chunk.chunk_number} for {chunk.url} for retry: {e}")
+            retry_chunks.append(chunk)
+            return []
+        record_embedded(chunk)
+        return [chunk]
+
+    async def store_chunk(chunk: ProcessedChunk):
+        await insert_chunk(chunk)
+
+    pipeline = StagedPipeline(queue_size=queue_size)
+    pipeline.add_stage("crawl", crawl_url, workers=max_concurrent)
+    pipeline.add_stage("chunk", chunk_page, workers=chunk_workers)
+    pipeline.add_stage("embed", embed_page_chunk, workers=embed_workers)
+    pipeline.add_stage("store", store_chunk, workers=store_workers)
+
+    try:
+        # Start crawling URLs as they are discovered
+        await pipeline.run(journal_urls())
+        if not pipeline.source_count:
+            print("No URLs found to crawl")
+
+        # Unchanged pages whose duplicates point at a changed page were skipped; check them again
+        recheck_pages.update(url for changed in changed_pages for url in dependent_pages.get(changed, ()))
+        recheck_pages -= changed_pages
+        if recheck_pages:
+            print(f"Re-checking {len(recheck_pages)} pages with near-duplicates of changed pages")
+            await pipeline.run(iterate_urls(sorted(recheck_pages)))
+
+        # One more attempt for parked chunks now that the rate limits have had time to recover
+        if retry_chunks:
+            print(f"Retrying {len(retry_chunks)} chunks that failed to embed")
+            results = await asyncio.gather(*[embed_chunk(chunk) for chunk in retry_chunks], return_exceptions=True)
+            for chunk, result in zip(retry_chunks, results):
+                if isinstance(result, Exception):
+                    print(f"Giving up on chunk {chunk.chunk_number} for {chunk.url}: {result}")
+                    record(chunk.url, "embedded", error=f"chunk {chunk.chunk_number}: {result}")
+                    continue
+                record_embedded(result)
+                await insert_chunk(result)
     finally:
+        await session_pool.aclose()
         await crawler.close()
+        await embedding_batcher.aclose()
+        await site_pages_writer.aclose()
+        print(f"Embedded {embedding_batcher.text_count} chunks in {embedding_batcher.request_count} requests "
+              f"({embedding_batcher.cache_hits} cache hits, {embedding_batcher.retry_count} retries, {embedding_batcher.failed_count} failed)")
+        print(f"Upserted {site_pages_writer.rows_written} chunks in {site_pages_writer.batches_written} batches "
+              f"({chunk_dedup_index.duplicates} near-duplicates stored without embeddings)")
+        site_pages_writer.on_written = None
+        if journal is not None:
+            print(f"Crawl journal: {journal.counts()}")
+    return seen
+
+async def prune_missing_pages(seen_urls: Set[str]) -> int:
+    """
+    Delete stored pages that are no longer on the site.
 
-def get_encompass_devconnect_docs_urls() -> List[str]:
-     """Get URLs from Encompass Devconnect Reference docs sitemap."""
-     return [
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline",
-        "https://developer.icemortgagetechnology.com/developer-connect/docs/authentication"
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/get-canonical-names"
-
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/v3-create-cursor",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/v3-contract-attributes",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline-with-pagination-1",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/get-canonical-names",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/v1-pipeline-contracts",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/v1-get-canonical-fields",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/create-cursor",
-        # "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline-with-pagination",
-    ]
+    Only call this after a complete, unsharded run with no sitemap errors:
+    every stored url not in seen_urls loses its chunks and catalog row.
+    """
+    if not seen_urls:
+        print("No URLs seen, not pruning stored pages")
+        return 0
+    stored_urls = await asyncio.to_thread(fetch_stored_urls, supabase, DOCS_SOURCE)
+    missing = stored_urls - seen_urls
+    if not missing:
+        return 0
+    print(f"Deleting {len(missing)} pages no longer in the sitemap")
+    return await site_pages_writer.delete_pages(missing)
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+async def discover_sitemap_urls(sitemap_urls: List[str], path_prefixes: Tuple[str, ...], max_concurrent: int = 4,
+                                errors: Optional[List[str]] = None) -> AsyncIterator[str]:
+    """
+    Yield page URLs from sitemaps as soon as they are parsed.
+
+    Sitemap index files are followed recursively, fetched concurrently and parsed
+    incrementally while streaming, so the crawler can start on the first URLs
+    before discovery has finished. Only URLs whose path starts with one of
+    path_prefixes are yielded. Sitemaps that can't be read are appended to
+    errors, when given.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_concurrent)
+    seen_sitemaps = set()
+    seen_urls = set()
+    tasks = set()
+    active = 0
+
+    async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
+
+        def schedule(sitemap_url: str):
+            nonlocal active
+            if sitemap_url in seen_sitemaps:
+                return
+            seen_sitemaps.add(sitemap_url)
+            active += 1
+            task = asyncio.create_task(fetch_sitemap(sitemap_url))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        def handle_element(element):
+            tag = element.tag.replace(SITEMAP_NS, "")
+            if tag not in ("sitemap", "url"):
+                return
+            loc = element.findtext(f"{SITEMAP_NS}loc") or element.findtext("loc")
+            element.clear()  # Drop parsed entries so large sitemaps use flat memory
+            if not loc:
+                return
+            loc = loc.strip()
+            if tag == "sitemap":
+                schedule(loc)
+            elif loc not in seen_urls and urlparse(loc).path.startswith(path_prefixes):
+                seen_urls.add(loc)
+                queue.put_nowait(loc)
+
+        async def fetch_sitemap(sitemap_url: str):
+            nonlocal active
+            try:
+                async with semaphore:
+                    parser = ElementTree.XMLPullParser(events=("end",))
+                    async with client.stream("GET", sitemap_url) as response:
+                        response.raise_for_status()
+                        # .xml.gz sitemaps are usually served compressed without a content-encoding header
+                        decompressor = None
+                        if sitemap_url.endswith(".gz") and "gzip" not in response.headers.get("content-encoding", ""):
+                            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        async for data in response.aiter_bytes():
+                            parser.feed(decompressor.decompress(data) if decompressor else data)
+                            for _, element in parser.read_events():
+                                handle_element(element)
+                    parser.close()
+                    for _, element in parser.read_events():
+                        handle_element(element)
+                print(f"Read sitemap: {sitemap_url}")
+            except Exception as e:
+                print(f"Error reading sitemap {sitemap_url}: {e}")
+                if errors is not None:
+                    errors.append(sitemap_url)
+            finally:
+                active -= 1
+                if active == 0:
+                    queue.put_nowait(None)  # All sitemaps done
+
+        try:
+            for sitemap_url in sitemap_urls:
+                schedule(sitemap_url)
+            if not active:
+                return
+            while True:
+                url = await queue.get()
+                if url is None:
+                    break
+                yield url
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+# Pipeline API pages crawled first, ahead of everything discovered from the sitemap
+ENCOMPASS_DEVCONNECT_SEED_URLS = [
+    "https://developer.icemortgagetechnology.com/developer-connect/docs/authentication",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/get-canonical-names",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/v3-create-cursor",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/v3-contract-attributes",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline-with-pagination-1",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/v1-pipeline-contracts",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/v1-get-canonical-fields",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/create-cursor",
+    "https://developer.icemortgagetechnology.com/developer-connect/reference/view-pipeline-with-pagination",
+]
+
+async def get_encompass_devconnect_docs_urls(
+    path_prefixes: Tuple[str, ...] = ("/developer-connect/reference/", "/developer-connect/docs/"),
+    errors: Optional[List[str]] = None
+) -> AsyncIterator[str]:
+    """Get URLs from Encompass Devconnect Reference docs sitemap, yielded as they are discovered."""
+    sitemap_url = os.getenv("ENCOMPASS_DEVCONNECT_SITEMAP_URL", "https://developer.icemortgagetechnology.com/sitemap.xml")
+
+    seen = set()
+    for url in ENCOMPASS_DEVCONNECT_SEED_URLS:
+        seen.add(url)
+        yield url
+
+    async for url in discover_sitemap_urls([sitemap_url], path_prefixes, errors=errors):
+        if url not in seen:
+            seen.add(url)
+            yield url
 
 async def main():
-    # Get URLs from Ecncompass Devconnect docs
-    urls = get_encompass_devconnect_docs_urls()
-    if not urls:
-        print("No URLs found to crawl")
-        return
-    
-    print(f"Found {len(urls)} URLs to crawl")
-    await crawl_parallel(urls)
+    parser = argparse.ArgumentParser(description="Crawl Encompass Devconnect docs into Supabase site_pages")
+    parser.add_argument("--resume", action="store_true", help="continue the previous job from the crawl journal")
+    parser.add_argument("--shard", default="0/1", help="this worker's shard as INDEX/COUNT, e.g. 2/4")
+    parser.add_argument("--journal", default=None, help="crawl journal path (default: CRAWL_JOURNAL_PATH or crawl_journal.sqlite3)")
+    parser.add_argument("--full", action="store_true", help="re-embed and re-write every page, even unchanged ones")
+    args = parser.parse_args()
+
+    shard_index, shard_count = (int(part) for part in args.shard.split("/"))
+    journal = CrawlJournal(args.journal, shard_index=shard_index, shard_count=shard_count)
+
+    # Get URLs from Ecncompass Devconnect docs; crawling starts while the sitemap is still being read
+    sitemap_errors: List[str] = []
+    urls = get_encompass_devconnect_docs_urls(errors=sitemap_errors)
+
+    # Only re-embed and re-write pages whose content changed since the last run
+    seen_urls = await crawl_parallel(urls, incremental=not args.full, journal=journal, resume=args.resume)
+
+    # Pages that dropped out of the sitemap are only known when this run saw the whole site
+    if shard_count == 1 and not sitemap_errors:
+        await prune_missing_pages(seen_urls)
+    elif sitemap_errors:
+        print(f"Not pruning stored pages: {len(sitemap_errors)} sitemaps could not be read")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,118 @@
+import os
+import time
+import argparse
+
+from typing import Dict, List
+
+import numpy as np
+
+from dotenv import load_dotenv
+
+from encompass_vector_index import VECTOR_DTYPES, parse_embedding, quantize, score_vectors
+
+# Run: python encompass_embedding_eval.py --dimensions 1536 1024 512 256 --dtypes float32 float16 int8
+#      python encompass_embedding_eval.py --synthetic 20000   (no Supabase; generated vectors)
+#
+# Compares shortened and quantized copies of the stored embeddings against the
+# full-precision vectors: recall@k is the share of the full-precision top k that
+# each setting also returns. Shortening keeps the first d components and
+# renormalizes, which is how text-embedding-3 vectors are shortened by the API's
+# dimensions parameter, so a setting can be chosen before re-crawling with
+# OPENAI_EMBEDDING_DIMENSIONS.
+
+def load_site_pages(source: str, page_size: int = 1000) -> np.ndarray:
+    """All stored embeddings for a source, as a float32 matrix."""
+    from supabase import create_client
+
+    load_dotenv()
+    supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    vectors = []
+    start = 0
+    while True:
+        result = supabase.from_('site_pages') \
+            .select('embedding') \
+            .eq('metadata->>source', source) \
+            .not_.is_('embedding', 'null') \
+            .order('id') \
+            .range(start, start + page_size - 1) \
+            .execute()
+        vectors.extend(parse_embedding(row['embedding']) for row in result.data)
+        if len(result.data) < page_size:
+            return np.asarray(vectors, dtype=np.float32)
+        start += page_size
+
+def make_vectors(count: int, dimensions: int = 1536, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """Clustered vectors whose variance falls off along the dimensions, like shortenable embeddings."""
+    rng = np.random.default_rng(seed)
+    falloff = (1.0 / np.sqrt(1 + np.arange(dimensions) / 64)).astype(np.float32)
+    centers = rng.standard_normal((clusters, dimensions), dtype=np.float32) * falloff
+    noise = rng.standard_normal((count, dimensions), dtype=np.float32) * falloff * 0.6
+    return centers[rng.integers(0, clusters, count)] + noise
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def top_k(scores: np.ndarray, query_rows: np.ndarray, k: int) -> List[set]:
+    """Top k rows for each query column, never counting the query's own row."""
+    scores = scores.copy()
+    scores[query_rows, np.arange(len(query_rows))] = -np.inf
+    top = np.argpartition(-scores, k, axis=0)[:k]
+    return [set(column) for column in top.T]
+
+def evaluate(vectors: np.ndarray, dimensions: List[int], dtypes: List[str], ks: List[int], queries: int, seed: int) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), size=min(queries, len(vectors)), replace=False)
+
+    full = normalize(vectors)
+    truth_scores = full @ full[query_rows].T
+    truth = {k: top_k(truth_scores, query_rows, k) for k in ks}
+
+    results = []
+    for d in dimensions:
+        if d > vectors.shape[1]:
+            continue
+        shortened = normalize(vectors[:, :d])
+        query_vectors = shortened[query_rows]
+        for dtype in dtypes:
+            stored, scales = quantize(shortened, dtype)
+            started = time.perf_counter()
+            scores = score_vectors(stored, scales, query_vectors)
+            elapsed = time.perf_counter() - started
+            result = {
+                "dimensions": d,
+                "dtype": dtype,
+                "bytes_per_vector": stored.itemsize * d + (4 if dtype == "int8" else 0),
+                "ms_per_query": elapsed / len(query_rows) * 1000,
+            }
+            for k in ks:
+                found = top_k(scores, query_rows, k)
+                result[f"recall@{k}"] = float(np.mean([len(a & b) / k for a, b in zip(found, truth[k])]))
+            results.append(result)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="recall@k of shortened and quantized embeddings against full precision")
+    parser.add_argument("--source", default="encompass_devconnect_docs")
+    parser.add_argument("--synthetic", type=int, default=0, help="evaluate this many generated vectors instead of site_pages")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1536, 1024, 512, 256])
+    parser.add_argument("--dtypes", nargs="+", default=list(VECTOR_DTYPES), choices=VECTOR_DTYPES)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10])
+    parser.add_argument("--queries", type=int, default=200, help="stored vectors used as queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.synthetic, seed=args.seed) if args.synthetic else load_site_pages(args.source)
+    print(f"Evaluating {len(vectors)} vectors of {vectors.shape[1]} dimensions with {min(args.queries, len(vectors))} queries")
+
+    results = evaluate(vectors, args.dimensions, args.dtypes, args.k, args.queries, args.seed)
+    recall_columns = [f"recall@{k}" for k in args.k]
+    print(f"{'dimensions':>10} {'dtype':>8} {'bytes/vec':>9} {'ms/query':>8} " + " ".join(f"{c:>9}" for c in recall_columns))
+    for r in results:
+        print(
+            f"{r['dimensions']:>10} {r['dtype']:>8} {r['bytes_per_vector']:>9} {r['ms_per_query']:>8.3f} "
+            + " ".join(f"{r[c]:>9.3f}" for c in recall_columns)
+        )
+
+if __name__ == "__main__":
+    main()
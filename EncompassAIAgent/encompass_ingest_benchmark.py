@@ -0,0 +1,290 @@
+import os
+import sys
+import html
+import time
+import random
+import asyncio
+import sqlite3
+import hashlib
+import argparse
+import functools
+import tempfile
+import threading
+
+from types import SimpleNamespace
+from typing import Dict, List
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# Run: python encompass_ingest_benchmark.py --pages 200 --concurrency 1 2 4 8
+#      python encompass_ingest_benchmark.py --skip-crawl   (no browser: chunk -> embed -> store only)
+
+# The crawler creates its clients at import time; nothing here talks to them
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "offline-benchmark")
+os.environ.setdefault("OPENAI_TEXT_EMBEDDING_MODEL", "fake-embedding")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "encompass_benchmark_cache.sqlite3"))
+
+import encompass_devconnect_sitepages_crawl as crawl
+
+from encompass_chunker_benchmark import make_document
+from encompass_crawl_journal import CrawlJournal
+from encompass_embeddings import EmbeddingBatcher
+from encompass_markdown_chunker import split_markdown_blocks
+from encompass_sitepages_store import SitePagesWriter
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Peak RSS fallback when psutil is missing; Unix only
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def markdown_to_html(markdown: str) -> str:
+    """Render the synthetic markdown as a DevConnect-like HTML page."""
+    body = []
+    for block in split_markdown_blocks(markdown):
+        if block.kind == "heading":
+            body.append(f"<h{block.level}>{html.escape(block.heading_path[-1])}</h{block.level}>")
+        elif block.kind == "code":
+            code = "\n".join(block.text.splitlines()[1:-1])
+            body.append(f"<pre><code>{html.escape(code)}</code></pre>")
+        elif block.kind == "table":
+            rows = [line.strip().strip("|").split("|") for line in block.text.splitlines() if "---" not in line]
+            cells = "".join("<tr>" + "".join(f"<td>{html.escape(c.strip())}</td>" for c in row) + "</tr>" for row in rows)
+            body.append(f"<table>{cells}</table>")
+        else:
+            body.append(f"<p>{html.escape(block.text)}</p>")
+    nav = "<nav>" + "".join(f"<a href='/developer-connect/reference/page-{i}/'>Page {i}</a>" for i in range(20)) + "</nav>"
+    return f"<html><head><title>DevConnect</title></head><body>{nav}<main>{''.join(body)}</main></body></html>"
+
+def build_site(directory: str, pages: int, page_size: int) -> List[str]:
+    """Write the fixture pages and a sitemap, returning the page paths."""
+    paths = []
+    for i in range(pages):
+        path = f"/developer-connect/reference/page-{i}/"
+        os.makedirs(os.path.join(directory, path.lstrip("/")), exist_ok=True)
+        with open(os.path.join(directory, path.lstrip("/"), "index.html"), "w") as file:
+            file.write(markdown_to_html(make_document(page_size, seed=i)))
+        paths.append(path)
+    return paths
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def serve(directory: str) -> ThreadingHTTPServer:
+    """Serve the fixture site from a background thread on a free local port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fake_vector(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector derived from the text."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+class FakeEmbeddings:
+    """Local stand-in for openai_client.embeddings with a fixed per-request latency."""
+
+    def __init__(self, dimensions: int, latency: float):
+        self.dimensions = dimensions
+        self.latency = latency
+
+    async def create(self, model: str, input: List[str]):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=fake_vector(text, self.dimensions))
+            for i, text in enumerate(input)
+        ])
+
+class SqliteSitePagesWriter(SitePagesWriter):
+    """SitePagesWriter that upserts into an in-memory SQLite table instead of Supabase."""
+
+    def __init__(self, **kwargs):
+        super().__init__(supabase_client=None, **kwargs)
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.execute("""
+            create table site_pages (
+                url text, chunk_number integer, title text, summary text,
+                content text, metadata text, embedding text,
+                primary key (url, chunk_number)
+            )
+        """)
+
+    def _upsert_rows(self, rows):
+        with self._db_lock:
+            self._db.executemany(
+                """
+                insert into site_pages values (?, ?, ?, ?, ?, ?, ?)
+                on conflict (url, chunk_number) do update set
+                    content = excluded.content, metadata = excluded.metadata,
+                    embedding = coalesce(excluded.embedding, site_pages.embedding)
+                """,
+                [(r["url"], r["chunk_number"], r["title"], r["summary"], r["content"],
+                  str(r["metadata"]), str(r["embedding"]) if "embedding" in r else None) for r in rows]
+            )
+
+    def _upsert_pages(self, pages):
+        pass
+
+    async def delete_orphans(self, url: str, chunk_count: int):
+        with self._db_lock:
+            self._db.execute("delete from site_pages where url = ? and chunk_number >= ?", (url, chunk_count))
+
+class TimingJournal(CrawlJournal):
+    """CrawlJournal that also keeps when each URL was discovered and stored."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.discovered_at: Dict[str, float] = {}
+        self.stored_at: Dict[str, float] = {}
+
+    def mark(self, url, state, chunk_count=None, error=None):
+        super().mark(url, state, chunk_count=chunk_count, error=error)
+        if state == "discovered":
+            self.discovered_at[url] = time.perf_counter()
+        elif state == "stored" and not error:
+            self.stored_at[url] = time.perf_counter()
+
+class PeakMemory:
+    """Sample RSS of this process and its children (the browser) while a run is in progress."""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak = 0
+
+    def sample(self) -> int:
+        if psutil is None:
+            if resource is None:
+                return 0
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+            return peak if sys.platform == "darwin" else peak * 1024
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    async def run(self):
+        while True:
+            self.peak = max(self.peak, self.sample())
+            await asyncio.sleep(self.interval)
+
+def install_fakes(args) -> SqliteSitePagesWriter:
+    """Point the crawler's embedder and writer at the local stand-ins."""
+    crawl.embedding_batcher = EmbeddingBatcher(
+        SimpleNamespace(embeddings=FakeEmbeddings(args.dimensions, args.embed_latency)),
+        model="fake-embedding"
+    )
+    crawl.site_pages_writer = SqliteSitePagesWriter()
+    return crawl.site_pages_writer
+
+async def run_once(args, concurrency: int, base_url: str, paths: List[str]) -> Dict[str, float]:
+    writer = install_fakes(args)
+    memory = PeakMemory()
+    sampler = asyncio.create_task(memory.run())
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = TimingJournal(os.path.join(directory, "journal.sqlite3"))
+        started = time.perf_counter()
+
+        if args.skip_crawl:
+            semaphore = asyncio.Semaphore(concurrency)
+            # A page counts as stored once the writer has flushed all its chunks, as in crawl_parallel
+            expected: Dict[str, int] = {}
+            written: Dict[str, int] = {}
+
+            def record_stored(url: str):
+                if url in expected and written.get(url, 0) >= expected[url]:
+                    del expected[url]
+                    journal.mark(url, "stored")
+
+            def record_written(rows):
+                for row in rows:
+                    written[row["url"]] = written.get(row["url"], 0) + 1
+                    record_stored(row["url"])
+
+            writer.on_written = record_written
+
+            async def ingest(path: str):
+                url = f"{base_url}{path}"
+                async with semaphore:
+                    journal.mark(url, "discovered")
+                    expected[url] = await crawl.process_and_store_document(url, make_document(args.page_size, seed=paths.index(path)))
+                    record_stored(url)
+
+            await asyncio.gather(*[ingest(path) for path in paths])
+            await crawl.embedding_batcher.aclose()
+            await writer.aclose()
+        else:
+            # Discover the fixture site through its sitemap, like a real crawl
+            urls = crawl.discover_sitemap_urls([f"{base_url}/sitemap.xml"], ("/developer-connect/",))
+            await crawl.crawl_parallel(urls, max_concurrent=concurrency, journal=journal)
+
+        elapsed = time.perf_counter() - started
+        latencies = sorted(
+            journal.stored_at[url] - journal.discovered_at[url]
+            for url in journal.stored_at if url in journal.discovered_at
+        )
+        journal.close()
+
+    sampler.cancel()
+    memory.peak = max(memory.peak, memory.sample())
+    return {
+        "concurrency": concurrency,
+        "pages": len(latencies),
+        "pages_per_sec": len(latencies) / elapsed,
+        "chunks_per_sec": writer.rows_written / elapsed,
+        "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan"),
+        "peak_rss_mb": memory.peak / 1e6,
+        "embed_requests": crawl.embedding_batcher.request_count,
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline ingest throughput benchmark")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=20_000, help="approximate markdown characters per page")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="simulated seconds per embeddings request")
+    parser.add_argument("--dimensions", type=int, default=256, help="dimensions of the fake embeddings")
+    parser.add_argument("--skip-crawl", action="store_true", help="feed generated markdown straight to process_and_store_document")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as site:
+        paths = build_site(site, args.pages, args.page_size)
+        server = serve(site)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        with open(os.path.join(site, "sitemap.xml"), "w") as file:
+            file.write('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">')
+            file.write("".join(f"<url><loc>{base_url}{path}</loc></url>" for path in paths))
+            file.write("</urlset>")
+
+        results = []
+        try:
+            for concurrency in args.concurrency:
+                results.append(await run_once(args, concurrency, base_url, paths))
+        finally:
+            server.shutdown()
+
+    print()
+    print(f"{'concurrency':>11} {'pages':>6} {'pages/s':>8} {'chunks/s':>9} {'p95 page s':>10} {'peak RSS MB':>11} {'embed reqs':>10}")
+    for r in results:
+        print(
+            f"{r['concurrency']:>11} {r['pages']:>6} {r['pages_per_sec']:>8.2f} {r['chunks_per_sec']:>9.1f} "
+            f"{r['p95_latency']:>10.2f} {r['peak_rss_mb']:>11.0f} {r['embed_requests']:>10}"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, Optional
+from dataclasses import dataclass, field
+
+# A stage handler takes one item and returns the items to pass to the next stage
+StageHandler = Callable[[Any], Awaitable[Optional[Iterable[Any]]]]
+
+@dataclass
+class PipelineStage:
+    name: str
+    handler: StageHandler
+    workers: int
+    queue: Optional[asyncio.Queue] = None
+
+    # Per-stage counters used for throughput reporting
+    processed: int = 0
+    emitted: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0  # Time spent waiting for room in the next stage's queue
+
+@dataclass
+class StagedPipeline:
+    """
+    Run items through async stages connected by bounded queues.
+
+    Every stage has its own worker count. Because the queues are bounded, a slow
+    stage fills its input queue and upstream workers block on put(), throttling
+    the whole pipeline to the rate of its slowest stage. Per-stage throughput,
+    queue depth and time spent blocked are printed every report_interval seconds.
+    """
+    queue_size: int = 100
+    report_interval: float = 10.0
+    stages: List[PipelineStage] = field(default_factory=list)
+    source_count: int = 0
+    started_at: float = 0.0
+
+    def add_stage(self, name: str, handler: StageHandler, workers: int = 1):
+        """Append a stage; its outputs feed the next stage added."""
+        self.stages.append(PipelineStage(name=name, handler=handler, workers=workers))
+
+    async def run(self, source: AsyncIterable[Any]):
+        """Feed every item from source through all stages and wait until they drain."""
+        for stage in self.stages:
+            stage.queue = asyncio.Queue(maxsize=self.queue_size)
+
+        self.started_at = time.perf_counter()
+        tasks = [
+            asyncio.create_task(self._worker(index))
+            for index, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+        reporter = asyncio.create_task(self._report_loop())
+
+        try:
+            async for item in source:
+                await self.stages[0].queue.put(item)
+                self.source_count += 1
+
+            # A stage's items are only marked done after their outputs are queued
+            # downstream, so joining the queues in order drains the pipeline
+            for stage in self.stages:
+                await stage.queue.join()
+        finally:
+            for task in tasks + [reporter]:
+                task.cancel()
+            await asyncio.gather(*tasks, reporter, return_exceptions=True)
+            print(self.report())
+
+    async def _worker(self, index: int):
+        """Take items from a stage's queue, run the handler and pass outputs on."""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = await stage.queue.get()
+            started = time.perf_counter()
+            try:
+                outputs = await stage.handler(item)
+                stage.processed += 1
+                if next_stage is not None and outputs:
+                    for output in outputs:
+                        put_started = time.perf_counter()
+                        await next_stage.queue.put(output)
+                        stage.blocked_seconds += time.perf_counter() - put_started
+                        stage.emitted += 1
+            except Exception as e:
+                stage.failed += 1
+                print(f"Error in {stage.name} stage: {e}")
+            finally:
+                stage.busy_seconds += time.perf_counter() - started
+                stage.queue.task_done()
+
+    async def _report_loop(self):
+        """Print pipeline stats periodically while it runs."""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.report())
+
+    def report(self) -> str:
+        """Format throughput, queue depth and utilisation for every stage."""
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        lines = [f"Pipeline after {elapsed:.1f}s: {self.source_count} items in"]
+        for stage in self.stages:
+            worker_seconds = elapsed * stage.workers
+            depth = stage.queue.qsize() if stage.queue is not None else 0
+            lines.append(
+                f"  {stage.name:<8} processed={stage.processed} ({stage.processed / elapsed:.1f}/s) "
+                f"emitted={stage.emitted} failed={stage.failed} queue={depth}/{self.queue_size} "
+                f"busy={100 * stage.busy_seconds / worker_seconds:.0f}% "
+                f"blocked={100 * stage.blocked_seconds / worker_seconds:.0f}%"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,320 @@
+import re
+
+from typing import List, Tuple
+from dataclasses import dataclass
+
+from encompass_embeddings import estimate_tokens
+
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+TABLE_DELIMITER_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+
+@dataclass
+class MarkdownBlock:
+    kind: str  # "heading", "code", "table" or "paragraph"
+    text: str
+    heading_path: Tuple[str, ...]
+    tokens: int
+    level: int = 0  # Heading level, for heading blocks
+
+@dataclass
+class MarkdownChunk:
+    content: str
+    heading_path: List[str]
+    token_count: int
+    overlap_chars: int = 0  # Leading characters of content repeated from the previous chunk
+
+def split_markdown_blocks(text: str) -> List[MarkdownBlock]:
+    """
+    Split markdown into headings, fenced code blocks, tables and paragraphs in one pass.
+
+    Each block records the path of headings it appears under.
+    """
+    blocks: List[MarkdownBlock] = []
+    headings: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    kind = None
+    fence = None
+
+    def close_block():
+        nonlocal lines, kind
+        block_text = "\n".join(lines).strip("\n")
+        if block_text.strip():
+            blocks.append(MarkdownBlock(kind, block_text, tuple(h for _, h in headings), estimate_tokens(block_text)))
+        lines = []
+        kind = None
+
+    for line in text.splitlines():
+        # Inside a code fence everything, including blank lines and '#', belongs to the block
+        if fence is not None:
+            lines.append(line)
+            stripped = line.strip()
+            if stripped and set(stripped) == {fence[0]} and len(stripped) >= len(fence):
+                close_block()
+                fence = None
+            continue
+
+        match = FENCE_RE.match(line)
+        if match:
+            close_block()
+            fence = match.group(1)
+            kind = "code"
+            lines.append(line)
+            continue
+
+        match = HEADING_RE.match(line)
+        if match:
+            close_block()
+            level = len(match.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, match.group(2)))
+            blocks.append(MarkdownBlock("heading", line.strip(), tuple(h for _, h in headings), estimate_tokens(line), level))
+            continue
+
+        if not line.strip():
+            close_block()
+            continue
+
+        line_kind = "table" if line.lstrip().startswith("|") else "paragraph"
+        if kind is not None and kind != line_kind:
+            close_block()
+        kind = line_kind
+        lines.append(line)
+
+    close_block()
+    return blocks
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    """Cut text into pieces of at most max_tokens, at a line break or space where possible."""
+    pieces = []
+    while estimate_tokens(text) > max_tokens:
+        cut = max(1, len(text) * max_tokens // estimate_tokens(text))
+        while cut > 1 and estimate_tokens(text[:cut]) > max_tokens:
+            cut = cut * 9 // 10
+        # Prefer a natural break in the second half of the piece
+        brk = max(text.rfind("\n", cut // 2, cut), text.rfind(" ", cut // 2, cut))
+        if brk > 0:
+            pieces.append(text[:brk])
+            text = text[brk + 1:]
+        else:
+            pieces.append(text[:cut])
+            text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+def _pack(units: List[str], separator: str, max_tokens: int) -> List[str]:
+    """Join units into pieces of at most max_tokens, hard-splitting any unit too big on its own."""
+    pieces = []
+    current: List[str] = []
+    current_tokens = 0
+    for unit in units:
+        # Count a token per separator, so the joined piece can't come out over the budget
+        unit_tokens = estimate_tokens(unit) + 1
+        if current and current_tokens + unit_tokens > max_tokens:
+            pieces.append(separator.join(current))
+            current, current_tokens = [], 0
+        if unit_tokens > max_tokens:
+            pieces.extend(_hard_split(unit, max_tokens))
+            continue
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        pieces.append(separator.join(current))
+    return [piece for split in pieces for piece in _hard_split(split, max_tokens)]
+
+def _split_paragraph(block: MarkdownBlock, max_tokens: int) -> List[MarkdownBlock]:
+    """Split an oversized paragraph at sentence boundaries, or at words for run-on sentences."""
+    units = []
+    for sentence in SENTENCE_RE.split(block.text):
+        if estimate_tokens(sentence) <= max_tokens:
+            units.append(sentence)
+        else:
+            units.extend(sentence.split())
+    return [MarkdownBlock("paragraph", piece, block.heading_path, estimate_tokens(piece)) for piece in _pack(units, " ", max_tokens)]
+
+def _split_code(block: MarkdownBlock, max_tokens: int) -> List[MarkdownBlock]:
+    """Split an oversized code fence by lines, reopening and closing the fence around every piece."""
+    lines = block.text.split("\n")
+    opening = lines[0]
+    marker = FENCE_RE.match(opening).group(1)
+    closing = lines[-1].strip()
+    if len(lines) > 1 and closing and set(closing) == {marker[0]} and len(closing) >= len(marker):
+        lines = lines[1:-1]
+    else:
+        closing, lines = marker, lines[1:]  # Unclosed fence at the end of the page
+
+    budget = max_tokens - estimate_tokens(opening) - estimate_tokens(closing) - 2
+    if budget < max_tokens // 2:
+        return _split_paragraph(block, max_tokens)
+    return [
+        MarkdownBlock("code", text, block.heading_path, estimate_tokens(text))
+        for text in (f"{opening}\n{piece}\n{closing}" for piece in _pack(lines, "\n", budget))
+    ]
+
+def _split_table(block: MarkdownBlock, max_tokens: int) -> List[MarkdownBlock]:
+    """Split an oversized table by rows, repeating its header row in every piece."""
+    lines = block.text.split("\n")
+    header = lines[:2] if len(lines) > 2 and TABLE_DELIMITER_RE.match(lines[1]) else []
+    header_text = "\n".join(header)
+    budget = max_tokens - estimate_tokens(header_text) - 1 if header else max_tokens
+    if budget < max_tokens // 2:
+        header, header_text, budget = [], "", max_tokens
+    texts = [
+        f"{header_text}\n{piece}" if header else piece
+        for piece in _pack(lines[len(header):], "\n", budget)
+    ]
+    return [MarkdownBlock("table", text, block.heading_path, estimate_tokens(text)) for text in texts]
+
+def _split_block(block: MarkdownBlock, max_tokens: int) -> List[MarkdownBlock]:
+    """Split a block over max_tokens into pieces that each fit."""
+    if block.kind == "code":
+        return _split_code(block, max_tokens)
+    if block.kind == "table":
+        return _split_table(block, max_tokens)
+    return _split_paragraph(block, max_tokens)
+
+def _overlap_tail(blocks: List[MarkdownBlock], overlap_tokens: int) -> List[MarkdownBlock]:
+    """Trailing prose of a finished chunk to repeat at the start of the next one."""
+    tail: List[MarkdownBlock] = []
+    tokens = 0
+    for block in reversed(blocks):
+        if block.kind not in ("paragraph", "heading") or tokens + block.tokens > overlap_tokens:
+            break
+        tail.insert(0, block)
+        tokens += block.tokens
+
+    # Nothing fit whole, so take the last sentences of the final paragraph
+    if not tail and blocks and blocks[-1].kind == "paragraph":
+        sentences = []
+        for sentence in reversed(SENTENCE_RE.split(blocks[-1].text)):
+            sentence_tokens = estimate_tokens(sentence)
+            if tokens + sentence_tokens > overlap_tokens:
+                break
+            sentences.insert(0, sentence)
+            tokens += sentence_tokens
+        if sentences:
+            text = " ".join(sentences)
+            tail.append(MarkdownBlock("paragraph", text, blocks[-1].heading_path, estimate_tokens(text)))
+    return tail
+
+def chunk_markdown(text: str, max_tokens: int = 500, overlap_tokens: int = 50) -> List[MarkdownChunk]:
+    """
+    Split markdown into chunks of about max_tokens embedding tokens.
+
+    Chunks break between blocks, never inside a code fence or table, and never
+    right after a heading. A block over max_tokens is split: paragraphs at
+    sentences or words, code fences by lines with the fence reopened around
+    every piece, tables by rows with the header repeated, and anything still too
+    long is cut hard, so no chunk goes over max_tokens. A new top level section
+    starts a new chunk once the current one is half full. The last overlap_tokens
+    of prose are repeated at the start of the next chunk (overlap_chars says how
+    many characters, so a page can be reassembled without them), and each chunk
+    records the heading path of its first block.
+    """
+    chunks: List[MarkdownChunk] = []
+    current: List[MarkdownBlock] = []
+    current_tokens = 0  # Including a token for the separator after each block
+    overlap_count = 0  # Leading blocks of current repeated from the previous chunk
+
+    def emit(final: bool = False):
+        nonlocal current, current_tokens, overlap_count
+        # Carry trailing headings into the next chunk with the content they introduce
+        carry: List[MarkdownBlock] = []
+        while not final and current and current[-1].kind == "heading":
+            carry.insert(0, current.pop())
+
+        tail: List[MarkdownBlock] = []
+        if len(current) > overlap_count:
+            overlap = "\n\n".join(block.text for block in current[:overlap_count])
+            chunks.append(MarkdownChunk(
+                content="\n\n".join(block.text for block in current),
+                heading_path=list(current[overlap_count].heading_path),
+                token_count=sum(block.tokens for block in current),
+                overlap_chars=len(overlap) + 2 if overlap_count else 0
+            ))
+            if overlap_tokens > 0:
+                tail = _overlap_tail(current, overlap_tokens)
+
+        current = tail + carry
+        overlap_count = len(tail)
+        current_tokens = sum(block.tokens + 1 for block in current)
+
+    for block in split_markdown_blocks(text):
+        pieces = _split_block(block, max_tokens) if block.tokens > max_tokens else [block]
+        while pieces:
+            piece = pieces.pop(0)
+            new_section = piece.kind == "heading" and piece.level <= 2 and current_tokens >= max_tokens * 0.5
+            if len(current) > overlap_count and (current_tokens + piece.tokens > max_tokens or new_section):
+                emit()
+
+            # Drop the overlap if it would push this block over the budget
+            if overlap_count and current_tokens + piece.tokens > max_tokens:
+                current = current[overlap_count:]
+                overlap_count = 0
+                current_tokens = sum(block.tokens + 1 for block in current)
+
+            # Headings carried over still leave no room: split the block to start under them,
+            # or if too little is left, let the headings be a chunk of their own
+            if current and current_tokens + piece.tokens > max_tokens:
+                room = max_tokens - current_tokens
+                if piece.kind != "heading" and room >= max_tokens // 4:
+                    piece, *rest = _split_block(piece, room)
+                    pieces[:0] = rest
+                else:
+                    emit(final=True)
+                    current, overlap_count, current_tokens = [], 0, 0
+
+            current.append(piece)
+            current_tokens += piece.tokens + 1
+
+    emit(final=True)
+    return chunks
+
+def chunk_text(text: str, chunk_size: int = 5000) -> List[str]:
+    """Split text into chunks, respecting code blocks and paragraphs."""
+    # Original character-window chunker, kept for comparison in encompass_chunker_benchmark.py
+    chunks = []
+    start = 0
+    text_length = len(text)
+
+    while start < text_length:
+        # Calculate end position
+        end = start + chunk_size
+
+        # If we're at the end of the text, just take what's left
+        if end >= text_length:
+            chunks.append(text[start:].strip())
+            break
+
+        # Try to find a code block boundary first (```)
+        chunk = text[start:end]
+        code_block = chunk.rfind('```')
+        if code_block != -1 and code_block > chunk_size * 0.3:
+            end = start + code_block
+
+        # If no code block, try to break at a paragraph
+        elif '\n\n' in chunk:
+            # Find the last paragraph break
+            last_break = chunk.rfind('\n\n')
+            if last_break > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
+                end = start + last_break
+
+        # If no paragraph break, try to break at a sentence
+        elif '. ' in chunk:
+            # Find the last sentence break
+            last_period = chunk.rfind('. ')
+            if last_period > chunk_size * 0.3:  # Only break if we're past 30% of chunk_size
+                end = start + last_period + 1
+
+        # Extract chunk and clean it up
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+
+        # Move start position for next chunk
+        start = max(start + 1, end)
+
+    return chunks
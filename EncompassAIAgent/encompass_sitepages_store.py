@@ -0,0 +1,242 @@
+import json
+import asyncio
+import hashlib
+
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+def content_hash(text: str) -> str:
+    """Hash page or chunk content for change detection."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def fetch_chunk_hashes(supabase_client, source: str, table: str = "site_pages", page_size: int = 1000) -> Dict[str, Dict[int, Dict[str, str]]]:
+    """
+    Load the stored content hashes of every chunk for a source.
+
+    Returns:
+        Dict mapping url -> chunk_number -> {"content_hash", "page_hash", "duplicate_of"}
+    """
+    stored: Dict[str, Dict[int, Dict[str, str]]] = {}
+    start = 0
+    while True:
+        result = supabase_client.from_(table) \
+            .select('url, chunk_number, content_hash:metadata->>content_hash, page_hash:metadata->>page_hash, duplicate_of:metadata->>duplicate_of') \
+            .eq('metadata->>source', source) \
+            .order('id') \
+            .range(start, start + page_size - 1) \
+            .execute()
+
+        for row in result.data:
+            stored.setdefault(row['url'], {})[row['chunk_number']] = {
+                "content_hash": row['content_hash'],
+                "page_hash": row['page_hash'],
+                "duplicate_of": row.get('duplicate_of')
+            }
+
+        if len(result.data) < page_size:
+            return stored
+        start += page_size
+
+def fetch_stored_urls(supabase_client, source: str, table: str = "site_pages", catalog_table: str = "site_page_catalog",
+                      page_size: int = 1000) -> Set[str]:
+    """Every url with chunks or a catalog row stored for a source."""
+    urls: Set[str] = set()
+    for from_table, source_column in ((table, "metadata->>source"), (catalog_table, "source")):
+        start = 0
+        while True:
+            result = supabase_client.from_(from_table) \
+                .select('url') \
+                .eq(source_column, source) \
+                .order('url') \
+                .range(start, start + page_size - 1) \
+                .execute()
+            urls.update(row['url'] for row in result.data)
+            if len(result.data) < page_size:
+                break
+            start += page_size
+    return urls
+
+def is_page_unchanged(stored_chunks: Dict[int, Dict[str, str]], page_hash: str, chunk_count: int) -> bool:
+    """
+    Whether a page's stored chunks are all from this exact content.
+
+    Every chunk number of the page must be stored, not just carry the page hash:
+    a chunk that failed to embed is never written while the page's other chunks
+    are, so checking the hashes alone would skip that page forever.
+    """
+    return set(stored_chunks) == set(range(chunk_count)) and \
+        all(chunk["page_hash"] == page_hash for chunk in stored_chunks.values())
+
+def duplicate_dependents(stored: Dict[str, Dict[int, Dict[str, str]]]) -> Dict[str, Set[str]]:
+    """
+    Map each url to the other pages with stored chunks marked as near-duplicates of it.
+
+    Those chunks have no embedding of their own, so when the url's page changes
+    or loses chunks the pages pointing at it have to be checked again.
+    """
+    dependents: Dict[str, Set[str]] = {}
+    for url, chunks in stored.items():
+        for chunk in chunks.values():
+            duplicate_of = chunk.get("duplicate_of")
+            if not duplicate_of:
+                continue
+            if isinstance(duplicate_of, str):
+                duplicate_of = json.loads(duplicate_of)
+            if duplicate_of["url"] != url:
+                dependents.setdefault(duplicate_of["url"], set()).add(url)
+    return dependents
+
+class SitePagesWriter:
+    """
+    Buffer site_pages rows and upsert them in multi-row batches.
+
+    Rows are keyed on (url, chunk_number) so a re-crawl replaces existing chunks
+    instead of duplicating them. The Supabase client is synchronous, so each batch
+    is executed in a worker thread, and at most max_in_flight batches are written
+    at once; callers of add() wait when that limit is reached. on_written, when
+    set, is called with the rows of every batch that was written successfully.
+
+    One site_page_catalog row per page (add_page) is buffered and upserted the
+    same way, keyed on url.
+    """
+
+    def __init__(
+        self,
+        supabase_client,
+        table: str = "site_pages",
+        catalog_table: str = "site_page_catalog",
+        batch_size: int = 100,
+        max_in_flight: int = 4
+    ):
+        self.supabase = supabase_client
+        self.table = table
+        self.catalog_table = catalog_table
+        self.batch_size = batch_size
+
+        self._buffer: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = set()
+        self.on_written = None
+
+        # Counters reported at the end of a crawl
+        self.rows_written = 0
+        self.batches_written = 0
+
+    async def add(self, row: Dict[str, Any]):
+        """Buffer a row, writing a batch once batch_size rows are pending."""
+        # A later row for the same chunk replaces the buffered one (upsert can't touch a row twice)
+        self._buffer[(row["url"], row["chunk_number"])] = row
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def add_page(self, page: Dict[str, Any]):
+        """Buffer a page catalog row, writing with the next flush."""
+        self._pages[page["url"]] = page
+        if len(self._pages) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """Start writing the buffered rows, waiting for a free in-flight slot."""
+        if self._pages:
+            pages = list(self._pages.values())
+            self._pages = {}
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._write_pages(pages))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+        if not self._buffer:
+            return
+
+        # Rows that keep their stored embedding carry no embedding column, and a
+        # multi-row upsert needs the same columns in every row, so write them separately
+        batches: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in self._buffer.values():
+            batches.setdefault(tuple(sorted(row)), []).append(row)
+        self._buffer = {}
+
+        for rows in batches.values():
+            await self._semaphore.acquire()
+            task = asyncio.create_task(self._write_batch(rows))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def delete_orphans(self, url: str, chunk_count: int):
+        """Delete stored chunks of a page numbered at or past its new chunk count."""
+        async with self._semaphore:
+            try:
+                await asyncio.to_thread(
+                    lambda: self.supabase.table(self.table)
+                        .delete()
+                        .eq("url", url)
+                        .gte("chunk_number", chunk_count)
+                        .execute()
+                )
+            except Exception as e:
+                print(f"Error deleting orphaned chunks for {url}: {e}")
+
+    async def delete_pages(self, urls: Iterable[str]) -> int:
+        """Delete every chunk and the catalog row of each url; returns the number of pages deleted."""
+        urls = sorted(urls)
+        deleted = 0
+        for start in range(0, len(urls), self.batch_size):
+            batch = urls[start:start + self.batch_size]
+            async with self._semaphore:
+                try:
+                    await asyncio.to_thread(self._delete_pages, batch)
+                    deleted += len(batch)
+                except Exception as e:
+                    print(f"Error deleting {len(batch)} pages: {e}")
+        return deleted
+
+    def _delete_pages(self, urls: List[str]):
+        """Run the blocking deletes of the pages' chunks and catalog rows."""
+        self.supabase.table(self.table) \
+            .delete() \
+            .in_("url", urls) \
+            .execute()
+        self.supabase.table(self.catalog_table) \
+            .delete() \
+            .in_("url", urls) \
+            .execute()
+
+    async def _write_batch(self, rows: List[Dict[str, Any]]):
+        """Upsert one batch off the event loop."""
+        try:
+            await asyncio.to_thread(self._upsert_rows, rows)
+            self.rows_written += len(rows)
+            self.batches_written += 1
+            print(f"Upserted {len(rows)} chunks into {self.table}")
+            if self.on_written is not None:
+                self.on_written(rows)
+        except Exception as e:
+            print(f"Error upserting {len(rows)} chunks: {e}")
+        finally:
+            self._semaphore.release()
+
+    def _upsert_rows(self, rows: List[Dict[str, Any]]):
+        """Run the blocking multi-row upsert."""
+        return self.supabase.table(self.table) \
+            .upsert(rows, on_conflict="url,chunk_number") \
+            .execute()
+
+    async def _write_pages(self, pages: List[Dict[str, Any]]):
+        """Upsert a batch of page catalog rows off the event loop."""
+        try:
+            await asyncio.to_thread(self._upsert_pages, pages)
+        except Exception as e:
+            print(f"Error upserting {len(pages)} pages into {self.catalog_table}: {e}")
+        finally:
+            self._semaphore.release()
+
+    def _upsert_pages(self, pages: List[Dict[str, Any]]):
+        """Run the blocking page catalog upsert."""
+        return self.supabase.table(self.catalog_table) \
+            .upsert(pages, on_conflict="url") \
+            .execute()
+
+    async def aclose(self):
+        """Write any remaining rows and wait for all batches to finish."""
+        await self.flush()
+        while self._in_flight:
+            await asyncio.gather(*list(self._in_flight))
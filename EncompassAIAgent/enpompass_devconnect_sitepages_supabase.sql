@@ -12,6 +12,7 @@ create table site_pages (
     metadata jsonb not null default '{}'::jsonb,  -- Added metadata column
     embedding vector(1536),  -- OpenAI embeddings are 1536 dimensions
     created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+    updated_at timestamp with time zone default now() not null,  -- Last write, kept by the trigger below
     
     -- Add a unique constraint to prevent duplicate chunks for the same URL
     unique(url, chunk_number)
@@ -23,6 +24,36 @@ create index on site_pages using ivfflat (embedding vector_cosine_ops);
 -- Create an index on metadata for faster filtering
 create index idx_site_pages_metadata on site_pages using gin (metadata);
 
+-- Stamp every insert and update with the time it was written. The local vector index
+-- (encompass_vector_index.py) fetches rows written since its last refresh by this column;
+-- metadata->>crawled_at is when the chunk was built, which can be long before it is stored.
+-- Existing tables: alter table site_pages add column updated_at timestamp with time zone default now() not null;
+create index idx_site_pages_updated_at on site_pages (updated_at);
+
+create function site_pages_set_updated_at() returns trigger
+language plpgsql
+as $$
+begin
+  new.updated_at = now();
+  return new;
+end;
+$$;
+
+create trigger site_pages_updated_at
+  before insert or update on site_pages
+  for each row execute function site_pages_set_updated_at();
+
+-- Using shortened embeddings (OPENAI_EMBEDDING_DIMENSIONS, e.g. 512; see encompass_embedding_eval.py):
+-- the column, the index and the function argument must all use the same size, and every
+-- page must be re-embedded (run the crawler with --full):
+--
+--   drop index site_pages_embedding_idx;
+--   update site_pages set embedding = null;
+--   alter table site_pages alter column embedding type vector(512);
+--   create index on site_pages using ivfflat (embedding vector_cosine_ops);
+--   drop function match_site_pages(vector, int, jsonb);
+--   -- then re-run the create function below with query_embedding vector(512)
+
 -- Create a function to search for documentation chunks
 create function match_site_pages (
   query_embedding vector(1536),
@@ -54,6 +85,7 @@ begin
     1 - (site_pages.embedding <=> query_embedding) as similarity
   from site_pages
   where metadata @> filter
+    and site_pages.embedding is not null  -- near-duplicate chunks are stored without an embedding
   order by site_pages.embedding <=> query_embedding
   limit match_count;
 end;
@@ -69,4 +101,40 @@ create policy "Allow public read access"
   on site_pages
   for select
   to public
-  using (true);
\ No newline at end of file
+  using (true);
+
+-- One row per page, maintained by the crawler, so listing pages doesn't scan every chunk
+create table site_page_catalog (
+    url varchar primary key,
+    url_path varchar not null,
+    source varchar not null,
+    title varchar not null,
+    chunk_count integer not null,
+    last_crawled timestamp with time zone not null,  -- When the page content last changed
+    content_hash varchar not null
+);
+
+create index idx_site_page_catalog_source_path on site_page_catalog (source, url_path);
+create index idx_site_page_catalog_last_crawled on site_page_catalog (last_crawled);
+
+alter table site_page_catalog enable row level security;
+
+create policy "Allow public read access"
+  on site_page_catalog
+  for select
+  to public
+  using (true);
+
+-- Backfill from chunks crawled before the catalog existed
+insert into site_page_catalog (url, url_path, source, title, chunk_count, last_crawled, content_hash)
+select
+  url,
+  min(metadata->>'url_path'),
+  min(metadata->>'source'),
+  min(title),
+  count(*),
+  max((metadata->>'crawled_at')::timestamptz),
+  coalesce(min(metadata->>'page_hash'), '')
+from site_pages
+group by url
+on conflict (url) do nothing;
\ No newline at end of file
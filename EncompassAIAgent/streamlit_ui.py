@@ -19,6 +19,7 @@ from pydantic_ai.messages import (
     TextPart
 )
 from encompass_devconnect_expert import encompass_devconnect_expert, PydanticAIDeps
+from encompass_vector_index import LocalVectorIndex
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -30,6 +31,11 @@ supabase: Client = Client(
     os.getenv("SUPABASE_SERVICE_KEY")
 )
 
+@st.cache_resource
+def get_vector_index():
+    """One local vector index per Streamlit server process, kept across reruns (None unless LOCAL_VECTOR_INDEX is set)."""
+    return LocalVectorIndex.from_env()
+
 # Configure logfire to suppress warnings (optional)
 #logfire.configure(send_to_logfire='never')
 
@@ -69,7 +75,8 @@ async def run_agent_with_streaming(user_input: str):
     # Prepare dependencies
     deps = PydanticAIDeps(
         supabase=supabase,
-        openai_client=openai_client
+        openai_client=openai_client,
+        vector_index=get_vector_index()
     )
 
     # Run the agent in a stream
@@ -0,0 +1,44 @@
+from encompass_chunk_dedup import NearDuplicateIndex, shingles, simhash
+
+BOILERPLATE = ("To call this endpoint you need an access token from the authentication endpoint and the "
+               "instance id of your Encompass environment. Requests without a valid bearer token are "
+               "rejected with 401, and rate limited requests return 429 with a Retry-After header.")
+
+def test_simhash_of_similar_text_differs_in_few_bits():
+    a = simhash(shingles(BOILERPLATE))
+    b = simhash(shingles(BOILERPLATE + " Contact support."))
+    c = simhash(shingles("Loan pipeline fields can be filtered by canonical name, value and match type " * 3))
+
+    assert bin(a ^ b).count("1") < bin(a ^ c).count("1")
+    assert simhash(shingles(BOILERPLATE)) == a
+
+def test_short_text_is_never_a_duplicate():
+    index = NearDuplicateIndex()
+    index.add(("a", 0), "Parameters")
+    assert index.find_or_add(("b", 0), "Parameters") is None
+
+def test_near_duplicate_points_at_representative():
+    index = NearDuplicateIndex()
+    assert index.find_or_add(("a", 0), BOILERPLATE) is None
+    assert index.find_or_add(("b", 3), BOILERPLATE + " Contact support.") == ("a", 0)
+    assert index.find_or_add(("c", 0), "Completely different text about escrow disbursements " * 5) is None
+    assert index.duplicates == 1
+
+def test_representative_is_the_lowest_key_whatever_the_order():
+    index = NearDuplicateIndex()
+    assert index.find_or_add(("b", 0), BOILERPLATE) is None
+    # A lower key arriving later is not marked a duplicate of a higher one
+    assert index.find_or_add(("a", 0), BOILERPLATE) is None
+    assert index.find_or_add(("c", 0), BOILERPLATE) == ("a", 0)
+
+def test_representative_is_never_marked_a_duplicate_when_rechecked():
+    index = NearDuplicateIndex()
+    index.find_or_add(("b", 0), BOILERPLATE)
+    index.find_or_add(("a", 0), BOILERPLATE)
+    assert index.find_or_add(("b", 0), BOILERPLATE) is None
+
+def test_clear_forgets_everything():
+    index = NearDuplicateIndex()
+    index.find_or_add(("a", 0), BOILERPLATE)
+    index.clear()
+    assert index.find(BOILERPLATE) is None
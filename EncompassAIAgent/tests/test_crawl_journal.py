@@ -0,0 +1,46 @@
+from encompass_crawl_journal import CrawlJournal
+
+URLS = [f"https://example.com/page-{i}" for i in range(40)]
+
+def test_states_and_failures(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+    journal.mark(URLS[0], "discovered")
+    journal.mark(URLS[0], "chunked", chunk_count=3)
+    journal.mark(URLS[1], "crawled", error="timeout")
+
+    assert journal.state(URLS[0]) == "chunked"
+    assert journal.state(URLS[1]) == "failed"
+    assert journal.state(URLS[2]) is None
+
+    journal.mark(URLS[0], "stored")
+    assert journal.is_done(URLS[0])
+    # chunk_count survives later marks that don't give one
+    assert journal._conn.execute("select chunk_count from crawl_journal where url = ?", (URLS[0],)).fetchone()[0] == 3
+
+def test_unfinished_urls_are_everything_not_stored(tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+    journal.mark(URLS[0], "embedded")
+    journal.mark(URLS[1], "stored")
+    journal.mark(URLS[2], "crawled", error="boom")
+
+    assert sorted(journal.unfinished_urls()) == [URLS[0], URLS[2]]
+    assert journal.counts() == {"embedded": 1, "stored": 1, "failed": 1}
+
+def test_shards_partition_urls(tmp_path):
+    shards = [CrawlJournal(str(tmp_path / "journal.sqlite3"), shard_index=i, shard_count=3) for i in range(3)]
+
+    owners = [[shard.in_shard(url) for shard in shards].count(True) for url in URLS]
+    assert owners == [1] * len(URLS)
+    assert all(any(shard.in_shard(url) for url in URLS) for shard in shards)
+    assert CrawlJournal.url_hash(URLS[0]) == CrawlJournal.url_hash(URLS[0]) >= 0
+
+def test_shards_share_a_file_but_reset_only_their_own_urls(tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    first, second = (CrawlJournal(path, shard_index=i, shard_count=2) for i in range(2))
+    for url in URLS:
+        (first if first.in_shard(url) else second).mark(url, "crawled")
+
+    first.reset()
+
+    assert first.unfinished_urls() == []
+    assert sorted(second.unfinished_urls()) == sorted(url for url in URLS if second.in_shard(url))
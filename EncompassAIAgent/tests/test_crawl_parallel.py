@@ -0,0 +1,152 @@
+import os
+import asyncio
+import tempfile
+
+from types import SimpleNamespace
+
+import pytest
+
+# The crawler creates its clients at import time; these tests never talk to them
+os.environ.setdefault("OPENAI_API_KEY", "offline-test")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "offline-test")
+os.environ.setdefault("OPENAI_TEXT_EMBEDDING_MODEL", "fake-embedding")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "encompass_test_embedding_cache.sqlite3"))
+
+crawl = pytest.importorskip("encompass_devconnect_sitepages_crawl")
+
+from encompass_chunker_benchmark import make_document
+from encompass_crawl_journal import CrawlJournal
+from encompass_embeddings import EmbeddingBatcher
+from encompass_sitepages_store import SitePagesWriter
+
+URLS = [f"https://example.com/developer-connect/page-{i}/" for i in range(12)]
+
+class FakeCrawler:
+    """Stands in for AsyncWebCrawler, serving a generated page per URL."""
+
+    crawled = []
+
+    def __init__(self, config=None):
+        self.crawler_strategy = SimpleNamespace(kill_session=self.kill_session)
+
+    async def kill_session(self, session_id):
+        pass
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def arun(self, url, config=None):
+        FakeCrawler.crawled.append(url)
+        await asyncio.sleep(0)
+        return SimpleNamespace(success=True, markdown=SimpleNamespace(raw_markdown=make_document(1500, seed=URLS.index(url))))
+
+class FakeEmbeddings:
+    async def create(self, model, input):
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[1.0, float(i)]) for i in range(len(input))])
+
+class MemoryWriter(SitePagesWriter):
+    """SitePagesWriter that keeps rows in memory; writes of fail_urls' rows fail."""
+
+    def __init__(self, fail_urls=()):
+        super().__init__(supabase_client=None, batch_size=1)
+        self.fail_urls = set(fail_urls)
+        self.rows = {}
+        self.deleted = []
+
+    def _upsert_rows(self, rows):
+        if any(row["url"] in self.fail_urls for row in rows):
+            raise RuntimeError("write failed")
+        for row in rows:
+            self.rows[(row["url"], row["chunk_number"])] = row
+
+    def _upsert_pages(self, pages):
+        pass
+
+    def _delete_pages(self, urls):
+        self.deleted.extend(urls)
+
+    async def delete_orphans(self, url, chunk_count):
+        pass
+
+@pytest.fixture
+def crawler(monkeypatch):
+    FakeCrawler.crawled = []
+    monkeypatch.setattr(crawl, "AsyncWebCrawler", FakeCrawler)
+    monkeypatch.setattr(crawl, "embedding_batcher", EmbeddingBatcher(SimpleNamespace(embeddings=FakeEmbeddings()), model="fake-embedding"))
+    monkeypatch.setattr(crawl, "site_pages_writer", MemoryWriter())
+    return FakeCrawler
+
+def run(urls, **kwargs):
+    asyncio.run(crawl.crawl_parallel(urls, max_concurrent=2, embed_workers=4, queue_size=4, **kwargs))
+
+def test_pages_are_stored_only_once_their_rows_are_written(crawler, tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl, "site_pages_writer", MemoryWriter(fail_urls=[URLS[1]]))
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+
+    run(URLS[:3], journal=journal)
+
+    assert journal.state(URLS[0]) == journal.state(URLS[2]) == "stored"
+    # Embedded, but its rows never made it into site_pages
+    assert journal.state(URLS[1]) == "embedded"
+    assert journal.unfinished_urls() == [URLS[1]]
+
+def test_resume_crawls_unfinished_and_new_urls_only(crawler, tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+    journal.mark(URLS[0], "stored")
+    journal.mark(URLS[1], "embedded")
+
+    run(URLS[:3], journal=journal, resume=True)
+
+    assert sorted(crawler.crawled) == [URLS[1], URLS[2]]
+    assert all(journal.is_done(url) for url in URLS[:3])
+
+def test_without_resume_the_journal_starts_over(crawler, tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"))
+    journal.mark(URLS[0], "stored")
+
+    run(URLS[:2], journal=journal)
+
+    assert sorted(crawler.crawled) == URLS[:2]
+
+def test_shard_crawls_only_its_urls(crawler, tmp_path):
+    path = str(tmp_path / "journal.sqlite3")
+    owned = []
+    for index in range(2):
+        crawler.crawled = []
+        journal = CrawlJournal(path, shard_index=index, shard_count=2)
+        run(URLS, journal=journal)
+        assert sorted(crawler.crawled) == sorted(url for url in URLS if journal.in_shard(url))
+        owned.extend(crawler.crawled)
+
+    assert sorted(owned) == sorted(URLS)
+
+def test_run_returns_every_url_seen_even_outside_the_shard(crawler, tmp_path):
+    journal = CrawlJournal(str(tmp_path / "journal.sqlite3"), shard_index=0, shard_count=2)
+
+    assert asyncio.run(crawl.crawl_parallel(URLS, max_concurrent=2, journal=journal)) == set(URLS)
+
+def test_prune_deletes_only_stored_pages_that_were_not_seen(crawler, monkeypatch):
+    stored = {URLS[0], URLS[1], "https://example.com/developer-connect/removed/"}
+    monkeypatch.setattr(crawl, "fetch_stored_urls", lambda client, source: set(stored))
+
+    assert asyncio.run(crawl.prune_missing_pages(set(URLS))) == 1
+    assert crawl.site_pages_writer.deleted == ["https://example.com/developer-connect/removed/"]
+
+def test_prune_without_seen_urls_deletes_nothing(crawler, monkeypatch):
+    monkeypatch.setattr(crawl, "fetch_stored_urls", lambda client, source: {URLS[0]})
+
+    assert asyncio.run(crawl.prune_missing_pages(set())) == 0
+    assert crawl.site_pages_writer.deleted == []
+
+def test_unreadable_sitemaps_are_reported():
+    errors = []
+
+    async def main():
+        return [url async for url in crawl.discover_sitemap_urls(["http://127.0.0.1:9/sitemap.xml"], ("/",), errors=errors)]
+
+    assert asyncio.run(main()) == []
+    assert errors == ["http://127.0.0.1:9/sitemap.xml"]
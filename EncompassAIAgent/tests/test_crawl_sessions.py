@@ -0,0 +1,71 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from encompass_crawl_sessions import BrowserSessionPool
+
+class FakeStrategy:
+    def __init__(self):
+        self.killed = []
+
+    async def kill_session(self, session_id):
+        self.killed.append(session_id)
+
+def make_pool(size, max_navigations):
+    strategy = FakeStrategy()
+    return BrowserSessionPool(SimpleNamespace(crawler_strategy=strategy), size=size, max_navigations=max_navigations), strategy
+
+def test_concurrent_crawls_get_their_own_sessions():
+    pool, _ = make_pool(size=3, max_navigations=50)
+    in_use = []
+
+    async def crawl():
+        async with pool.session() as session_id:
+            in_use.append(session_id)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(crawl() for _ in range(3)))
+
+    asyncio.run(main())
+    assert sorted(in_use) == ["crawl-0-0", "crawl-1-0", "crawl-2-0"]
+
+def test_session_is_recycled_after_max_navigations():
+    pool, strategy = make_pool(size=1, max_navigations=2)
+
+    async def main():
+        ids = []
+        for _ in range(5):
+            async with pool.session() as session_id:
+                ids.append(session_id)
+        return ids
+
+    assert asyncio.run(main()) == ["crawl-0-0", "crawl-0-0", "crawl-0-1", "crawl-0-1", "crawl-0-2"]
+    assert strategy.killed == ["crawl-0-0", "crawl-0-1"]
+    assert pool.recycled == 2
+
+def test_failed_crawl_recycles_its_session():
+    pool, strategy = make_pool(size=1, max_navigations=50)
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            async with pool.session():
+                raise RuntimeError("page crashed")
+        async with pool.session() as session_id:
+            return session_id
+
+    assert asyncio.run(main()) == "crawl-0-1"
+    assert strategy.killed == ["crawl-0-0"]
+
+def test_aclose_closes_only_used_sessions():
+    pool, strategy = make_pool(size=2, max_navigations=50)
+
+    async def main():
+        async with pool.session():
+            pass
+        await pool.aclose()
+
+    asyncio.run(main())
+    assert len(strategy.killed) == 1
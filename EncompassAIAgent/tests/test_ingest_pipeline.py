@@ -0,0 +1,75 @@
+import asyncio
+
+from encompass_ingest_pipeline import StagedPipeline
+
+async def numbers(count):
+    for i in range(count):
+        yield i
+
+def test_items_flow_through_every_stage_and_drain():
+    stored = []
+
+    async def split(item):
+        return [(item, 0), (item, 1)]
+
+    async def double(pair):
+        await asyncio.sleep(0.001)
+        return [pair[0] * 2 + pair[1]]
+
+    async def store(value):
+        stored.append(value)
+
+    pipeline = StagedPipeline(queue_size=2)
+    pipeline.add_stage("split", split, workers=2)
+    pipeline.add_stage("double", double, workers=3)
+    pipeline.add_stage("store", store)
+    asyncio.run(pipeline.run(numbers(10)))
+
+    assert sorted(stored) == list(range(20))
+    assert pipeline.source_count == 10
+    assert [stage.processed for stage in pipeline.stages] == [10, 20, 20]
+
+def test_failed_items_are_counted_and_do_not_stall():
+    stored = []
+
+    async def check(item):
+        if item % 3 == 0:
+            raise ValueError(item)
+        return [item]
+
+    async def store(item):
+        stored.append(item)
+
+    pipeline = StagedPipeline(queue_size=1)
+    pipeline.add_stage("check", check)
+    pipeline.add_stage("store", store)
+    asyncio.run(pipeline.run(numbers(9)))
+
+    assert sorted(stored) == [1, 2, 4, 5, 7, 8]
+    assert pipeline.stages[0].failed == 3
+
+def test_slow_stage_throttles_upstream():
+    produced = 0
+    consumed = 0
+    most_ahead = 0
+
+    async def produce(item):
+        nonlocal produced
+        produced += 1
+        return [item]
+
+    async def consume(item):
+        nonlocal consumed, most_ahead
+        most_ahead = max(most_ahead, produced - consumed)
+        await asyncio.sleep(0.005)
+        consumed += 1
+
+    pipeline = StagedPipeline(queue_size=2)
+    pipeline.add_stage("produce", produce)
+    pipeline.add_stage("consume", consume)
+    asyncio.run(pipeline.run(numbers(20)))
+
+    assert consumed == 20
+    # The producer can only get a queue's worth (plus the item it is putting) ahead
+    assert most_ahead <= 2 + 2
+    assert pipeline.stages[0].blocked_seconds > 0
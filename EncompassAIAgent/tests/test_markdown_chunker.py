@@ -0,0 +1,97 @@
+import pytest
+
+import encompass_embeddings
+from encompass_embeddings import estimate_tokens
+from encompass_markdown_chunker import FENCE_RE, chunk_markdown, split_markdown_blocks
+
+PAGE = """# Loan Pipeline
+
+The pipeline endpoint returns loans matching a filter. It supports paging with a cursor.
+
+## Request
+
+```json
+{"filter": {"canonicalName": "Fields.1109", "matchType": "greaterThan", "value": 500000}}
+```
+
+| Field | Description |
+| --- | --- |
+| Fields.1109 | Loan amount |
+
+## Response
+
+An array of loans."""
+
+@pytest.fixture(params=["tiktoken", "fallback"])
+def estimator(request, monkeypatch):
+    """Run each test with exact token counts (when installed) and with the len/4 fallback."""
+    if request.param == "fallback":
+        monkeypatch.setattr("encompass_embeddings._encoding", None)
+    elif encompass_embeddings._encoding is None:
+        pytest.skip("tiktoken not installed")
+
+def test_blocks_keep_heading_paths_and_fenced_comments(estimator):
+    blocks = split_markdown_blocks("# A\n\n```bash\n# not a heading\nls\n```\n\n## B\n\ntext")
+
+    assert [block.kind for block in blocks] == ["heading", "code", "heading", "paragraph"]
+    assert blocks[1].heading_path == ("A",)
+    assert blocks[3].heading_path == ("A", "B")
+
+def test_small_page_is_one_chunk(estimator):
+    chunks = chunk_markdown(PAGE)
+
+    assert len(chunks) == 1
+    assert chunks[0].heading_path == ["Loan Pipeline"]
+    assert chunks[0].overlap_chars == 0
+
+def test_oversized_code_fence_is_split_into_valid_fences(estimator):
+    code = "```python\n" + "\n".join(f"value_{i} = compute_something({i}, 'argument')" for i in range(2000)) + "\n```"
+    chunks = chunk_markdown(f"# Code\n\n{code}", max_tokens=500)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk.content) <= 500
+        fences = [line for line in chunk.content.split("\n") if FENCE_RE.match(line)]
+        assert len(fences) % 2 == 0
+
+def test_oversized_table_repeats_its_header(estimator):
+    rows = "\n".join(f"| Fields.{i} | Description of canonical field number {i} |" for i in range(2000))
+    chunks = chunk_markdown(f"| Field | Description |\n| --- | --- |\n{rows}", max_tokens=300)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk.content) <= 300
+        assert chunk.content.startswith("| Field | Description |\n| --- | --- |\n")
+
+def test_run_on_text_is_cut_at_max_tokens(estimator):
+    chunks = chunk_markdown("x" * 50_000 + " tail. " + "word " * 3000, max_tokens=500)
+
+    assert all(estimate_tokens(chunk.content) <= 500 for chunk in chunks)
+    assert "".join(chunk.content for chunk in chunks).count("x") == 50_000
+
+def test_overlap_can_be_stripped_to_reassemble_the_page(estimator):
+    page = "\n\n".join(
+        " ".join(f"Sentence {i}.{j} explains one more detail of the pipeline." for j in range(3)) for i in range(60)
+    )
+    chunks = chunk_markdown(page, max_tokens=200, overlap_tokens=50)
+
+    assert len(chunks) > 2
+    assert any(chunk.overlap_chars for chunk in chunks[1:])
+    reassembled = "\n\n".join(chunk.content[chunk.overlap_chars:] for chunk in chunks)
+    assert reassembled == page
+
+def test_chunks_of_many_small_blocks_stay_under_max_tokens(estimator):
+    page = "\n\n".join(f"Item {i} of the list." for i in range(2000))
+
+    assert all(estimate_tokens(chunk.content) <= 200 for chunk in chunk_markdown(page, max_tokens=200))
+
+def test_heading_carried_over_with_a_full_block_stays_under_max_tokens(estimator):
+    rows = "\n".join(f"| Fields.{i} | Canonical field {i} |" for i in range(60))
+    table = f"| Field | Description |\n| --- | --- |\n{rows}"
+    page = "Intro paragraph. " * 30 + f"\n\n## {'Long heading ' * 12}\n\n{table}"
+    max_tokens = estimate_tokens(table) + 5
+
+    chunks = chunk_markdown(page, max_tokens=max_tokens)
+
+    assert all(estimate_tokens(chunk.content) <= max_tokens for chunk in chunks)
+    assert all(not chunk.content.endswith("Long heading") for chunk in chunks[:-1])
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+
+from types import SimpleNamespace
+
+from encompass_sitepages_store import SitePagesWriter, content_hash, duplicate_dependents, is_page_unchanged
+
+def stored(page_hash, numbers):
+    return {n: {"content_hash": f"c{n}", "page_hash": page_hash, "duplicate_of": None} for n in numbers}
+
+def test_page_with_every_chunk_stored_is_unchanged():
+    assert is_page_unchanged(stored("p", range(3)), "p", 3)
+
+def test_changed_page_hash_is_changed():
+    chunks = stored("p", range(3))
+    chunks[1]["page_hash"] = "old"
+    assert not is_page_unchanged(chunks, "p", 3)
+
+def test_chunk_that_failed_to_store_makes_page_changed():
+    assert not is_page_unchanged(stored("p", [0, 2]), "p", 3)
+
+def test_leftover_chunks_from_longer_version_make_page_changed():
+    assert not is_page_unchanged(stored("p", range(4)), "p", 3)
+
+def test_content_hash_is_stable():
+    assert content_hash("abc") == content_hash("abc") != content_hash("abd")
+
+def test_duplicate_dependents_maps_targets_to_pointing_pages():
+    stored_chunks = {
+        "a": {0: {"duplicate_of": None}},
+        "b": {0: {"duplicate_of": '{"url": "a", "chunk_number": 0}'}, 1: {"duplicate_of": None}},
+        "c": {2: {"duplicate_of": {"url": "a", "chunk_number": 0}}, 3: {"duplicate_of": '{"url": "c", "chunk_number": 2}'}}
+    }
+    assert duplicate_dependents(stored_chunks) == {"a": {"b", "c"}}
+
+class FakeSupabase:
+    """Records every upsert; upserts into "fail_table" raise."""
+
+    def __init__(self, fail_table=None):
+        self.fail_table = fail_table
+        self.upserts = []
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        client = self
+
+        class Query:
+            def upsert(self, rows, on_conflict):
+                self.rows, self.on_conflict = rows, on_conflict
+                return self
+
+            def delete(self):
+                self.on_conflict = "delete"
+                return self
+
+            def in_(self, column, values):
+                self.rows = [{column: value} for value in values]
+                return self
+
+            def execute(self):
+                if name == client.fail_table:
+                    raise RuntimeError("write failed")
+                with client.lock:
+                    client.upserts.append((name, self.on_conflict, [dict(row) for row in self.rows]))
+                return SimpleNamespace(data=self.rows)
+
+        return Query()
+
+def row(url, number, **columns):
+    return {"url": url, "chunk_number": number, "content": f"{url} {number}", **columns}
+
+def test_writer_groups_rows_by_columns_and_keeps_the_latest_row():
+    client = FakeSupabase()
+    writer = SitePagesWriter(client, batch_size=10)
+    written = []
+    writer.on_written = written.extend
+
+    async def main():
+        await writer.add(row("a", 0, embedding=[1.0]))
+        await writer.add(row("a", 1))  # Keeps its stored embedding: no embedding column
+        await writer.add(row("a", 0, embedding=[2.0]))
+        await writer.add_page({"url": "a", "chunk_count": 2})
+        await writer.aclose()
+
+    asyncio.run(main())
+    chunk_batches = sorted((batch for batch in client.upserts if batch[0] == "site_pages"), key=lambda batch: len(batch[2][0]))
+    assert [[sorted(r) for r in rows] for _, _, rows in chunk_batches] == [
+        [["chunk_number", "content", "url"]],
+        [["chunk_number", "content", "embedding", "url"]]
+    ]
+    assert chunk_batches[1][2][0]["embedding"] == [2.0]
+    assert all(on_conflict == "url,chunk_number" for _, on_conflict, _ in chunk_batches)
+    assert ("site_page_catalog", "url", [{"url": "a", "chunk_count": 2}]) in client.upserts
+    assert (writer.rows_written, writer.batches_written, len(written)) == (2, 2, 2)
+
+def test_writer_flushes_at_batch_size():
+    client = FakeSupabase()
+    writer = SitePagesWriter(client, batch_size=2)
+
+    async def main():
+        for number in range(5):
+            await writer.add(row("a", number))
+        await writer.aclose()
+
+    asyncio.run(main())
+    assert sorted(len(rows) for _, _, rows in client.upserts) == [1, 2, 2]
+
+def test_failed_batch_is_not_reported_written():
+    writer = SitePagesWriter(FakeSupabase(fail_table="site_pages"), batch_size=10)
+    written = []
+    writer.on_written = written.extend
+
+    async def main():
+        await writer.add(row("a", 0))
+        await writer.aclose()
+
+    asyncio.run(main())
+    assert written == [] and writer.rows_written == 0
+
+def test_delete_pages_removes_chunks_and_catalog_rows_in_batches():
+    client = FakeSupabase()
+    writer = SitePagesWriter(client, batch_size=2)
+
+    assert asyncio.run(writer.delete_pages({"c", "a", "b"})) == 3
+    assert client.upserts == [
+        ("site_pages", "delete", [{"url": "a"}, {"url": "b"}]),
+        ("site_page_catalog", "delete", [{"url": "a"}, {"url": "b"}]),
+        ("site_pages", "delete", [{"url": "c"}]),
+        ("site_page_catalog", "delete", [{"url": "c"}])
+    ]
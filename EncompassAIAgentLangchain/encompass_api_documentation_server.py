@@ -2,9 +2,18 @@
 from fastmcp import FastMCP
 from openai import AsyncOpenAI
 from supabase import Client
-from typing import List
+from typing import Any, Dict, List, Optional
+
+from encompass_embedding_cache import EmbeddingCache
+from encompass_vector_index import LocalVectorIndex
+from encompass_bm25_index import reciprocal_rank_fusion
+from encompass_result_packer import pack_chunks
+from encompass_supabase_async import execute, run_blocking
+from encompass_page_catalog import PageCatalog
+from encompass_page_cache import PageContentCache, select_page_content
 
 import os
+import asyncio
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -14,6 +23,23 @@ supabase: Client = Client(
     os.getenv("SUPABASE_SERVICE_KEY")
 )
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Must match the dimensions the crawler stored (OPENAI_EMBEDDING_DIMENSIONS, default full size)
+EMBEDDING_DIMENSIONS = int(os.getenv("OPENAI_EMBEDDING_DIMENSIONS", "0")) or None
+
+# On-disk cache, shared with the crawler and the Streamlit agent (EMBEDDING_CACHE_PATH, default next to the shared module)
+embedding_cache = EmbeddingCache()
+
+# In-process copy of site_pages searched instead of match_site_pages, when LOCAL_VECTOR_INDEX is set
+vector_index = LocalVectorIndex.from_env()
+
+# Listings of the documentation page catalog, cached until the next re-crawl
+page_catalog = PageCatalog()
+
+# Assembled documentation pages, keyed by URL and content version
+page_content_cache = PageContentCache()
+
 mcp_documentation=FastMCP("EncompassApiDocumentation")
 
 @mcp_documentation.tool()
@@ -25,125 +51,171 @@ async def retrieve_relevant_documentation(user_query: str) -> str:
         user_query: The user's question or query
         
     Returns:
-        A formatted string containing the top 5 most relevant documentation chunks
+        A formatted string containing the most relevant parts of the top 5 documentation chunks, within RETRIEVAL_TOKEN_BUDGET tokens
     """
     try:
         # Get the embedding for the query
         query_embedding = await get_embedding(user_query)
         
-        # Query Supabase for relevant documents
-        result = supabase.rpc(
-            # This is a custom RPC function to match documents
-            # Ensure this function is defined in your Supabase database
-            'match_site_pages', 
-            {
-                'query_embedding': query_embedding,
-                'match_count': 5,
-                # Filter by source 
-                # This assumes you have a metadata field in your site_pages table
-                # that contains the source information 
-                # crawl metadata
-                # 'metadata': {'source': 'encompass_devconnect_docs'}
-                'filter': {'source': 'encompass_devconnect_docs'} 
-                
-            }
-        ).execute()
+        matches = (await match_documentation([user_query], [query_embedding]))[0]
         
-        if not result.data:
+        if not matches:
             return "No relevant documentation found."
             
-        # Format the results
-        formatted_chunks = []
-        for doc in result.data:
-            chunk_text = f"""
-# {doc['title']}
-
-{doc['content']}
-"""
-            formatted_chunks.append(chunk_text)
-            
-        # Join all chunks with a separator
-        return "\n\n---\n\n".join(formatted_chunks)
+        return format_documentation_chunks(pack_chunks([user_query], matches))
         
     except Exception as e:
         print(f"Error retrieving documentation: {e}")
         return f"Error retrieving documentation: {str(e)}"
 
 @mcp_documentation.tool()
-async def list_documentation_pages() -> List[str]:
+async def retrieve_relevant_documentation_batch(user_queries: List[str]) -> str:
     """
-    Retrieve a list of all available Pydantic AI documentation pages.
+    Retrieve documentation for several related queries at once, e.g. an endpoint URL, its filter syntax and field names.
+    Prefer this over calling retrieve_relevant_documentation several times in a row.
     
+    Args:
+        user_queries: The questions or queries to look up (at most 8)
+        
     Returns:
-        List[str]: List of unique URLs for all documentation pages
+        A formatted string containing the top 5 chunks for every query, merged, de-duplicated and trimmed to RETRIEVAL_TOKEN_BUDGET tokens
     """
     try:
-        # Query Supabase for unique URLs where source is pydantic_ai_docs
-        result = supabase.from_('site_pages') \
-            .select('url') \
-            .eq('metadata->>source', 'encompass_devconnect_docs') \
-            .execute()
+        user_queries = user_queries[:8]
+        
+        # Embed every query in a single request
+        query_embeddings = await get_embeddings(user_queries)
+        
+        # Merge the per-query rankings, keeping each chunk once
+        rankings = await match_documentation(user_queries, query_embeddings)
+        chunks = {(doc['url'], doc['chunk_number']): doc for matches in rankings for doc in matches}
+        fused = reciprocal_rank_fusion([[(doc['url'], doc['chunk_number']) for doc in matches] for matches in rankings])
+        matches = [chunks[key] for key, _ in fused]
         
-        if not result.data:
-            return []
+        if not matches:
+            return "No relevant documentation found."
             
-        # Extract unique URLs
-        urls = sorted(set(doc['url'] for doc in result.data))
-        return urls
+        return format_documentation_chunks(pack_chunks(user_queries, matches))
+        
+    except Exception as e:
+        print(f"Error retrieving documentation: {e}")
+        return f"Error retrieving documentation: {str(e)}"
+
+@mcp_documentation.tool()
+async def list_documentation_pages(path_prefix: str = "", offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+    """
+    Retrieve a page of the available Encompass Developer Connect documentation pages.
+    
+    Args:
+        path_prefix: Only list pages whose URL path starts with this, e.g. /developer-connect/reference/
+        offset: Number of pages to skip, to page through the list
+        limit: Maximum number of pages to return (at most 500)
+        
+    Returns:
+        Dict[str, Any]: Total number of matching pages, and the url, title and chunk count of each page
+    """
+    try:
+        # Read the page catalog maintained by the crawler, cached until the next re-crawl
+        return await run_blocking(page_catalog.list_pages, supabase, path_prefix, offset, min(limit, 500))
         
     except Exception as e:
         print(f"Error retrieving documentation pages: {e}")
-        return []
+        return {"total": 0, "offset": offset, "pages": []}
 
 @mcp_documentation.tool()
-async def get_page_content(url: str) -> str:
+async def get_page_content(url: str, section: str = "", offset: int = 0, limit: Optional[int] = None) -> str:
     """
-    Retrieve the full content of a specific documentation page by combining all its chunks.
+    Retrieve the content of a specific documentation page by combining all its chunks.
     
     Args:
         url: The URL of the page to retrieve
+        section: Only return the section under the first heading containing this text
+        offset: Character offset to start from, to continue a truncated result
+        limit: Maximum number of characters to return (the whole page or section when omitted)
         
     Returns:
-        str: The complete page content with all chunks combined in order
+        str: The page content with all chunks combined in order, or the requested part of it
     """
     try:
-        # Query Supabase for all chunks of this URL, ordered by chunk_number
-        result = supabase.from_('site_pages') \
-            .select('title, content, chunk_number') \
-            .eq('url', url) \
-            .eq('metadata->>source', 'encompass_devconnect_docs') \
-            .order('chunk_number') \
-            .execute()
+        # Assembled pages are cached until the page is re-crawled
+        page = await run_blocking(page_content_cache.get_page, supabase, url)
         
-        if not result.data:
+        if page is None:
             return f"No content found for URL: {url}"
             
-        # Format the page with its title and all chunks
-        page_title = result.data[0]['title'].split(' - ')[0]  # Get the main title
-        formatted_content = [f"# {page_title}\n"]
-        
-        # Add each chunk's content
-        for chunk in result.data:
-            formatted_content.append(chunk['content'])
-            
-        # Join everything together
-        return "\n\n".join(formatted_content)
+        return select_page_content(page, section, offset, limit)
         
     except Exception as e:
         print(f"Error retrieving page content: {e}")
         return f"Error retrieving page content: {str(e)}"
     
-async def get_embedding(text: str) -> List[float]:
-    """Get embedding vector from OpenAI."""
+async def match_documentation(user_queries: List[str], query_embeddings: List[List[float]], match_count: int = 5) -> List[List[Dict[str, Any]]]:
+    """Top documentation chunks for each query, from the local index when enabled, otherwise match_site_pages."""
+    if vector_index is not None:
+        # Search the in-process copy of site_pages, by vector and keyword, instead of calling the RPC
+        await run_blocking(vector_index.refresh_if_stale, supabase)
+        if len(vector_index):
+            return vector_index.hybrid_search_many(user_queries, query_embeddings, match_count, filter={'source': 'encompass_devconnect_docs'})
+
+    async def match_site_pages(query_embedding: List[float]) -> List[Dict[str, Any]]:
+        # Query Supabase for relevant documents
+        result = await execute(supabase.rpc(
+            # This is a custom RPC function to match documents
+            # Ensure this function is defined in your Supabase database
+            'match_site_pages', 
+            {
+                'query_embedding': query_embedding,
+                'match_count': match_count,
+                # Filter by source 
+                # This assumes you have a metadata field in your site_pages table
+                # that contains the source information 
+                # crawl metadata
+                # 'metadata': {'source': 'encompass_devconnect_docs'}
+                'filter': {'source': 'encompass_devconnect_docs'} 
+                
+            }
+        ))
+        return result.data
+
+    # One RPC per query, all in flight at once
+    return await asyncio.gather(*[match_site_pages(embedding) for embedding in query_embeddings])
+
+def format_documentation_chunks(matches: List[Dict[str, Any]]) -> str:
+    """Format retrieved chunks for the model."""
+    formatted_chunks = []
+    for doc in matches:
+        chunk_text = f"""
+# {doc['title']}
+
+{doc['content']}
+"""
+        formatted_chunks.append(chunk_text)
+        
+    # Join all chunks with a separator
+    return "\n\n---\n\n".join(formatted_chunks)
+
+async def get_embeddings(texts: List[str]) -> List[List[float]]:
+    """Get embedding vectors for several texts in one OpenAI request, using the on-disk cache when possible."""
     try:
-        response = await openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
-        )
-        return response.data[0].embedding
+        vectors = await embedding_cache.aget_many(EMBEDDING_MODEL, texts, EMBEDDING_DIMENSIONS)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            response = await openai_client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=missing,
+                **({"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {})
+            )
+            fetched = {missing[item.index]: item.embedding for item in response.data}
+            await embedding_cache.aput_many(EMBEDDING_MODEL, list(fetched.items()), EMBEDDING_DIMENSIONS)
+            vectors = [vector if vector is not None else fetched[text] for text, vector in zip(texts, vectors)]
+        return vectors
     except Exception as e:
         print(f"Error getting embedding: {e}")
-        return [0] * 1536  # Return zero vector on error
+        raise  # A zero vector would rank chunks meaninglessly, so let the tool report the error
+
+async def get_embedding(text: str) -> List[float]:
+    """Get embedding vector from OpenAI, using the on-disk cache when possible."""
+    return (await get_embeddings([text]))[0]
     
 
 # if __name__=="__main__":
@@ -1,33 +1,65 @@
 # from mcp.server.fastmcp import FastMCP
 from fastmcp import FastMCP
 
-import requests
 import os
+import asyncio
 import datetime 
 import json
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from encompass_http_client import request
+from encompass_loan_replica import LoanReplica
+from encompass_pipeline_cache import PipelineQueryCache
+from encompass_pipeline_reader import read_pipeline_loans
+from encompass_token_manager import token_manager
+
+# Loan limits above this are paged through a cursor instead of one request
+PIPELINE_PAGE_SIZE = int(os.getenv("ENCOMPASS_PIPELINE_PAGE_SIZE", "1000"))
+
 mcp_getloans=FastMCP("FetchEncompassLoans")
 
+# Loan pipeline responses, keyed by the normalized filter, fields and limit
+pipeline_cache = PipelineQueryCache()
+
+# Local mirror of the loan pipeline (ENCOMPASS_LOAN_REPLICA_PATH), kept current by encompass_loan_replica.py
+loan_replica = LoanReplica.from_env()
+
 @mcp_getloans.tool()
-async def get_encompass_loans(pipeline_api_url: str, access_token: str, filter_criteria_json: str, loan_limit: int) -> str:
+async def get_encompass_loans(pipeline_api_url: str, filter_criteria_json: str, loan_limit: int, access_token: str = "") -> str:
     """
     Determine the appropriate http request and return json response
     
     Args:
         pipeline_api_url: api url for which the HTTP request need to be made
-        access_token: auth token to access api
         filter_criteria_json: the filter json that will be used to filter the loans
         loan_limit: number of loans that need to fetched and sent in api request url
+        access_token: optional auth token; a cached token is used when empty
 
     Returns:
         str: http request response in JSON format
     """
     try:
         # access_token = await get_encompass_access_token(ctx)
-        responsejson = await make_pipeline_api_call(access_token, pipeline_api_url, json.loads(filter_criteria_json), loan_limit)
+        filter_criteria = json.loads(filter_criteria_json)
+
+        # Answered locally when the loan replica is enabled, fresh and holds every field the query uses
+        # (the replica and the cache only hold what the managed token can see)
+        if loan_replica is not None and not access_token:
+            # SQLite is blocking, so it runs off the event loop like the Supabase calls
+            loans = await asyncio.to_thread(loan_replica.query, filter_criteria, loan_limit)
+            if loans is not None:
+                return loans
+
+        # Repeated queries are answered from the cache until it expires or loans change
+        responsejson = await pipeline_cache.get_or_fetch(
+            filter_criteria,
+            loan_limit,
+            lambda: make_pipeline_api_call(access_token, pipeline_api_url, filter_criteria, loan_limit),
+            api_url=pipeline_api_url,
+            access_token=access_token
+        )
         return responsejson
     
     except Exception as e:
@@ -39,7 +71,7 @@ async def make_pipeline_api_call(encompass_access_token: str, api_url: str, filt
     Make the actual api call and get the response
     
     Args:
-        encompass_access_token: api access / auth token
+        encompass_access_token: api access / auth token, or empty for the cached token
         api_url: api url for which the HTTP request need to be made
         filter_criteria_json: the filter json that will be used to filter the loans
         loan_limit: number of loans that need to fetched and sent in api request url
@@ -51,6 +83,15 @@ async def make_pipeline_api_call(encompass_access_token: str, api_url: str, filt
         # Define the API endpoint
         url = f"{api_url}{loan_limit}"
 
+        # Large requests are read a page at a time through a pipeline cursor on the same endpoint
+        if loan_limit > PIPELINE_PAGE_SIZE:
+            return await read_pipeline_loans(filter_criteria_json, loan_limit, access_token=encompass_access_token,
+                                             url=api_url.split("?")[0])
+
+        # Fall back to the managed token when the caller has none
+        managed_token = not encompass_access_token
+        encompass_access_token = encompass_access_token or await token_manager.get_token()
+
         # Set your headers (replace 'YOUR_ACCESS_TOKEN' with your actual access token)
         headers = {
             "Authorization": f"Bearer {encompass_access_token}",
@@ -62,7 +103,14 @@ async def make_pipeline_api_call(encompass_access_token: str, api_url: str, filt
         # print(f"make_pipeline_api_call - payload: {filter_criteria_json}")
 
         # Make the POST request
-        response = requests.post(url, headers=headers, json=filter_criteria_json)
+        response = await request("POST", url, headers=headers, json=filter_criteria_json)
+
+        # An expired or stale managed token gets one retry with a fresh one; a 401 on the
+        # caller's own token goes back to the caller rather than running under the managed identity
+        if response.status_code == 401 and managed_token:
+            token_manager.invalidate(encompass_access_token)
+            headers["Authorization"] = f"Bearer {await token_manager.get_token()}"
+            response = await request("POST", url, headers=headers, json=filter_criteria_json)
 
         # Check the response
         if response.status_code == 200:
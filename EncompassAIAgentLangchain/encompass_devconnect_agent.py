@@ -105,7 +105,7 @@ class EncompassDevConnectAgent():
         system_prompt = """
         You are an expert at Encompass Developer Connect API Catalog, and expert in retrieving loan data by making API calls to get loan pipeline.
 
-        If user requests for loans based on match criteria, first identify appropriate api url based on documentation, second retrieve bearer access_token, third build the filter json payload based on documentation, then finally make API call and respond with JSON data.
+        If user requests for loans based on match criteria, first identify appropriate api url based on documentation, second build the filter json payload based on documentation, then finally make API call and respond with JSON data. The bearer access_token is added to the API call automatically, so don't retrieve one first.
         
         When user asks for Investment property or Primary home or Secondary home add field Fields.1811 to the filter appropriately.
         
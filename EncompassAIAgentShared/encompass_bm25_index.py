@@ -0,0 +1,82 @@
+import re
+import math
+
+from collections import Counter
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+
+# Keeps identifiers like Fields.1109, Loan.LastModified and v3-create-cursor whole
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._#/-][a-z0-9]+)*")
+SEPARATOR_RE = re.compile(r"[._#/-]")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers are indexed whole and by their parts."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if SEPARATOR_RE.search(token):
+            tokens.extend(part for part in SEPARATOR_RE.split(token) if part)
+    return tokens
+
+class BM25Index:
+    """
+    Compact inverted index over a fixed list of documents, scored with Okapi BM25.
+
+    Each term's postings are two numpy arrays (document positions and term
+    frequencies), so scoring a query is a handful of vectorized adds. The index is
+    rebuilt from scratch whenever the documents change.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.document_count = len(documents)
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for position, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((position, count))
+
+        self._lengths = lengths
+        self._average_length = float(lengths.mean()) if len(documents) else 0.0
+        self._postings = {
+            term: (np.array([p for p, _ in entries], dtype=np.int32), np.array([c for _, c in entries], dtype=np.float32))
+            for term, entries in postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        scores = np.zeros(self.document_count, dtype=np.float32)
+        if not self.document_count:
+            return scores
+        norms = self.k1 * (1 - self.b + self.b * self._lengths / max(self._average_length, 1.0))
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            positions, frequencies = self._postings[term]
+            idf = math.log(1 + (self.document_count - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * frequencies * (self.k1 + 1) / (frequencies + norms[positions])
+        return scores
+
+    def top(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Positions and scores of the k best matching documents, best first."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(k, len(matched))
+        best = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [(int(position), float(scores[position])) for position in best]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = 60) -> List[Tuple[Hashable, float]]:
+    """Fuse ranked lists of ids: each list adds 1 / (k + rank) to every id in it."""
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda entry: entry[1], reverse=True)
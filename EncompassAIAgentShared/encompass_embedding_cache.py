@@ -0,0 +1,153 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed embedding cache stored in SQLite.
+
+    Vectors are keyed by sha256(model, dimensions, text) and stored as float32 blobs, so the
+    crawler, the Streamlit agent and the documentation MCP server can share one
+    cache file: EMBEDDING_CACHE_PATH, or embedding_cache.sqlite3 next to this module
+    regardless of the working directory. Once more than max_entries vectors are
+    stored, the least recently used ones are evicted.
+
+    Lookups only read; the last-used times of hits are kept in memory and written
+    in one batch with the next put, eviction or every touch_flush_size hits. From
+    async code use aget_many/aput_many, which run in a worker thread.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None,
+                 touch_flush_size: int = 1000):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH") or DEFAULT_PATH
+        self.max_entries = max_entries or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+        self.touch_flush_size = touch_flush_size
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            create table if not exists embeddings (
+                key text primary key,
+                vector blob not null,
+                last_used real not null
+            )
+        """)
+        self._conn.execute("create index if not exists idx_embeddings_last_used on embeddings (last_used)")
+        self._conn.commit()
+
+        self._touched: Dict[str, float] = {}
+        self._writes_since_eviction = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, text: str, dimensions: Optional[int] = None) -> str:
+        """Content address for a text embedded with a given model (and reduced dimensions, if any)."""
+        if dimensions:
+            return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str], dimensions: Optional[int] = None) -> List[Optional[List[float]]]:
+        """Look up cached vectors for texts, returning None for misses."""
+        keys = [self.make_key(model, text, dimensions) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"select key, vector from embeddings where key in ({placeholders})", batch
+                ).fetchall())
+            now = time.time()
+            for key in found:
+                self._touched[key] = now
+            if len(self._touched) >= self.touch_flush_size:
+                self._flush_touched()
+                self._conn.commit()
+
+        vectors = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                self.misses += 1
+                vectors.append(None)
+            else:
+                self.hits += 1
+                vector = array("f")
+                vector.frombytes(blob)
+                vectors.append(vector.tolist())
+        return vectors
+
+    def get(self, model: str, text: str, dimensions: Optional[int] = None) -> Optional[List[float]]:
+        """Look up a single cached vector."""
+        return self.get_many(model, [text], dimensions)[0]
+
+    async def aget_many(self, model: str, texts: Sequence[str], dimensions: Optional[int] = None) -> List[Optional[List[float]]]:
+        """get_many without blocking the event loop."""
+        return await asyncio.to_thread(self.get_many, model, texts, dimensions)
+
+    async def aget(self, model: str, text: str, dimensions: Optional[int] = None) -> Optional[List[float]]:
+        """get without blocking the event loop."""
+        return (await self.aget_many(model, [text], dimensions))[0]
+
+    def put_many(self, model: str, items: Sequence[Tuple[str, List[float]]], dimensions: Optional[int] = None):
+        """Store vectors for (text, vector) pairs."""
+        now = time.time()
+        rows = [(self.make_key(model, text, dimensions), array("f", vector).tobytes(), now) for text, vector in items]
+        with self._lock:
+            self._flush_touched()
+            self._conn.executemany(
+                "insert or replace into embeddings (key, vector, last_used) values (?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._writes_since_eviction += len(rows)
+            if self._writes_since_eviction >= 1000:
+                self._evict()
+
+    def put(self, model: str, text: str, vector: List[float], dimensions: Optional[int] = None):
+        """Store a single vector."""
+        self.put_many(model, [(text, vector)], dimensions)
+
+    async def aput_many(self, model: str, items: Sequence[Tuple[str, List[float]]], dimensions: Optional[int] = None):
+        """put_many without blocking the event loop."""
+        await asyncio.to_thread(self.put_many, model, items, dimensions)
+
+    def _flush_touched(self):
+        """Write the buffered last-used times of cache hits (caller holds the lock and commits)."""
+        if not self._touched:
+            return
+        touched = self._touched
+        self._touched = {}
+        self._conn.executemany("update embeddings set last_used = ? where key = ?",
+                               [(used, key) for key, used in touched.items()])
+
+    def _evict(self):
+        """Drop least recently used vectors beyond max_entries (caller holds the lock)."""
+        self._writes_since_eviction = 0
+        count = self._conn.execute("select count(*) from embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% so eviction doesn't run on every write
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "delete from embeddings where key in (select key from embeddings order by last_used limit ?)",
+            (excess,)
+        )
+        self._conn.commit()
+        print(f"Evicted {excess} embeddings from cache")
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,262 @@
+import re
+import time
+import random
+import asyncio
+
+from typing import Any, Dict, List, Optional, Tuple
+
+# tiktoken gives exact token counts when installed, otherwise fall back to ~4 chars per token
+# (rounded up, so the estimate of joined texts never exceeds the sum of their estimates)
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+def estimate_tokens(text: str) -> int:
+    """Count (or estimate) the number of embedding tokens in text."""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, -(-len(text) // 4))
+
+class EmbeddingError(Exception):
+    """A text could not be embedded, even after retries."""
+
+# Responses that reject the input itself; a batch failing with one is split to find the bad text
+INPUT_ERROR_STATUSES = (400, 413, 422)
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+def parse_duration(value: str) -> float:
+    """Parse rate-limit reset values such as '20ms', '1s' or '6m0s' into seconds."""
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in DURATION_RE.findall(value or ""))
+
+def retry_after_seconds(headers: Any) -> Optional[float]:
+    """Read how long the API asked us to wait from retry-after headers."""
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent embeddings requests.
+
+    The limit grows by one request after every `limit` successes and is halved
+    on a rate-limit response. When rate-limit headers say the request or token
+    budget is used up (or give a retry-after), no new request starts until the
+    reset time.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self._active = 0
+        self._condition = asyncio.Condition()
+        self._paused_until = 0.0
+
+    async def acquire(self):
+        async with self._condition:
+            while self._active >= int(self.limit):
+                await self._condition.wait()
+            self._active += 1
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def on_success(self, headers: Any = None):
+        """Additive increase, then respect any exhausted budget in the response headers."""
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        if not headers:
+            return
+        for budget in ("requests", "tokens"):
+            if headers.get(f"x-ratelimit-remaining-{budget}") == "0":
+                self.pause(parse_duration(headers.get(f"x-ratelimit-reset-{budget}", "")))
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease, pausing new requests for retry_after seconds."""
+        self.limit = max(self.minimum, self.limit / 2)
+        if retry_after:
+            self.pause(retry_after)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class EmbeddingBatcher:
+    """
+    Gather texts from concurrent callers into token-bounded embeddings requests.
+
+    The embeddings API accepts a list input, so chunks from many documents are
+    collected and sent together. A batch is flushed when it reaches max_batch_tokens
+    or max_batch_size, or flush_interval seconds after its first text was queued.
+    Each caller awaits the vector for its own text. When a cache is given, it is
+    consulted before queueing a text and populated with every new vector.
+
+    Requests go through an AdaptiveConcurrencyLimiter and transient failures are
+    retried with jittered exponential backoff. When a text still can't be
+    embedded, its caller gets an EmbeddingError instead of a vector; a batch
+    rejected as invalid (400, 413, 422) is split in half to isolate the bad text,
+    while other client errors (401, 403, 404) fail the whole batch at once.
+
+    dimensions, when given, asks the model for shortened vectors (text-embedding-3
+    models only); the cache keeps them apart from full-size vectors.
+    """
+
+    def __init__(self, openai_client, model: str, max_batch_tokens: int = 100_000,
+                 max_batch_size: int = 256, flush_interval: float = 0.05, cache=None,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None, max_retries: int = 6,
+                 backoff_base: float = 0.5, backoff_cap: float = 60.0, dimensions: Optional[int] = None):
+        # Retries are handled here, so turn off the client's own retry loop
+        self.openai_client = openai_client.with_options(max_retries=0) if hasattr(openai_client, "with_options") else openai_client
+        self.model = model
+        self.dimensions = dimensions
+        self.cache = cache
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._flush_handle = None
+        self._in_flight = set()
+
+        # Counters reported at the end of a crawl
+        self.request_count = 0
+        self.text_count = 0
+        self.cache_hits = 0
+        self.retry_count = 0
+        self.failed_count = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Queue text for the next batch and wait for its embedding vector."""
+        if self.cache is not None:
+            cached = await self.cache.aget(self.model, text, self.dimensions)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = estimate_tokens(text)
+
+        # Don't let this text push the current batch over the token bound
+        if self._pending and self._pending_tokens + tokens > self.max_batch_tokens:
+            self._flush()
+
+        self._pending.append((text, future))
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= self.max_batch_size or self._pending_tokens >= self.max_batch_tokens:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Send the pending batch without waiting for the response."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+
+        task = asyncio.ensure_future(self._send(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _create(self, texts: List[str]) -> Tuple[Any, Dict[str, str]]:
+        """Call the embeddings API, returning the parsed response and its headers."""
+        embeddings = self.openai_client.embeddings
+        options = {"dimensions": self.dimensions} if self.dimensions else {}
+        if hasattr(embeddings, "with_raw_response"):
+            raw = await embeddings.with_raw_response.create(model=self.model, input=texts, **options)
+            return raw.parse(), raw.headers
+        return await embeddings.create(model=self.model, input=texts, **options), {}
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]):
+        """Embed one batch, with retries, and resolve each caller's future with its vector."""
+        texts = [text for text, _ in batch]
+        response = None
+        error = None
+        invalid = False
+        fatal = False
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            await self.limiter.acquire()
+            try:
+                response, headers = await self._create(texts)
+                self.limiter.on_success(headers)
+            except Exception as e:
+                error = e
+                status = getattr(e, "status_code", None)
+                retry_after = retry_after_seconds(getattr(getattr(e, "response", None), "headers", None))
+                if status == 429:
+                    self.limiter.on_rate_limited(retry_after)
+                elif status in INPUT_ERROR_STATUSES:
+                    invalid = True  # Retrying the same input won't help
+                elif status is not None and 400 <= status < 500 and status not in (408, 409):
+                    fatal = True  # Bad key, no access or unknown model: no text in the batch can succeed
+            finally:
+                await self.limiter.release()
+
+            if response is not None or invalid or fatal:
+                break
+            if attempt < self.max_retries:
+                self.retry_count += 1
+                # Full jitter, but never sooner than the server asked for
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                await asyncio.sleep(max(delay, retry_after or 0))
+
+        # Split an invalid batch to isolate the text the API rejected
+        if invalid and len(batch) > 1:
+            middle = len(batch) // 2
+            await asyncio.gather(self._send(batch[:middle]), self._send(batch[middle:]))
+            return
+
+        if response is None:
+            print(f"Error getting embeddings for batch of {len(texts)}: {error}")
+            self.failed_count += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(EmbeddingError(str(error)))
+            return
+
+        self.request_count += 1
+        self.text_count += len(texts)
+
+        # Map vectors back to callers by their position in the input list
+        for item in response.data:
+            future = batch[item.index][1]
+            if not future.done():
+                future.set_result(item.embedding)
+
+        if self.cache is not None:
+            await self.cache.aput_many(self.model, [(texts[item.index], item.embedding) for item in response.data], self.dimensions)
+
+    async def aclose(self):
+        """Flush anything still pending and wait for in-flight batches."""
+        self._flush()
+        while self._in_flight:
+            await asyncio.gather(*list(self._in_flight))
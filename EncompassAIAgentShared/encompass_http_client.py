@@ -0,0 +1,111 @@
+import os
+import atexit
+import asyncio
+import threading
+import concurrent.futures
+
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import h2  # noqa: F401  httpx only speaks HTTP/2 when h2 is installed
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class _HttpLoop:
+    """
+    A background event loop thread that owns the pooled client and per-host semaphores.
+
+    Connections can't move between event loops, and Streamlit runs a new one per
+    rerun, so every request is sent from this one loop instead: the pool, and the
+    per-host limit, are shared by the whole process.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="encompass-http", daemon=True)
+        self.thread.start()
+        self.client = asyncio.run_coroutine_threadsafe(self._create_client(), self.loop).result()
+        self.per_host = int(os.getenv("ENCOMPASS_HTTP_PER_HOST_CONCURRENCY", "8"))
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def _create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and os.getenv("ENCOMPASS_HTTP2", "true").lower() != "false",
+            timeout=httpx.Timeout(
+                float(os.getenv("ENCOMPASS_HTTP_TIMEOUT_SECONDS", "60")),
+                connect=float(os.getenv("ENCOMPASS_HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+            ),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("ENCOMPASS_HTTP_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("ENCOMPASS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10")),
+                keepalive_expiry=30.0
+            )
+        )
+
+    def semaphore(self, url: str) -> asyncio.Semaphore:
+        # Only called on self.loop, so no lock is needed
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.semaphores[host]
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        async with self.semaphore(url):
+            return await self.client.request(method, url, **kwargs)
+
+    def submit(self, method: str, url: str, **kwargs) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), self.loop)
+
+    def close(self):
+        """Close the client and stop the loop thread."""
+        if self.loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result(timeout=10)
+        except Exception as e:
+            print(f"Error closing HTTP client: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+        self.loop.close()
+
+_http_loop: Optional[_HttpLoop] = None
+_http_loop_lock = threading.Lock()
+
+def _get_http_loop() -> _HttpLoop:
+    global _http_loop
+    with _http_loop_lock:
+        if _http_loop is None:
+            _http_loop = _HttpLoop()
+        return _http_loop
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request on the process-wide pooled client.
+
+    Connections are kept alive and reused (HTTP/2 when h2 is installed, unless
+    ENCOMPASS_HTTP2=false). Pool size and timeouts come from
+    ENCOMPASS_HTTP_MAX_CONNECTIONS, ENCOMPASS_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    ENCOMPASS_HTTP_TIMEOUT_SECONDS and ENCOMPASS_HTTP_CONNECT_TIMEOUT_SECONDS.
+    At most ENCOMPASS_HTTP_PER_HOST_CONCURRENCY (default 8) requests per host
+    are in flight at once across all event loops and threads; further requests
+    wait their turn without blocking the caller's event loop.
+    """
+    return await asyncio.wrap_future(_get_http_loop().submit(method, url, **kwargs))
+
+def close():
+    """Close the shared client and stop its loop thread; the next request starts a new one."""
+    global _http_loop
+    with _http_loop_lock:
+        http_loop, _http_loop = _http_loop, None
+    if http_loop is not None:
+        http_loop.close()
+
+atexit.register(close)
@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import argparse
+import threading
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from encompass_pipeline_reader import PipelineReader
+
+load_dotenv()
+
+# The fields the agent always requests (see the system prompt), plus the sync watermark
+REPLICA_FIELDS = [
+    "Fields.GUID",
+    "Fields.364",
+    "Loan.BorrowerName",
+    "Fields.1109",
+    "Fields.1393",
+    "Fields.LOANLASTMODIFIED",
+    "Fields.1172",
+    "Fields.1811",
+    "Fields.2853",
+    "Fields.1041",
+    "Loan.LastModified"
+]
+NUMERIC_FIELDS = {"Fields.1109", "Fields.2853"}
+DATE_FIELDS = {"Fields.LOANLASTMODIFIED", "Loan.LastModified"}
+WATERMARK_FIELD = "Loan.LastModified"
+
+# Bumped whenever the way values are stored changes; an older replica is rebuilt
+SCHEMA_VERSION = "2"
+
+COMPARISONS = {
+    "greaterthan": ">",
+    "greaterthanorequals": ">=",
+    "lessthan": "<",
+    "lessthanorequals": "<=",
+    "exact": "=",
+    "equals": "=",
+    "notequals": "!="
+}
+EQUALITY = {"exact", "equals", "notequals"}
+
+# How many characters of an ISO timestamp each date precision compares
+PRECISIONS = {"": 19, "exact": 19, "minute": 16, "hour": 13, "day": 10, "month": 7, "year": 4}
+
+class UnsupportedQuery(ValueError):
+    """The replica can't answer this pipeline query; ask the live API instead."""
+
+def _column(field: str) -> str:
+    return f'"{field}"'
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(str(value).replace(",", ""))
+
+def _timestamp(value: Any) -> Optional[str]:
+    """Pipeline date/time values as sortable ISO 8601 UTC text; None when empty or not a date."""
+    if not value:
+        return None
+    text = str(value).strip()
+    for parse in (
+        lambda t: datetime.fromisoformat(t.replace("Z", "+00:00")),
+        lambda t: datetime.strptime(t, "%m/%d/%Y %I:%M:%S %p"),
+        lambda t: datetime.strptime(t, "%m/%d/%Y")
+    ):
+        try:
+            parsed = parse(text)
+        except ValueError:
+            continue
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed.isoformat(timespec="seconds")
+    return None
+
+class LoanReplica:
+    """
+    Local SQLite mirror of the loan pipeline, for the fields the agent asks for.
+
+    Each mirrored field is its own typed, indexed column (numbers as REAL, dates
+    as ISO 8601 UTC text, everything else as TEXT), so filters and sorts run on
+    plain indexed columns; the values exactly as the API returned them are kept
+    alongside as JSON, and that is what query() returns. Range comparisons are
+    only answered on number and date fields, since comparing other text would
+    not match the API. sync() pulls only the loans whose Loan.LastModified is at
+    or after the stored watermark, page by page through a pipeline cursor, and
+    advances the watermark as each page is committed, so an interrupted sync
+    resumes where it stopped. Deleted loans don't show up in an incremental sync;
+    sync(full=True) re-reads everything and drops loans that are gone.
+
+    query() answers get_encompass_loans from the mirror, returning None when the
+    replica is older than max_age seconds or the query uses fields, match types
+    or options it doesn't cover, so the caller falls back to the live API.
+    """
+
+    def __init__(self, path: Optional[str] = None, fields: Optional[List[str]] = None, max_age: Optional[float] = None):
+        self.path = path or os.getenv("ENCOMPASS_LOAN_REPLICA_PATH", "loan_replica.sqlite3")
+        self.fields = fields or REPLICA_FIELDS
+        if WATERMARK_FIELD not in self.fields:
+            self.fields = self.fields + [WATERMARK_FIELD]
+        self.max_age = max_age if max_age is not None else float(os.getenv("ENCOMPASS_LOAN_REPLICA_MAX_AGE_SECONDS", "900"))
+        self._by_name = {field.lower(): field for field in self.fields}
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("create table if not exists replica_state (key text primary key, value text)")
+        if self._state("schema") != SCHEMA_VERSION:
+            # Stored values can't be converted in place; start over with a full sync
+            self._conn.execute("drop table if exists loans")
+            self._set_state("schema", SCHEMA_VERSION)
+            self._set_state("watermark", "")
+            self._set_state("synced_at", "")
+        self._conn.execute("create table if not exists loans (loan_guid text primary key, fields_json text)")
+        existing = {row[1] for row in self._conn.execute("pragma table_info(loans)")} - {"fields_json"}
+        added = [field for field in self.fields if field not in existing]
+        for field in added:
+            self._conn.execute(f"alter table loans add column {_column(field)} {'real' if field in NUMERIC_FIELDS else 'text'}")
+            self._conn.execute(f"create index if not exists {_column('loans_' + field)} on loans ({_column(field)})")
+        if added and len(existing) > 1:
+            # New columns are empty for every stored loan, so the next sync starts over
+            self._set_state("watermark", "")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["LoanReplica"]:
+        """A replica when ENCOMPASS_LOAN_REPLICA_PATH is set; None otherwise."""
+        if not os.getenv("ENCOMPASS_LOAN_REPLICA_PATH"):
+            return None
+        return cls()
+
+    def _state(self, key: str) -> str:
+        row = self._conn.execute("select value from replica_state where key = ?", (key,)).fetchone()
+        return row[0] if row else ""
+
+    def _set_state(self, key: str, value: str):
+        self._conn.execute(
+            "insert into replica_state (key, value) values (?, ?) on conflict (key) do update set value = excluded.value",
+            (key, value)
+        )
+
+    @property
+    def watermark(self) -> str:
+        return self._state("watermark")
+
+    def age(self) -> float:
+        """Seconds since the last completed sync (infinite before the first)."""
+        synced_at = self._state("synced_at")
+        return time.time() - float(synced_at) if synced_at else float("inf")
+
+    def _row(self, loan: Dict[str, Any]) -> Tuple:
+        fields = loan.get("fields") or {}
+        values = []
+        for field in self.fields:
+            value = fields.get(field)
+            if field in NUMERIC_FIELDS:
+                try:
+                    value = _number(value)
+                except ValueError:
+                    value = None
+            elif field in DATE_FIELDS:
+                value = _timestamp(value)
+            values.append(value if value != "" else None)
+        return (loan.get("loanGuid") or fields.get("Fields.GUID"), json.dumps(fields), *values)
+
+    def upsert(self, loans: List[Dict[str, Any]]) -> str:
+        """Write a page of pipeline loans; returns the newest Loan.LastModified among them."""
+        columns = ", ".join(_column(field) for field in self.fields)
+        placeholders = ", ".join("?" for _ in range(len(self.fields) + 2))
+        updates = ", ".join(f"{_column(field)} = excluded.{_column(field)}" for field in self.fields)
+        rows = [row for row in map(self._row, loans) if row[0]]
+        with self._lock:
+            self._conn.executemany(
+                f"insert into loans (loan_guid, fields_json, {columns}) values ({placeholders}) "
+                f"on conflict (loan_guid) do update set fields_json = excluded.fields_json, {updates}",
+                rows
+            )
+        position = 2 + self.fields.index(WATERMARK_FIELD)
+        return max((row[position] or "" for row in rows), default="")
+
+    async def sync(self, full: bool = False) -> int:
+        """Mirror loans changed since the watermark (or all loans when full); returns the number written."""
+        watermark = "" if full else self.watermark
+        reader = PipelineReader({
+            "filter": {
+                "canonicalName": WATERMARK_FIELD,
+                # The watermark is stored as naive UTC; say so, or the API may read it as local time
+                "value": f"{watermark or '1900-01-01T00:00:00'}Z",
+                # Loans modified in the same instant as the watermark are read again rather than missed
+                "matchType": "greaterThanOrEquals",
+                "precision": "exact"
+            },
+            "fields": self.fields,
+            "sortOrder": [{"canonicalName": WATERMARK_FIELD, "order": "asc"}]
+        })
+        written = 0
+        seen = set()
+        async for page in reader:
+            newest = self.upsert(page.loans)
+            if full:
+                seen.update(loan.get("loanGuid") for loan in page.loans)
+            with self._lock:
+                if not full and newest > watermark:
+                    watermark = newest
+                    self._set_state("watermark", watermark)
+                self._conn.commit()
+            written += len(page.loans)
+
+        with self._lock:
+            if full:
+                self._conn.execute("create temp table if not exists seen_loans (loan_guid text primary key)")
+                self._conn.execute("delete from seen_loans")
+                self._conn.executemany("insert or ignore into seen_loans values (?)", ((guid,) for guid in seen if guid))
+                removed = self._conn.execute("delete from loans where loan_guid not in (select loan_guid from seen_loans)").rowcount
+                if removed:
+                    print(f"Removed {removed} loans no longer in the pipeline")
+                watermark = self._conn.execute(f"select max({_column(WATERMARK_FIELD)}) from loans").fetchone()[0] or ""
+                self._set_state("watermark", watermark)
+            self._set_state("synced_at", str(time.time()))
+            self._conn.commit()
+        print(f"Synced {written} loans into the replica, watermark {watermark}")
+        return written
+
+    def _field(self, name: Any) -> str:
+        field = self._by_name.get(str(name).lower())
+        if field is None:
+            raise UnsupportedQuery(f"{name} is not in the replica")
+        return field
+
+    def _condition(self, term: Dict[str, Any], params: List[Any]) -> str:
+        """SQL for one filter term or a group of terms."""
+        term = {key.lower(): value for key, value in term.items()}
+        group = term.get("terms", term.get("conditions"))
+        if group is not None:
+            operator = str(term.get("operator", term.get("logicaloperator", "and"))).lower()
+            if operator not in ("and", "or") or not group:
+                raise UnsupportedQuery(f"Unsupported operator {operator}")
+            return "(" + f" {operator} ".join(self._condition(t, params) for t in group) + ")"
+
+        field = self._field(term.get("canonicalname"))
+        column = _column(field)
+        match_type = str(term.get("matchtype", "exact")).lower()
+        value = term.get("value")
+
+        if match_type in ("isempty", "isnotempty"):
+            empty = f"({column} is null or {column} = '')"
+            return empty if match_type == "isempty" else f"not {empty}"
+        typed = field in NUMERIC_FIELDS or field in DATE_FIELDS
+        if match_type in ("contains", "startswith"):
+            if typed:
+                raise UnsupportedQuery(f"{match_type} on {field} compares stored values, not the API's")
+            params.append(("%" if match_type == "contains" else "") + str(value) + "%")
+            return f"{column} like ?"
+        if match_type not in COMPARISONS:
+            raise UnsupportedQuery(f"Unsupported matchType {match_type}")
+
+        operator = COMPARISONS[match_type]
+        if field in NUMERIC_FIELDS:
+            try:
+                params.append(_number(value))
+            except ValueError:
+                raise UnsupportedQuery(f"{value!r} is not a number")
+            return f"{column} {operator} ?"
+        if field in DATE_FIELDS:
+            precision = str(term.get("precision", "")).lower()
+            if precision not in PRECISIONS:
+                raise UnsupportedQuery(f"Unsupported precision {precision}")
+            timestamp = _timestamp(value)
+            if timestamp is None:
+                raise UnsupportedQuery(f"{value!r} is not a date")
+            length = PRECISIONS[precision]
+            params.append(timestamp[:length])
+            return f"substr({column}, 1, {length}) {operator} ?"
+        if match_type not in EQUALITY:
+            raise UnsupportedQuery(f"{match_type} on text field {field}")
+        params.append(str(value))
+        return f"{column} {operator} ? collate nocase"
+
+    def to_sql(self, filter_criteria: Dict[str, Any], loan_limit: int) -> Tuple[str, List[Any], List[Tuple[str, str]]]:
+        """SQL, parameters and (requested name, column) pairs for a pipeline query; raises UnsupportedQuery."""
+        criteria = {key.lower(): value for key, value in filter_criteria.items()}
+        unsupported = set(criteria) - {"filter", "fields", "sortorder"}
+        if unsupported:
+            raise UnsupportedQuery(f"Unsupported options {sorted(unsupported)}")
+
+        requested = criteria.get("fields") or self.fields
+        outputs = [(name, self._field(name)) for name in requested]
+        params: List[Any] = []
+        sql = "select loan_guid, fields_json from loans"
+        if criteria.get("filter"):
+            sql += f" where {self._condition(criteria['filter'], params)}"
+        orders = []
+        for order in criteria.get("sortorder") or []:
+            order = {key.lower(): value for key, value in order.items()}
+            direction = "desc" if str(order.get("order", "asc")).lower() == "desc" else "asc"
+            orders.append(f"{_column(self._field(order.get('canonicalname')))} {direction}")
+        if orders:
+            sql += f" order by {', '.join(orders)}"
+        sql += " limit ?"
+        params.append(loan_limit)
+        return sql, params, outputs
+
+    def query(self, filter_criteria: Dict[str, Any], loan_limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Loans in the pipeline API's response shape, or None when the live API should answer instead.
+
+        Blocking; async callers run it in a worker thread (asyncio.to_thread).
+        """
+        with self._lock:
+            stale = self.age() > self.max_age
+        if stale:
+            return None
+        try:
+            sql, params, outputs = self.to_sql(filter_criteria, loan_limit)
+        except UnsupportedQuery as e:
+            print(f"Loan replica can't answer query, using the pipeline API: {e}")
+            return None
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        loans = []
+        for loan_guid, fields_json in rows:
+            fields = json.loads(fields_json or "{}")
+            loans.append({"loanGuid": loan_guid, "fields": {name: fields.get(field, "") for name, field in outputs}})
+        return loans
+
+async def main():
+    parser = argparse.ArgumentParser(description="Mirror the loan pipeline into the local replica")
+    parser.add_argument("--full", action="store_true", help="re-read every loan and drop deleted ones")
+    parser.add_argument("--every", type=float, default=0, help="keep syncing, this many seconds apart")
+    args = parser.parse_args()
+
+    replica = LoanReplica()
+    while True:
+        try:
+            await replica.sync(full=args.full)
+        except Exception as e:
+            print(f"Error syncing loan replica: {e}")
+        if not args.every:
+            break
+        args.full = False
+        await asyncio.sleep(args.every)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import re
+import threading
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})", re.MULTILINE)
+
+def _headings(page: str) -> List[re.Match]:
+    """Heading lines of a page, leaving out '#' lines inside code fences (shell or Python comments)."""
+    fenced = []
+    fence = None
+    for match in FENCE_RE.finditer(page):
+        marker = match.group(1)
+        if fence is None:
+            fence = (marker, match.start())
+        elif marker[0] == fence[0][0] and len(marker) >= len(fence[0]):
+            fenced.append((fence[1], match.end()))
+            fence = None
+    if fence is not None:
+        fenced.append((fence[1], len(page)))
+    return [
+        heading for heading in HEADING_RE.finditer(page)
+        if not any(start <= heading.start() < end for start, end in fenced)
+    ]
+
+def select_page_content(page: str, section: str = "", offset: int = 0, limit: Optional[int] = None) -> str:
+    """
+    Cut the part of an assembled page the caller asked for.
+
+    section picks the first heading containing that text (case-insensitive) and
+    everything up to the next heading of the same or a higher level; offset and
+    limit then select a character range of the result. A truncated result ends
+    with a note giving the offset to continue from.
+    """
+    if section:
+        headings = _headings(page)
+        for i, heading in enumerate(headings):
+            if section.lower() in heading.group(2).lower():
+                level = len(heading.group(1))
+                end = next((h.start() for h in headings[i + 1:] if len(h.group(1)) <= level), len(page))
+                page = page[heading.start():end].rstrip()
+                break
+        else:
+            titles = [heading.group(2).strip() for heading in headings]
+            return f"No section matching '{section}'. Sections on this page: {titles}"
+
+    if not offset and limit is None:
+        return page
+    end = len(page) if limit is None else offset + limit
+    selected = page[offset:end]
+    if end < len(page):
+        selected += f"\n\n[{len(page) - end} more characters; continue with offset={end}]"
+    return selected
+
+class PageContentCache:
+    """
+    LRU cache of assembled documentation pages, keyed by URL and content version.
+
+    The version is the page's content_hash in site_page_catalog, a one-row lookup,
+    so a re-crawled page is reassembled while unchanged pages are served from
+    memory without re-reading and re-joining their chunks. The crawler writes the
+    catalog row before the page's chunks, so an assembled page is only cached when
+    all of its chunks carry that same page hash; a page read mid-crawl is returned
+    but assembled again on the next request.
+    """
+
+    def __init__(
+        self,
+        source: str = "encompass_devconnect_docs",
+        max_pages: int = 64,
+        table: str = "site_pages",
+        catalog_table: str = "site_page_catalog"
+    ):
+        self.source = source
+        self.max_pages = max_pages
+        self.table = table
+        self.catalog_table = catalog_table
+
+        self._pages: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, supabase_client, url: str) -> Tuple[Optional[str], int]:
+        """The page's catalog content_hash and chunk_count."""
+        result = supabase_client.from_(self.catalog_table) \
+            .select('content_hash, chunk_count') \
+            .eq('url', url) \
+            .limit(1) \
+            .execute()
+        if not result.data:
+            return None, 0
+        return result.data[0]['content_hash'], result.data[0]['chunk_count']
+
+    def _chunks(self, supabase_client, url: str) -> List[Dict[str, Any]]:
+        """All stored chunks of a page in order, with the page hash each was written with."""
+        result = supabase_client.from_(self.table) \
+            .select('title, content, chunk_number, page_hash:metadata->>page_hash, overlap_chars:metadata->>overlap_chars') \
+            .eq('url', url) \
+            .eq('metadata->>source', self.source) \
+            .order('chunk_number') \
+            .execute()
+        return result.data
+
+    @staticmethod
+    def _assemble(chunks: List[Dict[str, Any]]) -> str:
+        """Join all chunks of a page in order, dropping the overlap each repeats from the one before."""
+        # Format the page with its title and all chunks
+        page_title = chunks[0]['title'].split(' - ')[0]  # Get the main title
+        formatted_content = [f"# {page_title}\n"]
+        for chunk in chunks:
+            formatted_content.append(chunk['content'][int(chunk.get('overlap_chars') or 0):])
+        return "\n\n".join(formatted_content)
+
+    def get_page(self, supabase_client, url: str) -> Optional[str]:
+        """The assembled page, or None if no chunks are stored for the URL."""
+        version, chunk_count = self._version(supabase_client, url)
+        if version is not None:
+            with self._lock:
+                page = self._pages.get((url, version))
+                if page is not None:
+                    self._pages.move_to_end((url, version))
+                    self.hits += 1
+                    return page
+
+        self.misses += 1
+        chunks = self._chunks(supabase_client, url)
+        if not chunks:
+            return None
+        page = self._assemble(chunks)
+        complete = len(chunks) == chunk_count and all(chunk['page_hash'] == version for chunk in chunks)
+        if version is not None and complete:
+            with self._lock:
+                self._pages[(url, version)] = page
+                self._pages.move_to_end((url, version))
+                # Older versions of this page can never be hit again
+                for key in [key for key in self._pages if key[0] == url and key[1] != version]:
+                    del self._pages[key]
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+        return page
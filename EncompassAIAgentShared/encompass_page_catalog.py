@@ -0,0 +1,90 @@
+import re
+import time
+import threading
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# LIKE wildcards (and the escape character itself) in a path prefix are matched literally
+LIKE_SPECIAL_RE = re.compile(r"([\\%_])")
+
+def escape_like(text: str) -> str:
+    """Escape text for use in a LIKE pattern with the default backslash escape."""
+    return LIKE_SPECIAL_RE.sub(r"\\\1", text)
+
+class PageCatalog:
+    """
+    Paged, prefix-filtered reads of site_page_catalog with an in-process cache.
+
+    The crawler upserts one catalog row per page, so listing pages is a small
+    indexed query instead of a scan of every chunk in site_pages. Results are
+    cached per (path_prefix, offset, limit), at most max_entries of them with
+    the least recently used dropped first, since the prefix and paging come
+    from the model; once ttl seconds have passed the newest last_crawled is
+    checked, and the cache is dropped when a re-crawl has changed it.
+    """
+
+    def __init__(self, source: str = "encompass_devconnect_docs", ttl: float = 60.0, table: str = "site_page_catalog",
+                 max_entries: int = 128):
+        self.source = source
+        self.ttl = ttl
+        self.table = table
+        self.max_entries = max_entries
+
+        self._cache: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _check_version(self, supabase_client):
+        """Drop cached pages if the catalog changed since the last check."""
+        if time.monotonic() - self._checked_at < self.ttl:
+            return
+        result = supabase_client.from_(self.table) \
+            .select('last_crawled') \
+            .eq('source', self.source) \
+            .order('last_crawled', desc=True) \
+            .limit(1) \
+            .execute()
+        version = result.data[0]['last_crawled'] if result.data else None
+        with self._lock:
+            if version != self._version:
+                self._cache = OrderedDict()
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    def list_pages(self, supabase_client, path_prefix: str = "", offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """
+        One page of the catalog, ordered by URL path.
+
+        Returns:
+            Dict with "total" (pages matching the prefix), "offset" and "pages"
+            (url, title, chunk_count and last_crawled of each page)
+        """
+        self._check_version(supabase_client)
+        key = (path_prefix, offset, limit)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        query = supabase_client.from_(self.table) \
+            .select('url, title, chunk_count, last_crawled', count='exact') \
+            .eq('source', self.source)
+        if path_prefix:
+            query = query.like('url_path', f"{escape_like(path_prefix)}%")
+        result = query.order('url_path').range(offset, offset + limit - 1).execute()
+
+        listing = {"total": result.count, "offset": offset, "pages": result.data}
+        with self._lock:
+            self._cache[key] = listing
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return listing
+
+    def invalidate(self):
+        """Forget cached listings, e.g. right after a crawl in this process."""
+        with self._lock:
+            self._cache = OrderedDict()
+            self._checked_at = 0.0
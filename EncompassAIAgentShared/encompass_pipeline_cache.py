@@ -0,0 +1,147 @@
+import os
+import re
+import json
+import time
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from encompass_pipeline_reader import post_pipeline
+
+# Lists whose order changes the result; every other list is treated as a set
+ORDERED_KEYS = {"sortorder"}
+# Keys whose values are case-insensitive keywords; field names are left as given
+KEYWORD_KEYS = {"matchtype", "operator", "logicaloperator", "precision", "order"}
+# Leading zeros mark identifiers such as loan numbers, which stay strings
+NUMBER_RE = re.compile(r"^[+-]?(0|[1-9]\d*)(\.\d+)?$")
+
+def _normalize_value(value: Any) -> Any:
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if not NUMBER_RE.match(value.replace(",", "")):
+            return value
+        value = value.replace(",", "")
+    if isinstance(value, (int, float, str)):
+        number = float(value)
+        # "500000", 500000 and 500000.0 are the same filter value
+        return int(number) if number.is_integer() else number
+    return value
+
+def canonicalize_filter(criteria: Any, key: str = "") -> Any:
+    """
+    Normalized copy of pipeline filter criteria, used only to build cache keys.
+
+    Key names and keyword values (matchType, operators, precision, sort order)
+    are lowercased, numbers and numeric strings are unified, field lists and
+    filter terms are sorted, and sortOrder keeps its order. Field names, in
+    canonicalName and in the field list alike, are kept as given.
+    """
+    if isinstance(criteria, dict):
+        return {k.lower(): canonicalize_filter(v, k.lower()) for k, v in criteria.items()}
+    if isinstance(criteria, list):
+        items = [canonicalize_filter(item, key) for item in criteria]
+        if key in ORDERED_KEYS:
+            return items
+        return sorted({json.dumps(item, sort_keys=True): item for item in items}.values(), key=lambda item: json.dumps(item, sort_keys=True))
+    if key in KEYWORD_KEYS and isinstance(criteria, str):
+        return criteria.strip().lower()
+    return _normalize_value(criteria)
+
+def cache_key(filter_criteria: Any, loan_limit: int, api_url: str = "") -> str:
+    """Cache key for a pipeline query: canonical filter and field list, limit and endpoint."""
+    return json.dumps(
+        [canonicalize_filter(filter_criteria), loan_limit, api_url.split("?")[0].rstrip("/").lower()],
+        sort_keys=True,
+        separators=(",", ":")
+    )
+
+async def latest_modified(access_token: str = "") -> str:
+    """Loan.LastModified of the most recently modified loan in the pipeline."""
+    response = await post_pipeline({"limit": 1}, {
+        "filter": {"canonicalName": "Loan.LastModified", "value": "1900-01-01", "matchType": "greaterThan"},
+        "fields": ["Loan.LastModified"],
+        "sortOrder": [{"canonicalName": "Loan.LastModified", "order": "desc"}]
+    }, access_token=access_token)
+    loans = response.json()
+    return loans[0].get("fields", {}).get("Loan.LastModified", "") if loans else ""
+
+class PipelineQueryCache:
+    """
+    TTL cache of loan pipeline responses, keyed on the canonicalized query.
+
+    Entries live for ttl seconds (ENCOMPASS_PIPELINE_CACHE_TTL_SECONDS, default
+    300) and at most max_entries are kept, least recently used first out. When
+    watermark_interval (ENCOMPASS_PIPELINE_CACHE_WATERMARK_SECONDS) is set, the
+    newest Loan.LastModified in the pipeline is looked up at most that often and
+    the whole cache is dropped when it moves, so edited loans are not served
+    stale for the full TTL.
+
+    Only queries made with the managed token (token_manager) are cached, since
+    what a caller-supplied token may see can differ; those always go to the API.
+    Responses of more than max_loans loans (ENCOMPASS_PIPELINE_CACHE_MAX_LOANS,
+    default 1000) are not cached, so large cursor reads aren't kept in memory.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: int = 256, watermark_interval: Optional[float] = None,
+                 max_loans: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("ENCOMPASS_PIPELINE_CACHE_TTL_SECONDS", "300"))
+        self.max_entries = max_entries
+        self.max_loans = max_loans or int(os.getenv("ENCOMPASS_PIPELINE_CACHE_MAX_LOANS", "1000"))
+        self.watermark_interval = watermark_interval if watermark_interval is not None else float(os.getenv("ENCOMPASS_PIPELINE_CACHE_WATERMARK_SECONDS", "0"))
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._watermark = ""
+        self._watermark_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self._entries.clear()
+
+    async def _check_watermark(self):
+        if not self.watermark_interval or time.monotonic() - self._watermark_checked_at < self.watermark_interval:
+            return
+        self._watermark_checked_at = time.monotonic()
+        try:
+            watermark = await latest_modified()
+        except Exception as e:
+            print(f"Error checking pipeline watermark: {e}")
+            return
+        if watermark != self._watermark:
+            if self._watermark:
+                print(f"Loans modified since {self._watermark}, clearing pipeline cache")
+            self.invalidate()
+            self._watermark = watermark
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_fetch(self, filter_criteria: Any, loan_limit: int, fetch: Callable[[], Awaitable[Any]],
+                           api_url: str = "", access_token: str = "") -> Any:
+        """The cached response for the query, or fetch() and cache a successful (list) result."""
+        if access_token:
+            return await fetch()
+        await self._check_watermark()
+        key = cache_key(filter_criteria, loan_limit, api_url)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        result = await fetch()
+        # Errors come back as "" or None and are never cached
+        if isinstance(result, list) and len(result) <= self.max_loans:
+            self.put(key, result)
+        return result
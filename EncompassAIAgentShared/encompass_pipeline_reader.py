@@ -0,0 +1,162 @@
+import os
+import asyncio
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from encompass_http_client import request
+from encompass_token_manager import token_manager
+
+load_dotenv()
+
+PIPELINE_URL = "https://api.elliemae.com/encompass/v1/loanPipeline"
+
+async def post_pipeline(params: Dict[str, Any], body: Dict[str, Any], access_token: str = "", url: str = PIPELINE_URL):
+    """
+    POST a loan pipeline request; raises RuntimeError unless it succeeds.
+
+    Uses the managed token when access_token is empty. A 401 on the managed token
+    gets one retry with a fresh one; a caller's own token is never swapped for it.
+    """
+    token = access_token or await token_manager.get_token()
+    for attempt in range(2):
+        response = await request("POST", url, params=params, json=body, headers={
+            "Authorization": f"Bearer {token}",
+            "content-Type": "application/json",
+            "accept": "application/json"
+        })
+        if response.status_code != 401 or attempt or access_token:
+            break
+        token_manager.invalidate(token)
+        token = await token_manager.get_token()
+    if response.status_code != 200:
+        raise RuntimeError(f"Pipeline request failed: {response.status_code} {response.text}")
+    return response
+
+@dataclass
+class PipelinePage:
+    start: int  # Position of the first loan in the whole result
+    loans: List[Dict[str, Any]]
+
+class PipelineReader:
+    """
+    Reads a loan pipeline query a page at a time through a pipeline cursor.
+
+    The first request sends the filter with cursorType=randomAccess and returns
+    the first page along with the cursor id (X-Cursor) and the total number of
+    matches (X-Total-Count). Later pages are requested by cursor, start and limit
+    with only the field list in the body, up to prefetch of them at once. Pages
+    are yielded in order and only the pages in the prefetch window are held in
+    memory, so a consumer that handles each page and lets it go (such as the
+    loan replica sync) can stream arbitrarily large pipelines.
+
+        async for page in PipelineReader(filter_criteria):
+            ...
+    """
+
+    def __init__(
+        self,
+        filter_criteria: Dict[str, Any],
+        page_size: Optional[int] = None,
+        prefetch: Optional[int] = None,
+        max_loans: Optional[int] = None,
+        access_token: str = "",
+        url: str = PIPELINE_URL
+    ):
+        self.filter_criteria = filter_criteria
+        self.page_size = page_size or int(os.getenv("ENCOMPASS_PIPELINE_PAGE_SIZE", "1000"))
+        self.prefetch = max(1, prefetch or int(os.getenv("ENCOMPASS_PIPELINE_PREFETCH", "3")))
+        self.max_loans = max_loans
+        self.url = url
+
+        self.cursor = ""
+        self.total: Optional[int] = None
+        self.access_token = access_token
+
+    def _limit(self, start: int) -> int:
+        end = self.total if self.max_loans is None else min(self.total, self.max_loans)
+        return max(0, min(self.page_size, end - start))
+
+    async def open(self) -> PipelinePage:
+        """Create the cursor and return the first page."""
+        response = await post_pipeline(
+            {"cursorType": "randomAccess", "limit": min(self.page_size, self.max_loans or self.page_size)},
+            self.filter_criteria,
+            access_token=self.access_token,
+            url=self.url
+        )
+        self.cursor = response.headers.get("X-Cursor", "")
+        loans = response.json()
+        self.total = int(response.headers.get("X-Total-Count", len(loans)))
+        return PipelinePage(0, loans)
+
+    async def fetch_page(self, start: int) -> PipelinePage:
+        """The page of loans beginning at start, read through the open cursor."""
+        response = await post_pipeline(
+            {"cursor": self.cursor, "start": start, "limit": self._limit(start)},
+            {"fields": self.filter_criteria.get("fields", [])},
+            access_token=self.access_token,
+            url=self.url
+        )
+        return PipelinePage(start, response.json())
+
+    async def pages(self) -> AsyncIterator[PipelinePage]:
+        first = await self.open()
+        yield first
+        if not self.cursor:
+            if self._limit(len(first.loans)):
+                raise RuntimeError(f"Pipeline returned {len(first.loans)} of {self.total} loans without a cursor to read the rest")
+            return
+
+        starts = iter(range(len(first.loans), self.total, self.page_size))
+        window: deque = deque()
+        try:
+            while True:
+                # Keep up to prefetch page requests in flight ahead of the consumer
+                while len(window) < self.prefetch:
+                    start = next(starts, None)
+                    if start is None or not self._limit(start):
+                        break
+                    window.append(asyncio.create_task(self.fetch_page(start)))
+                if not window:
+                    return
+                page = await window.popleft()
+                if not page.loans:
+                    return
+                yield page
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+
+    def __aiter__(self) -> AsyncIterator[PipelinePage]:
+        return self.pages()
+
+    async def loans(self) -> AsyncIterator[Dict[str, Any]]:
+        """The matching loans one at a time, in pipeline order."""
+        async for page in self.pages():
+            for loan in page.loans:
+                yield loan
+
+async def read_pipeline_loans(filter_criteria: Dict[str, Any], loan_limit: int, access_token: str = "",
+                              url: str = PIPELINE_URL) -> List[Dict[str, Any]]:
+    """
+    Up to loan_limit loans matching the filter, read page by page through a cursor.
+
+    The loans are collected into one list, so loan_limit is capped at
+    ENCOMPASS_PIPELINE_MAX_LOANS (default 10000); iterate a PipelineReader to
+    handle more without holding them all.
+    """
+    max_loans = int(os.getenv("ENCOMPASS_PIPELINE_MAX_LOANS", "10000"))
+    if loan_limit > max_loans:
+        print(f"Reading {max_loans} of the {loan_limit} loans asked for (ENCOMPASS_PIPELINE_MAX_LOANS)")
+        loan_limit = max_loans
+    reader = PipelineReader(filter_criteria, max_loans=loan_limit, access_token=access_token, url=url)
+    loans = []
+    async for page in reader:
+        loans.extend(page.loans[:loan_limit - len(loans)])
+    print(f"Read {len(loans)} of {reader.total} loans through pipeline cursor")
+    return loans
@@ -0,0 +1,138 @@
+import os
+import re
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from encompass_bm25_index import BM25Index, tokenize
+from encompass_embeddings import estimate_tokens
+
+FENCE_RE = re.compile(r"^\s*(```|~~~)")
+HEADING_RE = re.compile(r"^#{1,6}\s")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9`\"'(\[])")
+
+def split_units(content: str, max_unit_tokens: int = 120) -> List[str]:
+    """
+    Split a chunk into packable units: paragraphs, whole code blocks and tables.
+
+    A heading is kept with the block after it, and long prose paragraphs are
+    split into sentences.
+    """
+    blocks, current, in_fence = [], [], False
+    for line in content.splitlines():
+        if FENCE_RE.match(line):
+            in_fence = not in_fence
+        if not line.strip() and not in_fence:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+
+    units, heading = [], ""
+    for block in blocks:
+        if HEADING_RE.match(block) and "\n" not in block:
+            heading = f"{heading}\n\n{block}" if heading else block
+            continue
+        is_prose = not FENCE_RE.match(block) and not block.lstrip().startswith("|")
+        if is_prose and estimate_tokens(block) > max_unit_tokens:
+            pieces = SENTENCE_RE.split(block)
+        else:
+            pieces = [block]
+        if heading:
+            pieces[0] = f"{heading}\n\n{pieces[0]}"
+            heading = ""
+        units.extend(pieces)
+    if heading:
+        units.append(heading)
+    return units
+
+def _similar(a: set, b: set, threshold: float) -> bool:
+    return bool(a) and bool(b) and len(a & b) / len(a | b) >= threshold
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """The start of text, cut to max_tokens and marked with [...]."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_tokens = max(1, max_tokens - estimate_tokens(" [...]"))
+    cut = max(1, len(text) * max_tokens // estimate_tokens(text))
+    while cut > 1 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = cut * 9 // 10
+    return text[:cut].rstrip() + " [...]"
+
+def pack_chunks(
+    queries: Sequence[str],
+    matches: List[Dict[str, Any]],
+    token_budget: Optional[int] = None,
+    duplicate_threshold: float = 0.8
+) -> List[Dict[str, Any]]:
+    """
+    Trim retrieved chunks to the parts most relevant to the queries, within a token budget.
+
+    Chunks that already fit are returned unchanged. Otherwise every chunk is split
+    into units scored by BM25 against the queries (best query wins), plus a small
+    bonus for units of higher-ranked chunks. Units that repeat one already chosen
+    (the chunker's overlap, boilerplate shared by pages) are dropped, and the rest
+    are taken by score per square-root token until the budget is spent. The most
+    relevant unit is always included, cut to the budget if it is too big. Each
+    returned chunk keeps its chosen units in their original order, with [...]
+    marking gaps. The budget defaults to RETRIEVAL_TOKEN_BUDGET (2000 tokens).
+    """
+    budget = token_budget or int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "2000"))
+    headers = [estimate_tokens(doc.get("title") or "") + 4 for doc in matches]
+    if sum(headers) + sum(estimate_tokens(doc["content"]) for doc in matches) <= budget:
+        return matches
+
+    units = [(rank, position, text) for rank, doc in enumerate(matches) for position, text in enumerate(split_units(doc["content"]))]
+    if not units:
+        return matches
+
+    index = BM25Index([text for _, _, text in units])
+    relevance = None
+    for query in queries:
+        scores = index.scores(query)
+        relevance = scores if relevance is None else relevance.clip(min=scores)
+    top = float(relevance.max()) or 1.0
+
+    candidates = []
+    for (rank, position, text), score in zip(units, relevance):
+        tokens = estimate_tokens(text)
+        value = float(score) / top + 0.25 / (rank + 1)
+        candidates.append((value / tokens ** 0.5, value, rank, position, text, tokens))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    chosen: Dict[int, List[int]] = {}
+    texts: Dict[tuple, str] = {}
+    seen: List[set] = []
+    spent = 0
+    for _, _, rank, position, text, tokens in candidates:
+        cost = tokens + (0 if rank in chosen else headers[rank])
+        if spent + cost > budget:
+            continue
+        terms = set(tokenize(text))
+        if any(_similar(terms, other, duplicate_threshold) for other in seen):
+            continue
+        seen.append(terms)
+        chosen.setdefault(rank, []).append(position)
+        texts[(rank, position)] = text
+        spent += cost
+
+    # Every unit was bigger than the budget; return the best one, cut to fit
+    if not chosen:
+        _, _, rank, position, text, _ = max(candidates, key=lambda candidate: candidate[1])
+        chosen[rank] = [position]
+        texts[(rank, position)] = _truncate(text, budget - headers[rank])
+
+    packed = []
+    for rank, doc in enumerate(matches):
+        if rank not in chosen:
+            continue
+        positions = sorted(chosen[rank])
+        parts = []
+        for i, position in enumerate(positions):
+            if i and position != positions[i - 1] + 1:
+                parts.append("[...]")
+            parts.append(texts[(rank, position)])
+        packed.append({**doc, "content": "\n\n".join(parts)})
+    return packed
@@ -0,0 +1,37 @@
+import os
+import asyncio
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    The thread pool every Supabase call from async code runs in.
+
+    supabase-py is synchronous; running its calls here keeps the event loop free,
+    and the pool size (SUPABASE_MAX_CONCURRENCY, default 8) caps how many
+    requests are in flight at once. Calls beyond the cap wait in the pool's
+    queue. The clients' HTTP connection pools are shared by all its threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SUPABASE_MAX_CONCURRENCY", "8")),
+                thread_name_prefix="supabase"
+            )
+        return _executor
+
+async def run_blocking(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking function that talks to Supabase in the shared pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(fn, *args, **kwargs))
+
+async def execute(query) -> Any:
+    """Await a built supabase-py query (select, rpc, ...) without blocking the event loop."""
+    return await run_blocking(query.execute)
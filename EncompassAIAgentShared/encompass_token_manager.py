@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+
+from typing import Optional, Tuple
+
+from dotenv import load_dotenv
+
+from encompass_http_client import request
+
+load_dotenv()
+
+TOKEN_URL = "https://api.elliemae.com/oauth2/v1/token"
+
+class TokenManager:
+    """
+    Caches the Encompass OAuth access token and refreshes it before it expires.
+
+    The token is kept with its expiry (expires_in, or default_ttl when the
+    response has none). Once less than refresh_margin seconds remain, the next
+    caller starts a refresh in the background and still gets the current token;
+    callers only wait when there is no usable token. Concurrent callers share a
+    single in-flight token request.
+    """
+
+    def __init__(self, token_url: str = TOKEN_URL, refresh_margin: Optional[float] = None, default_ttl: Optional[float] = None):
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin if refresh_margin is not None else float(os.getenv("ENCOMPASS_TOKEN_REFRESH_MARGIN_SECONDS", "120"))
+        self.default_ttl = default_ttl if default_ttl is not None else float(os.getenv("ENCOMPASS_TOKEN_DEFAULT_TTL_SECONDS", "900"))
+
+        self._token = ""
+        self._expires_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+
+    def _payload(self) -> dict:
+        instance_id = os.getenv("ENCOMPASS_INSTANCE_ID")
+        return {
+            "grant_type": "password",
+            "username": f"{os.getenv('ENCOMPASS_USER_ID')}@encompass:{instance_id}", #user_name@encompass:{{encompass_instance_id}}.
+            "password": os.getenv("ENCOMPASS_USER_PWD"),
+            "client_id": os.getenv("ENCOMPASS_API_CLIENT_ID"),
+            "client_secret": os.getenv("ENCOMPASS_API_CLIENT_SECRET"),
+            "instance_id": instance_id
+        }
+
+    async def _request_token(self) -> Tuple[str, float]:
+        """Password-grant token request; returns the token and its lifetime in seconds."""
+        response = await request("POST", self.token_url, data=self._payload())
+        if response.status_code != 200:
+            raise RuntimeError(f"Token request failed: {response.status_code} {response.text}")
+        body = response.json()
+        return body["access_token"], float(body.get("expires_in") or self.default_ttl)
+
+    async def _refresh(self) -> str:
+        requested_at = time.monotonic()
+        token, lifetime = await self._request_token()
+        self._token = token
+        self._expires_at = requested_at + lifetime
+        print(f"Refreshed Encompass access token, valid for {lifetime:.0f}s")
+        return token
+
+    def _start_refresh(self) -> asyncio.Task:
+        # A task from an earlier event loop (Streamlit runs one per message) can't be awaited here
+        task = self._refreshing
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = self._refreshing = asyncio.create_task(self._refresh())
+            task.add_done_callback(self._log_refresh_error)
+        return task
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        # A background refresh has no caller to raise to, so report its failure here
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error refreshing Encompass access token: {task.exception()}")
+
+    async def get_token(self, force_refresh: bool = False) -> str:
+        """A valid access token, requesting a new one only when needed."""
+        remaining = self._expires_at - time.monotonic()
+        if self._token and remaining > 0 and not force_refresh:
+            if remaining < self.refresh_margin:
+                self._start_refresh()
+            return self._token
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self, token: str = ""):
+        """Drop the cached token (e.g. after a 401), unless it has already been replaced."""
+        if not token or token == self._token:
+            self._token = ""
+            self._expires_at = 0.0
+
+# Shared by every Encompass API call in this process
+token_manager = TokenManager()
@@ -0,0 +1,377 @@
+import os
+import json
+import time
+import threading
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from encompass_bm25_index import BM25Index, reciprocal_rank_fusion
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+SNAPSHOT_COLUMNS = "id, url, chunk_number, title, summary, content, metadata, embedding, updated_at"
+
+# updated_at is stamped by the database when a row is written, but a transaction can
+# commit a little after its stamp, so each refresh looks back this far past the newest
+# row it has already seen
+REFRESH_OVERLAP = timedelta(minutes=10)
+
+# How the index keeps vectors in memory and in snapshots
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+def parse_embedding(value) -> List[float]:
+    """pgvector columns come back from PostgREST as a '[0.1,0.2,...]' string."""
+    return json.loads(value) if isinstance(value, str) else value
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Store normalized vectors as float32, float16 or int8.
+
+    int8 is symmetric with one scale per vector (its largest component maps to
+    127); the returned scales are 1 for the float types.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=-1) / 127
+        scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        return np.round(vectors / scales[..., None]).astype(np.int8), scales
+    return vectors.astype(dtype), np.ones(vectors.shape[:-1], dtype=np.float32)
+
+def dequantize(stored: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """float32 vectors back from quantize()."""
+    return stored.astype(np.float32) * scales[..., None]
+
+def score_vectors(stored: np.ndarray, scales: np.ndarray, queries: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+    """Similarity of every stored vector (rows) to every normalized query (columns)."""
+    if stored.dtype == np.float32:
+        return stored @ queries.T
+    # numpy has no float16/int8 BLAS, so upcast a block of rows at a time
+    scores = np.empty((len(stored), len(queries)), dtype=np.float32)
+    for start in range(0, len(stored), block_rows):
+        scores[start:start + block_rows] = stored[start:start + block_rows].astype(np.float32) @ queries.T
+    return scores * scales[:, None]
+
+class SearchState(NamedTuple):
+    """Everything a search reads, swapped in as one object after each refresh."""
+    rows: List[Dict[str, Any]]  # By matrix position
+    matrix: np.ndarray
+    scales: np.ndarray
+    bm25: BM25Index
+    hnsw: Any
+
+class LocalVectorIndex:
+    """
+    In-memory copy of the site_pages embeddings, searched in place of the match_site_pages RPC.
+
+    Rows are loaded once from a paged snapshot of site_pages (or from a saved .npz
+    snapshot) and then refreshed incrementally: only rows whose updated_at (the
+    time the row was last written, set by the database) is newer than the last
+    refresh (less a small overlap) are fetched, plus the
+    list of ids so deleted chunks are dropped. Vectors are normalized into one
+    matrix, so a search is a single matrix-vector product. In "hnsw" mode (or
+    "auto" with more than hnsw_threshold rows, when hnswlib is installed) an HNSW
+    graph is used instead of the brute-force scan.
+
+    dtype "float16" or "int8" keeps the matrix (and snapshot) at a half or a
+    quarter of the float32 size. Scoring converts it back to float32 a block of
+    rows at a time, which costs some search time; shortened embeddings
+    (OPENAI_EMBEDDING_DIMENSIONS) are what make the search itself cheaper.
+
+    A BM25 inverted index over the chunk content is kept alongside the vectors;
+    hybrid_search() fuses both rankings so exact identifiers such as field ids
+    and endpoint names are found even when the embedding match is weak.
+
+    Refreshes build a new SearchState off to the side and swap it in whole, so
+    searches from other threads never wait for a refresh or see a half-built one.
+    """
+
+    def __init__(
+        self,
+        source: str = "encompass_devconnect_docs",
+        mode: str = "auto",
+        path: Optional[str] = None,
+        refresh_interval: float = 300.0,
+        hnsw_threshold: int = 50_000,
+        table: str = "site_pages",
+        dtype: str = "float32"
+    ):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype must be one of {VECTOR_DTYPES}, not {dtype!r}")
+        self.source = source
+        self.mode = mode
+        # np.savez appends .npz to other names, so the snapshot would never be found again
+        self.path = path if not path or path.endswith(".npz") else f"{path}.npz"
+        self.refresh_interval = refresh_interval
+        self.hnsw_threshold = hnsw_threshold
+        self.table = table
+        self.dtype = dtype
+
+        # Only touched by the thread holding _lock
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._vectors: Dict[int, Tuple[np.ndarray, float]] = {}  # Stored vector and its scale
+        self._watermark = ""  # Newest updated_at seen
+
+        self._state = SearchState([], np.zeros((0, 0), dtype=dtype), np.zeros(0, dtype=np.float32), BM25Index([]), None)
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, source: str = "encompass_devconnect_docs") -> Optional["LocalVectorIndex"]:
+        """
+        Build an index when LOCAL_VECTOR_INDEX is set to auto, exact or hnsw; None otherwise.
+
+        LOCAL_VECTOR_INDEX_PATH optionally names an .npz snapshot to start from and
+        save to, LOCAL_VECTOR_INDEX_REFRESH_SECONDS sets how stale it may get and
+        LOCAL_VECTOR_INDEX_DTYPE picks float32 (default), float16 or int8 storage.
+        """
+        mode = os.getenv("LOCAL_VECTOR_INDEX", "").lower()
+        if mode not in ("auto", "exact", "hnsw"):
+            return None
+        return cls(
+            source=source,
+            mode=mode,
+            path=os.getenv("LOCAL_VECTOR_INDEX_PATH") or None,
+            refresh_interval=float(os.getenv("LOCAL_VECTOR_INDEX_REFRESH_SECONDS", "300")),
+            dtype=os.getenv("LOCAL_VECTOR_INDEX_DTYPE", "float32").lower()
+        )
+
+    def __len__(self) -> int:
+        return len(self._state.rows)
+
+    def _add_row(self, row: Dict[str, Any]):
+        vector = np.asarray(parse_embedding(row.pop("embedding")), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        stored, scale = quantize(vector / norm if norm else vector, self.dtype)
+        self._vectors[row["id"]] = (stored, float(scale))
+        self._rows[row["id"]] = row
+        self._watermark = max(self._watermark, row.get("updated_at") or "")
+
+    def _rebuild(self):
+        """Build a new SearchState (matrix, BM25 and HNSW graph) from the rows and swap it in."""
+        rows = list(self._rows.values())
+        matrix = np.stack([stored for stored, _ in self._vectors.values()]) if self._vectors else np.zeros((0, 0), dtype=self.dtype)
+        scales = np.array([scale for _, scale in self._vectors.values()], dtype=np.float32)
+        bm25 = BM25Index([row["content"] for row in rows])
+
+        hnsw = None
+        use_hnsw = self.mode == "hnsw" or (self.mode == "auto" and len(rows) > self.hnsw_threshold)
+        if use_hnsw and hnswlib is not None and rows:
+            hnsw = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            hnsw.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            hnsw.add_items(dequantize(matrix, scales), np.arange(len(rows)))
+            hnsw.set_ef(64)
+        elif use_hnsw:
+            print("hnswlib is not installed, using exact search")
+
+        self._state = SearchState(rows, matrix, scales, bm25, hnsw)
+
+    def _fetch(self, supabase_client, since: str = "", page_size: int = 500) -> List[Dict[str, Any]]:
+        rows = []
+        start = 0
+        while True:
+            query = supabase_client.from_(self.table) \
+                .select(SNAPSHOT_COLUMNS) \
+                .eq('metadata->>source', self.source) \
+                .not_.is_('embedding', 'null')
+            if since:
+                query = query.gt('updated_at', since)
+            result = query.order('id').range(start, start + page_size - 1).execute()
+            rows.extend(result.data)
+            if len(result.data) < page_size:
+                return rows
+            start += page_size
+
+    def _fetch_ids(self, supabase_client, page_size: int = 5000) -> set:
+        ids = set()
+        start = 0
+        while True:
+            result = supabase_client.from_(self.table) \
+                .select('id') \
+                .eq('metadata->>source', self.source) \
+                .not_.is_('embedding', 'null') \
+                .order('id') \
+                .range(start, start + page_size - 1) \
+                .execute()
+            ids.update(row['id'] for row in result.data)
+            if len(result.data) < page_size:
+                return ids
+            start += page_size
+
+    def refresh(self, supabase_client) -> int:
+        """Fetch rows changed since the last refresh; returns the number of rows changed or removed."""
+        with self._lock:
+            if not self._rows and self.path and os.path.exists(self.path):
+                self.load(self.path)
+
+            initial = not self._rows
+            since = ""
+            if self._watermark:
+                since = (datetime.fromisoformat(self._watermark) - REFRESH_OVERLAP).isoformat()
+            changed = self._fetch(supabase_client, since=since)
+            for row in changed:
+                self._add_row(row)
+
+            removed = 0
+            if not initial:
+                live_ids = self._fetch_ids(supabase_client)
+                for chunk_id in [chunk_id for chunk_id in self._rows if chunk_id not in live_ids]:
+                    del self._rows[chunk_id]
+                    del self._vectors[chunk_id]
+                    removed += 1
+
+            if changed or removed or not len(self):
+                self._rebuild()
+                if self.path:
+                    self.save(self.path)
+            self._refreshed_at = time.monotonic()
+            return len(changed) + removed
+
+    def refresh_if_stale(self, supabase_client):
+        """
+        Refresh when the index was never loaded or is older than refresh_interval.
+
+        While another thread is refreshing a loaded index, return at once and let
+        searches use the current rows rather than queue behind the refresh.
+        """
+        if self._refreshed_at and time.monotonic() - self._refreshed_at <= self.refresh_interval:
+            return
+        if len(self) and self._lock.locked():
+            return
+        self.refresh(supabase_client)
+
+    @staticmethod
+    def _normalized_queries(query_embeddings: List[List[float]]) -> np.ndarray:
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms == 0, 1, norms)
+
+    @staticmethod
+    def _vector_rankings(state: SearchState, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """For each normalized query, positions and cosine similarities of the k nearest rows, nearest first."""
+        k = min(len(state.rows), k)
+        if state.hnsw is not None:
+            labels, distances = state.hnsw.knn_query(queries, k=k)
+            return [
+                [(int(label), 1.0 - float(distance)) for label, distance in zip(row_labels, row_distances)]
+                for row_labels, row_distances in zip(labels, distances)
+            ]
+
+        # One matrix multiply scores every query against every row
+        scores = score_vectors(state.matrix, state.scales, queries)
+        rankings = []
+        for column in scores.T:
+            top = np.argpartition(-column, k - 1)[:k]
+            top = top[np.argsort(-column[top])]
+            rankings.append([(int(position), float(column[position])) for position in top])
+        return rankings
+
+    @staticmethod
+    def _results(state: SearchState, scores: List[Tuple[int, Dict[str, float]]], match_count: int, filter: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rows at the ranked positions that pass the metadata filter, shaped like match_site_pages results."""
+        results = []
+        for position, score in scores:
+            row = state.rows[position]
+            metadata = row.get("metadata") or {}
+            if filter and any(metadata.get(key) != value for key, value in filter.items()):
+                continue
+            results.append({**row, **score})
+            if len(results) == match_count:
+                break
+        return results
+
+    def search(self, query_embedding: List[float], match_count: int = 5, filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Rows most similar to the query, shaped like match_site_pages results."""
+        state = self._state
+        if not state.rows:
+            return []
+        # Over-fetch so metadata filtering still leaves match_count rows
+        k = match_count * 4 if filter or state.hnsw is not None else match_count
+        ranking = self._vector_rankings(state, self._normalized_queries([query_embedding]), k)[0]
+        return self._results(state, [(position, {"similarity": similarity}) for position, similarity in ranking], match_count, filter)
+
+    def hybrid_search(
+        self,
+        query_text: str,
+        query_embedding: List[float],
+        match_count: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        candidates: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Rows ranked by reciprocal rank fusion of vector similarity and BM25 keyword score.
+
+        The top candidates of each ranking are fused; each result keeps its cosine
+        similarity and gains an rrf_score.
+        """
+        return self.hybrid_search_many([query_text], [query_embedding], match_count, filter, candidates)[0]
+
+    def hybrid_search_many(
+        self,
+        query_texts: List[str],
+        query_embeddings: List[List[float]],
+        match_count: int = 5,
+        filter: Optional[Dict[str, Any]] = None,
+        candidates: int = 50
+    ) -> List[List[Dict[str, Any]]]:
+        """hybrid_search() for several queries, scoring all their vectors in one matrix multiply."""
+        state = self._state
+        if not state.rows:
+            return [[] for _ in query_texts]
+        queries = self._normalized_queries(query_embeddings)
+        results = []
+        for query_text, query, vector_ranking in zip(query_texts, queries, self._vector_rankings(state, queries, candidates)):
+            keyword_ranking = state.bm25.top(query_text, candidates)
+            fused = reciprocal_rank_fusion([
+                [position for position, _ in vector_ranking],
+                [position for position, _ in keyword_ranking]
+            ])
+
+            # Keyword-only hits still report their cosine similarity
+            similarities = dict(vector_ranking)
+            results.append(self._results(state, [
+                (position, {
+                    "similarity": similarities.get(position, float(state.matrix[position].astype(np.float32) @ query * state.scales[position])),
+                    "rrf_score": rrf_score
+                })
+                for position, rrf_score in fused
+            ], match_count, filter))
+        return results
+
+    def save(self, path: str):
+        """Write the rows and vectors to a compressed .npz snapshot."""
+        state = self._state
+        # One UTF-8 JSON blob: a numpy string array would pad every row to the longest, at 4 bytes a character
+        rows_json = json.dumps(state.rows).encode("utf-8")
+        np.savez_compressed(
+            path,
+            ids=np.array([row["id"] for row in state.rows], dtype=np.int64),
+            matrix=state.matrix,
+            scales=state.scales,
+            rows_json=np.frombuffer(rows_json, dtype=np.uint8),
+            watermark=np.array(self._watermark)
+        )
+
+    def load(self, path: str):
+        """Load an .npz snapshot written by save()."""
+        with np.load(path, allow_pickle=False) as snapshot:
+            self._rows = {}
+            self._vectors = {}
+            matrix = snapshot["matrix"]
+            scales = snapshot["scales"] if "scales" in snapshot else np.ones(len(matrix), dtype=np.float32)
+            if matrix.dtype != np.dtype(self.dtype):
+                matrix, scales = quantize(dequantize(matrix, scales), self.dtype)
+            if "rows_json" in snapshot:
+                rows = json.loads(snapshot["rows_json"].tobytes().decode("utf-8"))
+            else:
+                rows = [json.loads(str(row)) for row in snapshot["rows"]]  # Snapshots saved before rows_json
+            for chunk_id, vector, scale, row in zip(snapshot["ids"], matrix, scales, rows):
+                self._rows[int(chunk_id)] = row
+                self._vectors[int(chunk_id)] = (vector, float(scale))
+            self._watermark = str(snapshot["watermark"])
+        self._rebuild()
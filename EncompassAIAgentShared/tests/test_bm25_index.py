@@ -0,0 +1,61 @@
+import math
+
+from encompass_bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCUMENTS = [
+    "Create a pipeline cursor with v3-create-cursor and page through loans.",
+    "Fields.1109 is the base loan amount. Read it with the field reader.",
+    "Loan.LastModified sorts the pipeline by last modified time.",
+    "Rate locks are requested from the secondary lock desk.",
+]
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Read Fields.1109 via v3-create-cursor") == [
+        "read", "fields.1109", "fields", "1109", "via", "v3-create-cursor", "v3", "create", "cursor"
+    ]
+
+def test_exact_identifier_ranks_its_document_first():
+    index = BM25Index(DOCUMENTS)
+
+    assert index.top("Fields.1109", 2)[0][0] == 1
+    assert index.top("v3-create-cursor", 1)[0][0] == 0
+    assert index.top("loan.lastmodified", 1)[0][0] == 2
+
+def test_scores_match_okapi_bm25():
+    documents = ["apple apple banana", "banana cherry", "cherry cherry cherry durian"]
+    index = BM25Index(documents, k1=1.2, b=0.75)
+    average_length = (3 + 2 + 4) / 3
+
+    # "apple" is in one of three documents, twice in a three-term document
+    idf = math.log(1 + (3 - 1 + 0.5) / (1 + 0.5))
+    expected = idf * 2 * 2.2 / (2 + 1.2 * (1 - 0.75 + 0.75 * 3 / average_length))
+
+    scores = index.scores("apple")
+    assert math.isclose(scores[0], expected, rel_tol=1e-5)
+    assert scores[1] == scores[2] == 0
+
+def test_repeated_query_terms_count_once():
+    index = BM25Index(DOCUMENTS)
+
+    assert list(index.scores("lock lock lock")) == list(index.scores("lock"))
+
+def test_top_returns_only_matches_best_first():
+    index = BM25Index(DOCUMENTS)
+
+    top = index.top("pipeline loan", 10)
+    assert {position for position, _ in top} == {0, 1, 2}
+    assert [score for _, score in top] == sorted((score for _, score in top), reverse=True)
+    assert index.top("mortgage insurance", 5) == []
+
+def test_empty_index():
+    index = BM25Index([])
+
+    assert index.top("anything", 3) == []
+    assert len(index.scores("anything")) == 0
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+
+    assert [item for item, _ in fused] == ["a", "c", "b", "d"]
+    assert math.isclose(dict(fused)["a"], 1 / 61 + 1 / 62)
+    assert math.isclose(dict(fused)["d"], 1 / 63)
@@ -0,0 +1,63 @@
+import os
+import asyncio
+
+from encompass_embedding_cache import EmbeddingCache
+
+def make_cache(tmp_path, **kwargs):
+    return EmbeddingCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+def last_used(cache, model, text):
+    key = cache.make_key(model, text)
+    return cache._conn.execute("select last_used from embeddings where key = ?", (key,)).fetchone()[0]
+
+def test_round_trip_and_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many("m", [("a", [0.5, 1.0]), ("b", [2.0, -1.0])])
+
+    assert cache.get_many("m", ["a", "c", "b"]) == [[0.5, 1.0], None, [2.0, -1.0]]
+    assert (cache.hits, cache.misses) == (2, 1)
+    # Model and dimensions are part of the key
+    assert cache.get("other", "a") is None
+    assert cache.get("m", "a", dimensions=256) is None
+
+def test_lookups_buffer_last_used_until_next_write(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("m", "a", [1.0])
+    stored = last_used(cache, "m", "a")
+
+    cache.get("m", "a")
+    assert last_used(cache, "m", "a") == stored
+    assert cache.make_key("m", "a") in cache._touched
+
+    cache.put("m", "b", [2.0])
+    assert last_used(cache, "m", "a") > stored
+    assert not cache._touched
+
+def test_touch_buffer_flushes_at_threshold(tmp_path):
+    cache = make_cache(tmp_path, touch_flush_size=2)
+    cache.put_many("m", [("a", [1.0]), ("b", [2.0])])
+    stored = last_used(cache, "m", "a")
+
+    cache.get_many("m", ["a", "b"])
+    assert not cache._touched
+    assert last_used(cache, "m", "a") > stored
+
+def test_eviction_trims_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, max_entries=100)
+    cache.put_many("m", [(str(i), [float(i)]) for i in range(1000)])
+
+    assert cache._conn.execute("select count(*) from embeddings").fetchone()[0] == 90
+
+def test_async_wrappers(tmp_path):
+    cache = make_cache(tmp_path)
+
+    async def run():
+        await cache.aput_many("m", [("a", [1.0])])
+        return await cache.aget("m", "a"), await cache.aget_many("m", ["a", "b"])
+
+    assert asyncio.run(run()) == ([1.0], [[1.0], None])
+
+def test_default_path_does_not_depend_on_cwd():
+    import encompass_embedding_cache
+
+    assert os.path.isabs(encompass_embedding_cache.DEFAULT_PATH)
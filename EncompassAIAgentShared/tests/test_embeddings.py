@@ -0,0 +1,126 @@
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+from encompass_embedding_cache import EmbeddingCache
+from encompass_embeddings import AdaptiveConcurrencyLimiter, EmbeddingBatcher, EmbeddingError, estimate_tokens, parse_duration, retry_after_seconds
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+class FakeEmbeddings:
+    """Embeds each text as [len(text), dimensions]; queued errors are raised first, and any text containing "bad" is rejected."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.requests = []
+
+    async def create(self, model, input, dimensions=None):
+        self.requests.append({"model": model, "input": list(input), "dimensions": dimensions})
+        await asyncio.sleep(0)
+        if self.errors:
+            raise self.errors.pop(0)
+        if any("bad" in text for text in input):
+            raise APIError(400)
+        # Out of order, as the API is allowed to return them
+        data = [SimpleNamespace(index=i, embedding=[float(len(text)), float(dimensions or 0)]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+def make_batcher(embeddings, **kwargs):
+    return EmbeddingBatcher(SimpleNamespace(embeddings=embeddings), "text-embedding-3-small", backoff_base=0, **kwargs)
+
+def test_concurrent_texts_share_a_request_and_get_their_own_vectors():
+    embeddings = FakeEmbeddings()
+    batcher = make_batcher(embeddings)
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed("x" * n) for n in (1, 2, 3)))
+
+    assert asyncio.run(main()) == [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    assert len(embeddings.requests) == 1
+    assert (batcher.request_count, batcher.text_count) == (1, 3)
+
+def test_batches_are_bounded_by_size_and_tokens():
+    embeddings = FakeEmbeddings()
+    long_text = "loan pipeline field " * 20
+    batcher = make_batcher(embeddings, max_batch_size=2, max_batch_tokens=estimate_tokens(long_text))
+
+    async def main():
+        await asyncio.gather(*(batcher.embed(text) for text in ["a", "b", "c", long_text, "e"]))
+
+    asyncio.run(main())
+    assert [request["input"] for request in embeddings.requests] == [["a", "b"], ["c"], [long_text], ["e"]]
+
+def test_dimensions_are_requested():
+    embeddings = FakeEmbeddings()
+    batcher = make_batcher(embeddings, dimensions=256)
+
+    assert asyncio.run(batcher.embed("abc")) == [3.0, 256.0]
+    assert embeddings.requests[0]["dimensions"] == 256
+
+def test_transient_errors_are_retried():
+    embeddings = FakeEmbeddings(errors=[APIError(429, {"retry-after-ms": "1"}), APIError(500)])
+    limiter = AdaptiveConcurrencyLimiter(initial=4)
+    batcher = make_batcher(embeddings, limiter=limiter)
+
+    assert asyncio.run(batcher.embed("abc")) == [3.0, 0.0]
+    assert batcher.retry_count == 2
+    assert limiter.limit < 4
+
+def test_invalid_batch_is_split_to_isolate_the_bad_text():
+    embeddings = FakeEmbeddings()
+    batcher = make_batcher(embeddings)
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(text) for text in ["ok", "bad", "fine", "good"]), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert results[0] == [2.0, 0.0] and results[2] == [4.0, 0.0] and results[3] == [4.0, 0.0]
+    assert isinstance(results[1], EmbeddingError)
+    assert batcher.failed_count == 1
+
+def test_exhausted_retries_raise_embedding_error():
+    embeddings = FakeEmbeddings(errors=[APIError(500)] * 3)
+    batcher = make_batcher(embeddings, max_retries=2)
+
+    with pytest.raises(EmbeddingError):
+        asyncio.run(batcher.embed("abc"))
+    assert len(embeddings.requests) == 3
+
+def test_cache_is_consulted_and_populated(tmp_path):
+    embeddings = FakeEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    batcher = make_batcher(embeddings, cache=cache)
+
+    async def main():
+        first = await batcher.embed("abc")
+        await batcher.aclose()
+        return first, await batcher.embed("abc")
+
+    assert asyncio.run(main()) == ([3.0, 0.0], [3.0, 0.0])
+    assert len(embeddings.requests) == 1
+    assert batcher.cache_hits == 1
+
+def test_rate_limit_headers():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert retry_after_seconds({"retry-after-ms": "1500"}) == 1.5
+    assert retry_after_seconds({"retry-after": "2"}) == 2
+    assert retry_after_seconds({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}) is None
+
+def test_auth_error_fails_the_whole_batch_without_splitting():
+    embeddings = FakeEmbeddings(errors=[APIError(401)])
+    batcher = make_batcher(embeddings)
+
+    async def main():
+        return await asyncio.gather(*(batcher.embed(f"text {i}") for i in range(64)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, EmbeddingError) for result in results)
+    assert len(embeddings.requests) == 1
+    assert batcher.failed_count == 64
@@ -0,0 +1,89 @@
+import time
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import encompass_http_client
+from encompass_http_client import request
+
+class SlowTransport(httpx.AsyncBaseTransport):
+    """Answers every request after a short delay, recording the most requests in flight at once."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.loops = set()
+
+    async def handle_async_request(self, request):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.loops.add(id(asyncio.get_running_loop()))
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        return httpx.Response(200, json={"path": request.url.path})
+
+@pytest.fixture
+def transport(monkeypatch):
+    monkeypatch.setenv("ENCOMPASS_HTTP_PER_HOST_CONCURRENCY", "2")
+    encompass_http_client.close()
+    transport = SlowTransport()
+    http_loop = encompass_http_client._get_http_loop()
+    http_loop.client._transport = transport
+    yield transport
+    encompass_http_client.close()
+
+def test_requests_from_many_loops_share_one_client_and_per_host_limit(transport):
+    def rerun(i):
+        # Like a Streamlit rerun: a fresh event loop on its own thread
+        async def main():
+            responses = await asyncio.gather(*(request("GET", f"https://api.example.com/{i}/{j}") for j in range(3)))
+            return [response.json()["path"] for response in responses]
+        return asyncio.run(main())
+
+    results = {}
+    threads = [threading.Thread(target=lambda i=i: results.setdefault(i, rerun(i))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results[3] == ["/3/0", "/3/1", "/3/2"]
+    assert transport.max_in_flight == 2
+    assert len(transport.loops) == 1
+
+def test_per_host_limit_is_per_host(transport):
+    async def main():
+        await asyncio.gather(*(request("GET", f"https://{host}.example.com/") for host in ("a", "a", "b", "b")))
+
+    started = time.monotonic()
+    asyncio.run(main())
+    assert transport.max_in_flight == 4
+    assert time.monotonic() - started < 0.2
+
+def test_close_closes_client_and_next_request_starts_a_new_one(transport):
+    http_loop = encompass_http_client._get_http_loop()
+    encompass_http_client.close()
+
+    assert http_loop.client.is_closed
+    assert not http_loop.thread.is_alive()
+    assert encompass_http_client._get_http_loop() is not http_loop
+
+def test_cancelled_request_releases_its_slot(transport):
+    async def main():
+        task = asyncio.create_task(request("GET", "https://api.example.com/slow"))
+        await asyncio.sleep(0.005)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+        return await asyncio.gather(*(request("GET", f"https://api.example.com/{j}") for j in range(2)))
+
+    assert [response.status_code for response in asyncio.run(main())] == [200, 200]
+    assert transport.in_flight == 0
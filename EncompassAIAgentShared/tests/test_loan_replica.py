@@ -0,0 +1,145 @@
+import time
+import asyncio
+
+from types import SimpleNamespace
+
+import pytest
+
+import encompass_loan_replica
+from encompass_loan_replica import LoanReplica, UnsupportedQuery
+
+LOANS = [
+    {"loanGuid": "a", "fields": {
+        "Fields.GUID": "a", "Fields.364": "1001", "Loan.BorrowerName": "Ann Lee", "Fields.1109": "650,000.00",
+        "Fields.1393": "Active Loan", "Fields.LOANLASTMODIFIED": "12/01/2024 10:15:00 AM", "Fields.1172": "Conventional",
+        "Fields.2853": "720", "Loan.LastModified": "2024-12-01T16:15:00Z"
+    }},
+    {"loanGuid": "b", "fields": {
+        "Fields.GUID": "b", "Fields.364": "1002", "Loan.BorrowerName": "Bo Diaz", "Fields.1109": "450000",
+        "Fields.1393": "Active Loan", "Fields.LOANLASTMODIFIED": "02/03/2025 09:00:00 AM", "Fields.1172": "FHA",
+        "Fields.2853": "", "Loan.LastModified": "2025-02-03T15:00:00Z"
+    }}
+]
+
+@pytest.fixture
+def replica(tmp_path):
+    replica = LoanReplica(str(tmp_path / "replica.sqlite3"), max_age=60)
+    replica.upsert(LOANS)
+    replica._set_state("synced_at", str(time.time()))
+    replica._conn.commit()
+    return replica
+
+def guids(replica, filter_criteria, loan_limit=10):
+    return [loan["loanGuid"] for loan in replica.query(filter_criteria, loan_limit)]
+
+def test_numeric_range_terms_become_typed_comparisons(replica):
+    sql, params, _ = replica.to_sql({"filter": {"terms": [
+        {"canonicalName": "Fields.1109", "value": "500,000", "matchType": "greaterThan"},
+        {"canonicalName": "fields.2853", "value": 700, "matchType": "greaterThanOrEquals"}
+    ], "operator": "and"}}, 5)
+
+    assert 'where ("Fields.1109" > ? and "Fields.2853" >= ?)' in sql
+    assert params == [500000.0, 700.0, 5]
+
+def test_date_fields_compare_as_timestamps(replica):
+    later = {"filter": {"canonicalName": "Fields.LOANLASTMODIFIED", "value": "01/15/2025", "matchType": "greaterThan"}}
+    earlier = {"filter": {"canonicalName": "Fields.LOANLASTMODIFIED", "value": "01/15/2025", "matchType": "lessThan"}}
+
+    assert guids(replica, later) == ["b"]
+    assert guids(replica, earlier) == ["a"]
+
+def test_date_precision_compares_a_prefix(replica):
+    sql, params, _ = replica.to_sql({"filter": {
+        "canonicalName": "Loan.LastModified", "value": "2025-02-03", "matchType": "exact", "precision": "day"
+    }}, 10)
+
+    assert 'substr("Loan.LastModified", 1, 10) = ?' in sql
+    assert params[0] == "2025-02-03"
+    assert guids(replica, {"filter": {
+        "canonicalName": "Loan.LastModified", "value": "2025-02-03", "matchType": "exact", "precision": "day"
+    }}) == ["b"]
+
+def test_text_fields_match_case_insensitively(replica):
+    assert guids(replica, {"filter": {"canonicalName": "Fields.1172", "value": "conventional", "matchType": "exact"}}) == ["a"]
+    assert guids(replica, {"filter": {"canonicalName": "Loan.BorrowerName", "value": "Bo", "matchType": "startsWith"}}) == ["b"]
+
+@pytest.mark.parametrize("term", [
+    {"canonicalName": "Fields.1172", "value": "FHA", "matchType": "greaterThan"},
+    {"canonicalName": "Fields.1109", "value": "65", "matchType": "contains"},
+    {"canonicalName": "Fields.1109", "value": "lots", "matchType": "greaterThan"},
+    {"canonicalName": "Loan.LastModified", "value": "next week", "matchType": "greaterThan"},
+    {"canonicalName": "Loan.LastModified", "value": "2025-01-01", "matchType": "greaterThan", "precision": "fortnight"},
+    {"canonicalName": "Fields.16", "value": "1", "matchType": "exact"},
+    {"canonicalName": "Fields.1109", "value": "1", "matchType": "between"}
+])
+def test_unsupported_terms_raise(replica, term):
+    with pytest.raises(UnsupportedQuery):
+        replica.to_sql({"filter": term}, 10)
+    assert replica.query({"filter": term}, 10) is None
+
+def test_unsupported_options_and_operators_raise(replica):
+    with pytest.raises(UnsupportedQuery):
+        replica.to_sql({"filter": {}, "includeArchivedLoans": True}, 10)
+    with pytest.raises(UnsupportedQuery):
+        replica.to_sql({"filter": {"terms": [{"canonicalName": "Fields.364", "value": "1"}], "operator": "xor"}}, 10)
+
+def test_sort_order_and_limit(replica):
+    criteria = {"filter": {}, "sortOrder": [{"canonicalName": "Fields.1109", "order": "desc"}]}
+
+    assert guids(replica, criteria) == ["a", "b"]
+    assert guids(replica, criteria, loan_limit=1) == ["a"]
+
+def test_query_returns_raw_api_values(replica):
+    loans = replica.query({"filter": {"canonicalName": "Fields.364", "value": "1001", "matchType": "exact"},
+                           "fields": ["Fields.1109", "Loan.LastModified", "Fields.1811"]}, 10)
+
+    assert loans == [{"loanGuid": "a", "fields": {
+        "Fields.1109": "650,000.00", "Loan.LastModified": "2024-12-01T16:15:00Z", "Fields.1811": ""
+    }}]
+
+def test_stale_replica_defers_to_the_api(replica):
+    replica.max_age = 0
+    time.sleep(0.01)
+    assert replica.query({"filter": {}}, 10) is None
+
+def test_upsert_returns_newest_watermark(tmp_path):
+    replica = LoanReplica(str(tmp_path / "replica.sqlite3"))
+    assert replica.upsert(LOANS) == "2025-02-03T15:00:00"
+
+def test_older_schema_is_rebuilt(tmp_path):
+    path = str(tmp_path / "replica.sqlite3")
+    replica = LoanReplica(path)
+    replica.upsert(LOANS)
+    replica._set_state("schema", "1")
+    replica._set_state("watermark", "2025-02-03T15:00:00")
+    replica._conn.commit()
+    replica._conn.close()
+
+    rebuilt = LoanReplica(path)
+    assert rebuilt.watermark == ""
+    assert rebuilt._conn.execute("select count(*) from loans").fetchone()[0] == 0
+
+def test_sync_filters_from_the_watermark_in_utc(tmp_path, monkeypatch):
+    requests = []
+
+    class FakeReader:
+        def __init__(self, criteria):
+            requests.append(criteria)
+
+        async def __aiter__(self):
+            yield SimpleNamespace(loans=LOANS)
+
+    monkeypatch.setattr(encompass_loan_replica, "PipelineReader", FakeReader)
+    replica = LoanReplica(str(tmp_path / "replica.sqlite3"))
+
+    assert asyncio.run(replica.sync()) == 2
+    asyncio.run(replica.sync())
+
+    assert requests[0]["filter"]["value"] == "1900-01-01T00:00:00Z"
+    assert requests[1]["filter"]["value"] == "2025-02-03T15:00:00Z"
+
+def test_query_runs_in_a_worker_thread(replica):
+    async def main():
+        return await asyncio.gather(*(asyncio.to_thread(guids, replica, {"filter": {}}) for _ in range(4)))
+
+    assert asyncio.run(main()) == [["a", "b"]] * 4
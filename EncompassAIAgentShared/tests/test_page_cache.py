@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+from encompass_page_cache import PageContentCache, select_page_content
+
+PAGE = """# Pipeline
+
+Intro.
+
+## Request
+
+```bash
+# not a heading
+curl https://example.com
+```
+
+## Response
+
+Body."""
+
+class FakeSupabase:
+    """Just enough of the supabase-py query builder for PageContentCache."""
+
+    def __init__(self, catalog, chunks):
+        self.catalog = catalog
+        self.chunks = chunks
+        self.chunk_reads = 0
+
+    def from_(self, table):
+        client = self
+
+        class Query:
+            def select(self, *args, **kwargs): return self
+            def eq(self, *args): return self
+            def limit(self, *args): return self
+            def order(self, *args, **kwargs): return self
+
+            def execute(self):
+                if table == "site_page_catalog":
+                    return SimpleNamespace(data=[client.catalog] if client.catalog else [])
+                client.chunk_reads += 1
+                return SimpleNamespace(data=list(client.chunks))
+
+        return Query()
+
+def chunk(number, content, page_hash):
+    return {"title": "Pipeline - Chunk", "content": content, "chunk_number": number, "page_hash": page_hash}
+
+def test_section_lookup_skips_comment_lines_in_code_fences():
+    section = select_page_content(PAGE, section="request")
+
+    assert section.startswith("## Request")
+    assert "curl" in section and "## Response" not in section
+    assert "No section" in select_page_content(PAGE, section="not a heading")
+
+def test_offset_and_limit_note_where_to_continue():
+    selected = select_page_content(PAGE, offset=0, limit=10)
+
+    assert selected.startswith(PAGE[:10])
+    assert "continue with offset=10" in selected
+
+def test_complete_page_is_cached_by_catalog_hash():
+    client = FakeSupabase({"content_hash": "v2", "chunk_count": 2}, [chunk(0, "a", "v2"), chunk(1, "b", "v2")])
+    cache = PageContentCache()
+
+    assert cache.get_page(client, "u") == "# Pipeline\n\n\na\n\nb"
+    assert cache.get_page(client, "u") == "# Pipeline\n\n\na\n\nb"
+    assert (cache.hits, cache.misses, client.chunk_reads) == (1, 1, 1)
+
+def test_page_read_before_its_chunks_are_written_is_not_cached():
+    # The catalog already has the new hash, but the chunks are still the old version
+    client = FakeSupabase({"content_hash": "v2", "chunk_count": 2}, [chunk(0, "old", "v1"), chunk(1, "b", "v2")])
+    cache = PageContentCache()
+
+    assert "old" in cache.get_page(client, "u")
+    client.chunks = [chunk(0, "new", "v2"), chunk(1, "b", "v2")]
+    assert "new" in cache.get_page(client, "u")
+
+def test_page_missing_chunks_is_not_cached():
+    client = FakeSupabase({"content_hash": "v2", "chunk_count": 3}, [chunk(0, "a", "v2"), chunk(1, "b", "v2")])
+    cache = PageContentCache()
+
+    cache.get_page(client, "u")
+    cache.get_page(client, "u")
+    assert client.chunk_reads == 2
+
+def test_assembly_drops_repeated_overlap():
+    client = FakeSupabase({"content_hash": "v", "chunk_count": 2}, [
+        chunk(0, "First part. Shared sentence.", "v"),
+        dict(chunk(1, "Shared sentence.\n\nSecond part.", "v"), overlap_chars="18")
+    ])
+
+    assert PageContentCache().get_page(client, "u") == "# Pipeline\n\n\nFirst part. Shared sentence.\n\nSecond part."
+
+def test_unknown_page():
+    assert PageContentCache().get_page(FakeSupabase(None, []), "u") is None
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+from encompass_page_catalog import PageCatalog, escape_like
+
+class FakeCatalog:
+    """Just enough of the supabase-py query builder for PageCatalog."""
+
+    def __init__(self, last_crawled="2026-01-01T00:00:00+00:00"):
+        self.last_crawled = last_crawled
+        self.patterns = []
+        self.listings = 0
+
+    def from_(self, table):
+        client = self
+
+        class Query:
+            listing = False
+            def select(self, columns, count=None):
+                self.listing = count is not None
+                return self
+            def eq(self, *args): return self
+            def limit(self, *args): return self
+            def order(self, *args, **kwargs): return self
+            def range(self, *args): return self
+            def like(self, column, pattern):
+                client.patterns.append(pattern)
+                return self
+
+            def execute(self):
+                if not self.listing:
+                    return SimpleNamespace(data=[{"last_crawled": client.last_crawled}])
+                client.listings += 1
+                return SimpleNamespace(data=[{"url": "u"}], count=1)
+
+        return Query()
+
+def test_prefix_wildcards_are_escaped():
+    client = FakeCatalog()
+
+    PageCatalog().list_pages(client, path_prefix="/docs/v1_pipeline%")
+
+    assert client.patterns == ["/docs/v1\\_pipeline\\%%"]
+    assert escape_like("a\\b") == "a\\\\b"
+
+def test_listings_are_cached_until_the_catalog_changes():
+    client = FakeCatalog()
+    catalog = PageCatalog(ttl=0)
+
+    catalog.list_pages(client, "/docs/")
+    catalog.list_pages(client, "/docs/")
+    assert client.listings == 1
+
+    client.last_crawled = "2026-01-02T00:00:00+00:00"
+    catalog.list_pages(client, "/docs/")
+    assert client.listings == 2
+
+def test_cache_keeps_only_the_most_recently_used_listings():
+    client = FakeCatalog()
+    catalog = PageCatalog(max_entries=2)
+
+    for prefix in ("/a", "/b", "/a", "/c"):
+        catalog.list_pages(client, prefix)
+
+    assert list(catalog._cache) == [("/a", 0, 100), ("/c", 0, 100)]
+    assert client.listings == 3
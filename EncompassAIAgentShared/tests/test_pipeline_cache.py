@@ -0,0 +1,87 @@
+import asyncio
+
+from encompass_pipeline_cache import PipelineQueryCache, cache_key, canonicalize_filter
+
+URL = "https://api.elliemae.com/encompass/v1/loanPipeline?limit="
+
+def test_equivalent_filters_share_a_key():
+    a = {"filter": {"terms": [
+        {"canonicalName": "Fields.1109", "value": "500,000", "matchType": "greaterThan"},
+        {"canonicalName": "Fields.1172", "value": "Conventional", "matchType": "Exact"}
+    ], "operator": "AND"}, "fields": ["Fields.364", "Fields.GUID"]}
+    b = {"Fields": ["Fields.GUID", "Fields.364", "Fields.364"], "Filter": {"Operator": "and", "Terms": [
+        {"matchType": "exact", "value": "Conventional", "canonicalName": "Fields.1172"},
+        {"canonicalName": "Fields.1109", "value": 500000.0, "matchType": "greaterthan"}
+    ]}}
+
+    assert cache_key(a, 10, URL) == cache_key(b, 10, URL.upper().replace("?LIMIT=", "?limit="))
+
+def test_limit_sort_order_and_field_names_change_the_key():
+    base = {"filter": {"canonicalName": "Fields.1109", "value": 1, "matchType": "greaterThan"}}
+    sorted_ = dict(base, sortOrder=[{"canonicalName": "Fields.364", "order": "asc"}, {"canonicalName": "Fields.1109", "order": "desc"}])
+    reversed_ = dict(base, sortOrder=list(reversed(sorted_["sortOrder"])))
+
+    assert cache_key(base, 10) != cache_key(base, 20)
+    assert cache_key(sorted_, 10) != cache_key(reversed_, 10)
+    # Field names are not lowercased, in the filter or in the field list
+    assert canonicalize_filter({"canonicalName": "Loan.LastModified"}) == {"canonicalname": "Loan.LastModified"}
+    assert canonicalize_filter({"fields": ["Loan.BorrowerName"]}) == {"fields": ["Loan.BorrowerName"]}
+
+def test_identifiers_with_leading_zeros_stay_strings():
+    assert canonicalize_filter({"value": "00123"}) == {"value": "00123"}
+    assert canonicalize_filter({"value": "1,250.50"}) == {"value": 1250.5}
+
+def run_cached(cache, fetch, access_token=""):
+    return asyncio.run(cache.get_or_fetch({"filter": {}}, 10, fetch, api_url=URL, access_token=access_token))
+
+def counting_fetch(result):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return result
+
+    return fetch, calls
+
+def test_successful_responses_are_cached():
+    cache = PipelineQueryCache(ttl=60, watermark_interval=0)
+    fetch, calls = counting_fetch([{"loanGuid": "a"}])
+
+    assert run_cached(cache, fetch) == [{"loanGuid": "a"}]
+    assert run_cached(cache, fetch) == [{"loanGuid": "a"}]
+    assert len(calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+
+def test_errors_are_not_cached():
+    cache = PipelineQueryCache(ttl=60, watermark_interval=0)
+    fetch, calls = counting_fetch("")
+
+    run_cached(cache, fetch)
+    run_cached(cache, fetch)
+    assert len(calls) == 2
+
+def test_large_responses_are_not_cached():
+    cache = PipelineQueryCache(ttl=60, watermark_interval=0, max_loans=2)
+    fetch, calls = counting_fetch([{"loanGuid": str(i)} for i in range(3)])
+
+    run_cached(cache, fetch)
+    run_cached(cache, fetch)
+    assert len(calls) == 2
+
+def test_explicit_token_bypasses_the_cache():
+    cache = PipelineQueryCache(ttl=60, watermark_interval=0)
+    fetch, calls = counting_fetch([{"loanGuid": "a"}])
+
+    run_cached(cache, fetch)
+    run_cached(cache, fetch, access_token="someone-else")
+    run_cached(cache, fetch, access_token="someone-else")
+    assert len(calls) == 3
+
+def test_entries_expire_and_are_bounded():
+    cache = PipelineQueryCache(ttl=-1, max_entries=2, watermark_interval=0)
+    cache.put("a", [1])
+    assert cache.get("a") is None
+
+    cache.ttl = 60
+    for key in "abc":
+        cache.put(key, [key])
+    assert cache.get("a") is None and cache.get("c") == ["c"]
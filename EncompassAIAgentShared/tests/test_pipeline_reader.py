@@ -0,0 +1,121 @@
+import json
+import asyncio
+
+import httpx
+import pytest
+
+import encompass_pipeline_reader
+from encompass_pipeline_reader import PIPELINE_URL, PipelineReader, read_pipeline_loans
+from encompass_token_manager import token_manager
+
+LOANS = [{"loanGuid": str(i), "fields": {"Fields.364": str(i)}} for i in range(25)]
+
+class FakePipeline:
+    """Serves LOANS through the pipeline cursor protocol and records every request."""
+
+    def __init__(self, cursor="c1", status=200):
+        self.cursor = cursor
+        self.status = status
+        self.calls = []
+
+    async def __call__(self, method, url, params=None, json=None, headers=None):
+        self.calls.append({"url": url, "params": dict(params), "body": json, "auth": headers["Authorization"]})
+        if self.status != 200:
+            return httpx.Response(self.status, text="nope")
+        start = params.get("start", 0)
+        page = LOANS[start:start + params["limit"]]
+        response_headers = {"X-Total-Count": str(len(LOANS))}
+        if "cursorType" in params and self.cursor:
+            response_headers["X-Cursor"] = self.cursor
+        await asyncio.sleep(0.001 * (len(LOANS) - start))  # Later pages answer first
+        return httpx.Response(200, content=json_dumps(page), headers=response_headers)
+
+def json_dumps(value):
+    return json.dumps(value).encode()
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    fake = FakePipeline()
+    monkeypatch.setattr(encompass_pipeline_reader, "request", fake)
+    monkeypatch.setattr(token_manager, "_token", "managed")
+    monkeypatch.setattr(token_manager, "_expires_at", float("inf"))
+    return fake
+
+async def collect(reader):
+    return [page async for page in reader]
+
+def test_pages_arrive_in_order_through_the_cursor(pipeline):
+    reader = PipelineReader({"filter": {}, "fields": ["Fields.364"]}, page_size=10, prefetch=3)
+    pages = asyncio.run(collect(reader))
+
+    assert [page.start for page in pages] == [0, 10, 20]
+    assert [loan for page in pages for loan in page.loans] == LOANS
+    assert pipeline.calls[0]["params"] == {"cursorType": "randomAccess", "limit": 10}
+    assert pipeline.calls[1]["params"] == {"cursor": "c1", "start": 10, "limit": 10}
+    assert pipeline.calls[1]["body"] == {"fields": ["Fields.364"]}
+    assert all(call["auth"] == "Bearer managed" for call in pipeline.calls)
+
+def test_max_loans_limits_the_last_page(pipeline, monkeypatch):
+    monkeypatch.setenv("ENCOMPASS_PIPELINE_PAGE_SIZE", "10")
+    loans = asyncio.run(read_pipeline_loans({"filter": {}}, 15, access_token="caller"))
+
+    assert loans == LOANS[:15]
+    assert pipeline.calls[-1]["params"]["limit"] == 5
+    assert all(call["auth"] == "Bearer caller" for call in pipeline.calls)
+
+def test_reader_uses_the_given_endpoint(pipeline, monkeypatch):
+    monkeypatch.setenv("ENCOMPASS_PIPELINE_PAGE_SIZE", "10")
+    url = "https://example.test/encompass/v1/loanPipeline"
+    asyncio.run(read_pipeline_loans({"filter": {}}, 15, url=url))
+
+    assert {call["url"] for call in pipeline.calls} == {url}
+    assert PIPELINE_URL != url
+
+def test_missing_cursor_with_more_loans_raises(pipeline):
+    pipeline.cursor = ""
+    reader = PipelineReader({"filter": {}}, page_size=10)
+
+    with pytest.raises(RuntimeError, match="without a cursor"):
+        asyncio.run(collect(reader))
+
+def test_missing_cursor_is_fine_when_the_first_page_has_everything(pipeline):
+    pipeline.cursor = ""
+    assert asyncio.run(read_pipeline_loans({"filter": {}}, 10)) == LOANS[:10]
+
+def test_failed_request_raises(pipeline):
+    pipeline.status = 500
+    with pytest.raises(RuntimeError, match="500"):
+        asyncio.run(read_pipeline_loans({"filter": {}}, 10))
+
+def test_401_on_the_managed_token_retries_with_a_fresh_one(pipeline, monkeypatch):
+    async def request_token():
+        return "fresh", 900.0
+
+    monkeypatch.setattr(token_manager, "_request_token", request_token)
+    pipeline.status = 401
+    with pytest.raises(RuntimeError, match="401"):
+        asyncio.run(read_pipeline_loans({"filter": {}}, 10))
+    assert [call["auth"] for call in pipeline.calls] == ["Bearer managed", "Bearer fresh"]
+
+def test_401_on_a_caller_token_is_not_retried_with_the_managed_token(pipeline):
+    pipeline.status = 401
+    with pytest.raises(RuntimeError, match="401"):
+        asyncio.run(read_pipeline_loans({"filter": {}}, 10, access_token="caller"))
+    assert [call["auth"] for call in pipeline.calls] == ["Bearer caller"]
+    assert token_manager._token == "managed"
+
+def test_stopping_early_awaits_prefetched_pages(pipeline):
+    async def first_page():
+        reader = PipelineReader({"filter": {}}, page_size=5, prefetch=3)
+        pages = reader.pages()
+        page = await anext(pages)
+        await anext(pages)
+        await pages.aclose()
+        return page, [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    page, pending = asyncio.run(first_page())
+    assert page.start == 0 and pending == []
+
+def test_loan_limit_is_capped(pipeline, monkeypatch):
+    monkeypatch.setenv("ENCOMPASS_PIPELINE_MAX_LOANS", "12")
+    assert len(asyncio.run(read_pipeline_loans({"filter": {}}, 1000))) == 12
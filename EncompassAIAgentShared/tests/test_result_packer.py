@@ -0,0 +1,40 @@
+from encompass_embeddings import estimate_tokens
+from encompass_result_packer import pack_chunks, split_units
+
+def doc(content, title="Page"):
+    return {"title": title, "url": "u", "content": content}
+
+def test_units_keep_headings_code_and_tables_whole():
+    units = split_units("## Request\n\nSend the filter.\n\n```json\n{\n\n}\n```\n\n| a | b |\n| - | - |")
+
+    assert units == ["## Request\n\nSend the filter.", "```json\n{\n\n}\n```", "| a | b |\n| - | - |"]
+
+def test_chunks_that_fit_are_returned_unchanged():
+    matches = [doc("Short answer about cursors.")]
+    assert pack_chunks(["cursor"], matches, token_budget=500) is matches
+
+def test_relevant_units_are_kept_within_budget():
+    filler = " ".join(f"Unrelated sentence {i} about escrow." for i in range(40))
+    content = f"{filler}\n\nThe cursor endpoint pages through large pipelines.\n\n{filler}"
+    packed = pack_chunks(["pipeline cursor"], [doc(content)], token_budget=60)
+
+    assert len(packed) == 1
+    assert "cursor endpoint" in packed[0]["content"]
+    assert estimate_tokens(packed[0]["content"]) <= 60
+
+def test_repeated_units_are_dropped():
+    shared = "Every request needs a bearer token from the authentication endpoint."
+    matches = [doc(f"{shared}\n\n" + "Pipeline paging details. " * 20), doc(f"{shared}\n\n" + "Escrow notes. " * 20)]
+    packed = pack_chunks(["bearer token"], matches, token_budget=80)
+
+    assert sum(chunk["content"].count("bearer token") for chunk in packed) == 1
+
+def test_top_unit_is_truncated_when_every_unit_is_over_budget():
+    big = "The pipeline cursor " + "keeps paging through loans " * 200
+    other = "Escrow " * 400
+    packed = pack_chunks(["pipeline cursor"], [doc(other), doc(big)], token_budget=50)
+
+    assert len(packed) == 1
+    assert packed[0]["content"].startswith("The pipeline cursor")
+    assert packed[0]["content"].endswith("[...]")
+    assert estimate_tokens(packed[0]["content"]) <= 50
@@ -0,0 +1,107 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import encompass_token_manager
+from encompass_token_manager import TokenManager
+
+class FakeTokenEndpoint:
+    """Issues access-1, access-2, ... and counts the token requests."""
+
+    def __init__(self, expires_in=900, status=200):
+        self.expires_in = expires_in
+        self.status = status
+        self.calls = 0
+
+    async def __call__(self, method, url, data=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.status != 200:
+            return httpx.Response(self.status, text="invalid_grant")
+        return httpx.Response(200, json={"access_token": f"access-{self.calls}", "expires_in": self.expires_in})
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeTokenEndpoint()
+    monkeypatch.setattr(encompass_token_manager, "request", fake)
+    return fake
+
+def test_token_is_reused_until_it_nears_expiry(endpoint):
+    manager = TokenManager(refresh_margin=60)
+
+    async def main():
+        return [await manager.get_token() for _ in range(3)]
+
+    assert asyncio.run(main()) == ["access-1"] * 3
+    assert endpoint.calls == 1
+
+def test_concurrent_callers_share_one_request(endpoint):
+    manager = TokenManager(refresh_margin=60)
+
+    async def main():
+        return await asyncio.gather(*(manager.get_token() for _ in range(5)))
+
+    assert asyncio.run(main()) == ["access-1"] * 5
+    assert endpoint.calls == 1
+
+def test_refresh_in_margin_runs_in_background(endpoint):
+    endpoint.expires_in = 30
+    manager = TokenManager(refresh_margin=60)
+
+    async def main():
+        first = await manager.get_token()
+        # Inside the margin: the current token comes back at once, a refresh starts
+        second = await manager.get_token()
+        calls_before_refresh = endpoint.calls
+        await manager._refreshing
+        return first, second, calls_before_refresh, await manager.get_token()
+
+    assert asyncio.run(main()) == ("access-1", "access-1", 1, "access-2")
+
+def test_missing_expires_in_uses_default_ttl(endpoint):
+    endpoint.expires_in = None
+    manager = TokenManager(refresh_margin=60, default_ttl=900)
+
+    async def main():
+        await manager.get_token()
+        return manager._expires_at - time.monotonic()
+
+    assert 800 < asyncio.run(main()) <= 900
+
+def test_invalidate_only_drops_the_token_it_was_given(endpoint):
+    manager = TokenManager(refresh_margin=60)
+
+    async def main():
+        token = await manager.get_token()
+        manager.invalidate("an-older-token")
+        kept = await manager.get_token()
+        # After a 401 the caller invalidates the token it used, and the next call fetches a new one
+        manager.invalidate(token)
+        return kept, await manager.get_token()
+
+    assert asyncio.run(main()) == ("access-1", "access-2")
+    assert endpoint.calls == 2
+
+def test_failed_request_raises_to_waiters(endpoint):
+    endpoint.status = 401
+    manager = TokenManager()
+
+    with pytest.raises(RuntimeError, match="401"):
+        asyncio.run(manager.get_token())
+
+def test_failed_background_refresh_is_logged(endpoint, capsys):
+    endpoint.expires_in = 30
+    manager = TokenManager(refresh_margin=60)
+
+    async def main():
+        await manager.get_token()
+        endpoint.status = 500
+        token = await manager.get_token()
+        await asyncio.gather(manager._refreshing, return_exceptions=True)
+        await asyncio.sleep(0)  # Let the done callback run
+        return token
+
+    assert asyncio.run(main()) == "access-1"
+    assert "Error refreshing Encompass access token: Token request failed: 500" in capsys.readouterr().out
@@ -0,0 +1,155 @@
+import os
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from encompass_vector_index import LocalVectorIndex, dequantize, quantize, score_vectors
+
+def random_unit_vectors(count, dimensions=64, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def build_index(vectors, dtype):
+    index = LocalVectorIndex(mode="exact", dtype=dtype)
+    for position, vector in enumerate(vectors):
+        index._add_row({
+            "id": position,
+            "url": f"https://example.com/{position}",
+            "chunk_number": 0,
+            "content": f"chunk {position}",
+            "metadata": {"source": "test", "crawled_at": "2026-01-01T00:00:00"},
+            "embedding": vector.tolist()
+        })
+    index._rebuild()
+    return index
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-7), ("float16", 1e-3), ("int8", 1e-2)])
+def test_quantize_round_trip(dtype, tolerance):
+    vectors = random_unit_vectors(20)
+
+    stored, scales = quantize(vectors, dtype)
+
+    assert stored.dtype == np.dtype(dtype)
+    assert np.abs(dequantize(stored, scales) - vectors).max() < tolerance
+
+def test_int8_maps_largest_component_to_127():
+    stored, scales = quantize(np.array([[0.5, -0.25, 0.0]]), "int8")
+
+    assert stored.tolist() == [[127, -64, 0]]
+    assert scales[0] == pytest.approx(0.5 / 127)
+
+def test_int8_zero_vector_keeps_scale_one():
+    stored, scales = quantize(np.zeros((1, 4)), "int8")
+
+    assert stored.tolist() == [[0, 0, 0, 0]]
+    assert scales.tolist() == [1.0]
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_score_vectors_matches_float32_across_blocks(dtype):
+    vectors = random_unit_vectors(50)
+    queries = random_unit_vectors(3, seed=1)
+    stored, scales = quantize(vectors, dtype)
+
+    scores = score_vectors(stored, scales, queries, block_rows=16)
+
+    assert scores.shape == (50, 3)
+    assert np.abs(scores - vectors @ queries.T).max() < 0.02
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_search_keeps_float32_neighbours(dtype):
+    vectors = random_unit_vectors(500)
+    query = vectors[7] + 0.05 * random_unit_vectors(1, seed=2)[0]
+
+    exact = [row["id"] for row in build_index(vectors, "float32").search(query.tolist(), match_count=5)]
+    quantized = [row["id"] for row in build_index(vectors, dtype).search(query.tolist(), match_count=5)]
+
+    assert quantized[0] == exact[0] == 7
+    assert len(set(quantized) & set(exact)) >= 4
+
+def test_snapshot_is_converted_to_the_index_dtype(tmp_path):
+    vectors = random_unit_vectors(10)
+    path = str(tmp_path / "index.npz")
+    build_index(vectors, "float32").save(path)
+
+    index = LocalVectorIndex(mode="exact", dtype="int8")
+    index.load(path)
+
+    assert len(index) == 10
+    assert index._state.matrix.dtype == np.int8
+    assert index.search(vectors[3].tolist(), match_count=1)[0]["id"] == 3
+
+def test_unknown_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        LocalVectorIndex(dtype="int4")
+
+def test_snapshot_stores_rows_without_padding(tmp_path):
+    vectors = random_unit_vectors(200)
+    index = build_index(vectors, "int8")
+    index._rows[0]["content"] = "x" * 8000
+    index._rebuild()
+    path = str(tmp_path / "index.npz")
+
+    index.save(path)
+    loaded = LocalVectorIndex(mode="exact", dtype="int8")
+    loaded.load(path)
+
+    # A fixed-width string array would take 200 rows * 8000+ chars * 4 bytes
+    assert os.path.getsize(path) < 100_000
+    assert loaded._state.rows[0]["content"] == "x" * 8000
+    assert [row["id"] for row in loaded._state.rows] == list(range(200))
+
+class FakeSitePages:
+    """Just enough of the supabase-py query builder for LocalVectorIndex.refresh."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.since = []
+
+    def from_(self, table):
+        client = self
+
+        class Query:
+            def __init__(self):
+                self.since = ""
+                self.start, self.end = 0, None
+                self.not_ = self
+            def select(self, *args): return self
+            def eq(self, *args): return self
+            def is_(self, *args): return self
+            def order(self, *args): return self
+            def gt(self, column, value):
+                assert column == "updated_at"
+                client.since.append(value)
+                self.since = value
+                return self
+            def range(self, start, end):
+                self.start, self.end = start, end
+                return self
+
+            def execute(self):
+                rows = [dict(row) for row in client.rows if row["updated_at"] > self.since]
+                return SimpleNamespace(data=rows[self.start:self.end + 1])
+
+        return Query()
+
+def site_page(chunk_id, updated_at, crawled_at="2026-01-01T00:00:00+00:00"):
+    return {
+        "id": chunk_id, "url": f"https://example.com/{chunk_id}", "chunk_number": 0, "title": "", "summary": "",
+        "content": f"chunk {chunk_id}", "metadata": {"crawled_at": crawled_at}, "updated_at": updated_at,
+        "embedding": random_unit_vectors(1, seed=chunk_id)[0].tolist()
+    }
+
+def test_refresh_picks_up_rows_written_late_with_an_old_crawled_at():
+    client = FakeSitePages([site_page(1, "2026-03-01T12:00:00+00:00")])
+    index = LocalVectorIndex(mode="exact")
+    index.refresh(client)
+
+    # Built hours before the last refresh, but only stored now (e.g. parked after an embedding failure)
+    client.rows.append(site_page(2, "2026-03-01T15:00:00+00:00", crawled_at="2026-03-01T09:00:00+00:00"))
+    # Row 1 is inside the overlap, so it is fetched again too
+    assert index.refresh(client) == 2
+
+    assert len(index) == 2
+    assert client.since[-1] == "2026-03-01T11:50:00+00:00"